@@ -3,26 +3,39 @@
 Creates a connectivity matrix and provide methods to get the connectivity
 between two motes.
 
-The connectivity matrix is indexed by source id, destination id and channel offset.
-Each cell of the matrix is a dict with the fields `pdr` and `rssi`
+The connectivity matrix is made of two NumPy arrays, `pdr_matrix` and
+`rssi_matrix`, indexed by source id, destination id and channel offset.
+
+When `conn_sparse` is set, neighbor lists are filled instead of the matrix:
+`neighbors` is indexed by destination id and holds, for each source which can
+be heard (PDR above 0 on at least one channel), the list of PDR and RSSI values
+per channel offset. propagate() then only considers the transmitters which are
+in the neighbor list of a listener.
 
 The connectivity matrix can be filled statically at startup or be updated along
 time if a connectivity trace is given.
 
-The propagate() method is called at every slot. It loops through the
+The propagate() method is called at every slot where some radio is active;
+radios register the ASNs at which they will be active. It loops through the
 transmissions occurring during that slot and checks if the transmission fails or
 succeeds.
 """
 
 # =========================== imports =========================================
 
+import os
 import sys
 import random
 import math
+import heapq
 from abc import abstractmethod
 import gzip
 from datetime import datetime
 import json
+import hashlib
+import shutil
+
+import numpy
 
 import SimSettings
 import SimEngine
@@ -33,8 +46,278 @@ from Mote import MoteDefines as d
 
 CONN_TYPE_TRACE         = "trace"
 
+# RSSI and PDR relationship obtained by experiment; dataset was available at the
+# link shown below:
+# http://wsn.eecs.berkeley.edu/connectivity/?dataset=dust
+RSSI_PDR_TABLE = {
+    -97:    0.0000,  # this value is not from experiment
+    -96:    0.1494,
+    -95:    0.2340,
+    -94:    0.4071,
+    # <-- 50% PDR is here, at RSSI=-93.6
+    -93:    0.6359,
+    -92:    0.6866,
+    -91:    0.7476,
+    -90:    0.8603,
+    -89:    0.8702,
+    -88:    0.9324,
+    -87:    0.9427,
+    -86:    0.9562,
+    -85:    0.9611,
+    -84:    0.9739,
+    -83:    0.9745,
+    -82:    0.9844,
+    -81:    0.9854,
+    -80:    0.9903,
+    -79:    1.0000,  # this value is not from experiment
+}
+RSSI_PDR_MIN_RSSI = min(RSSI_PDR_TABLE.keys())
+RSSI_PDR_MAX_RSSI = max(RSSI_PDR_TABLE.keys())
+
+# (PDR, PDR increase over 1dB) for each 1dB segment of RSSI_PDR_TABLE, indexed
+# by the lower RSSI of the segment
+RSSI_PDR_SEGMENTS = dict(
+    (rssi, (RSSI_PDR_TABLE[rssi], RSSI_PDR_TABLE[rssi + 1] - RSSI_PDR_TABLE[rssi]))
+    for rssi in range(RSSI_PDR_MIN_RSSI, RSSI_PDR_MAX_RSSI)
+)
+
+# an update of the connectivity matrix read from a K7 trace
+K7_TRACE_UPDATE_DTYPE = numpy.dtype(
+    [
+        ('asn',            numpy.int64),
+        ('src',            numpy.int32),
+        ('dst',            numpy.int32),
+        ('channel',        numpy.int32),
+        ('pdr',            numpy.float64),
+        ('rssi',           numpy.float64),
+        ('transaction_id', numpy.int32),
+    ]
+)
+
+# version of the binary format of compiled K7 traces: a directory holding one
+# .npy file per field of K7_TRACE_UPDATE_DTYPE
+K7_CACHE_FORMAT_VERSION = 2
+
+# the same few values (noise floor, RSSI of links) are converted over and over
+DBM_TO_MW_CACHE_MAX_SIZE = 4096
+
 # =========================== helpers =========================================
 
+_dBm_to_mW_cache = {}
+
+def dBm_to_mW(dBm):
+    mW = _dBm_to_mW_cache.get(dBm)
+    if mW is None:
+        if len(_dBm_to_mW_cache) >= DBM_TO_MW_CACHE_MAX_SIZE:
+            _dBm_to_mW_cache.clear()
+        mW = math.pow(10.0, dBm / 10.0)
+        _dBm_to_mW_cache[dBm] = mW
+    return mW
+
+def mW_to_dBm(mW):
+    return 10 * math.log10(mW)
+
+def rssi_to_pdr(rssi):
+    """ Convert RSSI to PDR, interpolating linearly within RSSI_PDR_TABLE. """
+
+    floor_rssi = int(math.floor(rssi))
+    if   floor_rssi < RSSI_PDR_MIN_RSSI:
+        pdr = 0.0
+    elif floor_rssi >= RSSI_PDR_MAX_RSSI:
+        pdr = 1.0
+    else:
+        (pdr_low, pdr_step) = RSSI_PDR_SEGMENTS[floor_rssi]
+        # linear interpolation
+        pdr = pdr_step * (rssi - float(floor_rssi)) + pdr_low
+
+    assert 0 <= pdr <= 1.0
+
+    return pdr
+
+def load_k7_trace(trace_path, slot_duration, num_chans):
+    """ Read a K7 trace and return its updates as an array """
+
+    updates    = []
+    asn_cache  = {} # ASN, indexed by the datetime string of a row
+    first_date = None
+    with gzip.open(trace_path, 'r') as trace:
+        trace_header = json.loads(trace.readline())
+        csv_header   = trace.readline().strip().split(',')
+        first_channel = trace_header['channels'][0]
+
+        for line in trace:
+            # parse line
+            row = dict(zip(csv_header, line.strip().split(',')))
+
+            # convert row datetime to ASN; rows come by bunches having the
+            # same datetime
+            asn = asn_cache.get(row['datetime'])
+            if asn is None:
+                date = datetime.strptime(row['datetime'], "%Y-%m-%d %H:%M:%S")
+                if first_date is None:
+                    first_date = date
+                time_delta = date - first_date
+                asn = int(time_delta.total_seconds() / float(slot_duration))
+                asn_cache[row['datetime']] = asn
+
+            # rssi
+            if row['mean_rssi'] == '':
+                rssi = -1000
+            else:
+                rssi = float(row['mean_rssi'])
+
+            # one update per channel
+            for channel in row['channels'].strip("[]").split(';'):
+                channel_offset = int(channel) - first_channel
+                if channel_offset >= num_chans:
+                    # the trace has a channel which is not simulated
+                    continue
+                updates.append(
+                    (
+                        asn,
+                        int(row['src']),
+                        int(row['dst']),
+                        channel_offset,
+                        float(row['pdr']),
+                        rssi,
+                        int(row['transaction_id']),
+                    )
+                )
+
+    updates = numpy.array(updates, dtype=K7_TRACE_UPDATE_DTYPE)
+
+    # the replay relies on the trace being sorted by time and transaction
+    assert numpy.all(numpy.diff(updates['asn']) >= 0)
+    assert numpy.all(numpy.diff(updates['transaction_id']) >= 0)
+
+    return updates
+
+def get_k7_trace_fields(updates):
+    """ Return the updates of a K7 trace as a contiguous array per field """
+    return dict(
+        [
+            (name, numpy.ascontiguousarray(updates[name]))
+            for name in K7_TRACE_UPDATE_DTYPE.names
+        ]
+    )
+
+def get_k7_cache_paths(trace_path, slot_duration, num_chans, cache_dir=None):
+    """ Return the paths of the compiled trace and of its sidecar, and the
+    content the sidecar has to have for the compiled trace to be used.
+
+    The compiled trace is next to the trace, or in cache_dir if given.
+    """
+
+    trace_hash = hashlib.sha1()
+    with open(trace_path, 'rb') as trace:
+        for chunk in iter(lambda: trace.read(1024 * 1024), b''):
+            trace_hash.update(chunk)
+
+    sidecar = {
+        'format':            K7_CACHE_FORMAT_VERSION,
+        'trace_sha1':        trace_hash.hexdigest(),
+        'tsch_slotDuration': slot_duration,
+        'phy_numChans':      num_chans,
+    }
+
+    # one compiled trace per trace content and settings
+    key  = hashlib.sha1(json.dumps(sidecar, sort_keys=True)).hexdigest()[:16]
+    if cache_dir is None:
+        base = '{0}.{1}'.format(trace_path, key)
+    else:
+        base = os.path.join(
+            cache_dir,
+            '{0}.{1}'.format(os.path.basename(trace_path), key)
+        )
+
+    return ('{0}.k7'.format(base), '{0}.json'.format(base), sidecar)
+
+def compile_k7_trace(trace_path, slot_duration, num_chans, cache_dir=None):
+    """ Write the updates of a K7 trace to binary files, one per field, in a
+    directory next to the trace, or in cache_dir if given.
+
+    The sidecar is written last; a compiled trace without its sidecar is not
+    used.
+    """
+
+    (cache_path, sidecar_path, sidecar) = get_k7_cache_paths(
+        trace_path,
+        slot_duration,
+        num_chans,
+        cache_dir
+    )
+    updates = load_k7_trace(trace_path, slot_duration, num_chans)
+
+    if (cache_dir is not None) and (not os.path.isdir(cache_dir)):
+        try:
+            os.makedirs(cache_dir)
+        except OSError:
+            # created by another simulation in the meantime
+            if not os.path.isdir(cache_dir):
+                raise
+
+    # other simulations may be compiling the same trace; write to a temporary
+    # directory, then rename it
+    tmp_path = '{0}.{1}.tmp'.format(cache_path, os.getpid())
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    for (name, values) in get_k7_trace_fields(updates).items():
+        numpy.save(os.path.join(tmp_path, '{0}.npy'.format(name)), values)
+    shutil.rmtree(cache_path, ignore_errors=True)
+    try:
+        os.rename(tmp_path, cache_path)
+    except OSError:
+        # written by another simulation in the meantime
+        shutil.rmtree(tmp_path)
+        if not os.path.isdir(cache_path):
+            raise
+    _write_file_atomically(sidecar_path, lambda f: json.dump(sidecar, f))
+
+    return cache_path
+
+def load_compiled_k7_trace(trace_path, slot_duration, num_chans, cache_dir=None):
+    """ Memory-map the fields of the compiled K7 trace, compiling it if
+    needed
+    """
+
+    (cache_path, sidecar_path, sidecar) = get_k7_cache_paths(
+        trace_path,
+        slot_duration,
+        num_chans,
+        cache_dir
+    )
+
+    compiled_sidecar = None
+    if os.path.exists(sidecar_path) and os.path.isdir(cache_path):
+        with open(sidecar_path, 'r') as f:
+            compiled_sidecar = json.load(f)
+
+    if compiled_sidecar != sidecar:
+        compile_k7_trace(trace_path, slot_duration, num_chans, cache_dir)
+
+    return dict(
+        [
+            (
+                name,
+                numpy.load(os.path.join(cache_path, '{0}.npy'.format(name)), mmap_mode='r')
+            )
+            for name in K7_TRACE_UPDATE_DTYPE.names
+        ]
+    )
+
+def _write_file_atomically(file_path, write):
+    tmp_path = '{0}.{1}.tmp'.format(file_path, os.getpid())
+    with open(tmp_path, 'wb') as f:
+        write(f)
+    try:
+        os.rename(tmp_path, file_path)
+    except OSError:
+        # Windows does not replace an existing file; it has been written by
+        # another simulation
+        os.remove(tmp_path)
+        if not os.path.exists(file_path):
+            raise
+
 # =========================== classes =========================================
 
 class Connectivity(object):
@@ -70,27 +353,39 @@ class ConnectivityBase(object):
         self.settings = SimSettings.SimSettings()
         self.engine   = SimEngine.SimEngine()
         self.log      = SimEngine.SimLog.SimLog().log
+        self.log_enabled = SimEngine.SimLog.SimLog().is_enabled
 
         # local variables
-        self.connectivity_matrix = {} # described at the top of the file
+        self.pdr_matrix          = None # described at the top of the file
+        self.rssi_matrix         = None # described at the top of the file
+        self.neighbors           = None # described at the top of the file
         self.connectivity_matrix_timestamp = 0
-
-        # at the beginning, connectivity matrix indicates no connectivity at all
-        for source in self.engine.motes:
-            self.connectivity_matrix[source.id] = {}
-            for destination in self.engine.motes:
-                self.connectivity_matrix[source.id][destination.id] = {}
-                for channel in range(self.settings.phy_numChans):
-                    self.connectivity_matrix[source.id][destination.id][channel] = {
-                        "pdr":      0,
-                        "rssi": -1000,
-                    }
+        self.active_asns         = [] # heap of ASNs at which radios are active
+        self.active_asn_set      = set()
+        self.transmitters        = {} # ids of motes transmitting, indexed by channel
+        self.listeners           = {} # ids of motes listening, indexed by channel
+
+        # at the beginning, connectivity matrix indicates no connectivity at
+        # all; with conn_sparse, the (mostly empty) matrix is never allocated
+        if self.settings.conn_sparse:
+            self.neighbors   = dict([(mote.id, {}) for mote in self.engine.motes])
+        else:
+            shape = (
+                len(self.engine.motes),
+                len(self.engine.motes),
+                self.settings.phy_numChans
+            )
+            self.pdr_matrix  = numpy.zeros(shape)
+            self.rssi_matrix = numpy.full(shape, -1000.0)
 
         # introduce some connectivity in the matrix
         self._init_connectivity_matrix()
 
-        # schedule propagation task
-        self._schedule_propagate()
+        # only the motes which can be heard are kept in the neighbor lists
+        if self.settings.conn_sparse:
+            self._prune_neighbor_lists()
+
+        # propagation tasks are scheduled as radios register active ASNs
 
     def destroy(self):
         cls           = type(self)
@@ -113,7 +408,12 @@ class ConnectivityBase(object):
         assert isinstance(dst_id, int)
         assert isinstance(channel, int)
 
-        return self.connectivity_matrix[src_id][dst_id][channel]["pdr"]
+        if self.neighbors is None:
+            return self.pdr_matrix.item(src_id, dst_id, channel)
+        elif src_id in self.neighbors[dst_id]:
+            return self.neighbors[dst_id][src_id]['pdr'][channel]
+        else:
+            return 0.0
 
     def get_rssi(self, src_id, dst_id, channel):
 
@@ -121,12 +421,43 @@ class ConnectivityBase(object):
         assert isinstance(dst_id, int)
         assert isinstance(channel, int)
 
-        if "rssi" not in self.connectivity_matrix[src_id][dst_id][channel]:
-            pass
-        return self.connectivity_matrix[src_id][dst_id][channel]["rssi"]
+        if self.neighbors is None:
+            return self.rssi_matrix.item(src_id, dst_id, channel)
+        elif src_id in self.neighbors[dst_id]:
+            return self.neighbors[dst_id][src_id]['rssi'][channel]
+        else:
+            return -1000.0
+
+    # === active radios
+
+    def add_transmitter(self, mote_id, channel):
+        self._add_active_radio(self.transmitters, mote_id, channel)
+
+    def remove_transmitter(self, mote_id, channel):
+        self._remove_active_radio(self.transmitters, mote_id, channel)
+
+    def add_listener(self, mote_id, channel):
+        self._add_active_radio(self.listeners, mote_id, channel)
+
+    def remove_listener(self, mote_id, channel):
+        self._remove_active_radio(self.listeners, mote_id, channel)
 
     # === propagation
 
+    def register_active_asn(self, asn):
+        """ Indicate some radio may be active at asn; propagate() will run then. """
+
+        assert asn > self.engine.getAsn()
+
+        if asn in self.active_asn_set:
+            return
+        self.active_asn_set.add(asn)
+        heapq.heappush(self.active_asns, asn)
+
+        # reschedule the propagation task, in case it is now earlier
+        if self.active_asns[0] == asn:
+            self._schedule_propagate()
+
     def propagate(self):
         """ Simulate the propagation of frames in a slot. """
 
@@ -134,56 +465,55 @@ class ConnectivityBase(object):
         asn        = self.engine.getAsn()
         slotOffset = asn % self.settings.tsch_slotframeLength
 
-        # repeat propagation for each channel
-        for channel in range(self.settings.phy_numChans):
+        # repeat propagation for each channel in use
+        active_channels = set(self.transmitters.keys()) | set(self.listeners.keys())
+        for channel in sorted(active_channels):
 
             # === accounting
 
             # list all transmissions at that frequency
             alltransmissions = []
-            for mote in self.engine.motes:
-                if mote.radio.onGoingTransmission:
-                    assert mote.radio.state == d.RADIO_STATE_TX
-                    if mote.radio.onGoingTransmission['channel'] == channel:
-                        thisTran = {}
-
-                        # channel
-                        thisTran['channel']    = channel
+            for tx_mote_id in self._get_transmitter_id_list(channel):
+                radio = self.engine.motes[tx_mote_id].radio
+                assert radio.state == d.RADIO_STATE_TX
+                assert radio.onGoingTransmission['channel'] == channel
 
-                        # packet
-                        thisTran['tx_mote_id'] = mote.id
-                        thisTran['packet']     = mote.radio.onGoingTransmission['packet']
+                thisTran = {}
 
-                        # time at which the packet starts transmitting
-                        thisTran['txTime']     = mote.tsch.clock.get_drift()
+                # channel
+                thisTran['channel']    = channel
 
-                        # number of ACKs received by this packet
-                        thisTran['numACKs']    = 0
+                # packet
+                thisTran['tx_mote_id'] = tx_mote_id
+                thisTran['packet']     = radio.onGoingTransmission['packet']
 
-                        alltransmissions      += [thisTran]
+                # time at which the packet starts transmitting
+                thisTran['txTime']     = radio.mote.tsch.clock.get_drift()
 
-            # === decide which listener gets which packet (rxDone)
+                # number of ACKs received by this packet
+                thisTran['numACKs']    = 0
 
-            for listener_id in self._get_listener_id_list(channel):
+                alltransmissions      += [thisTran]
 
-                # random_value will be used for comparison against PDR
-                random_value = random.random()
-
-                # list the transmissions that listener can hear
-                transmissions = []
-                for t in alltransmissions:
-                    pdr = self.get_pdr(
-                        src_id  = t['tx_mote_id'],
-                        dst_id  = listener_id,
-                        channel = channel,
-                    )
-
-                    # you can interpret the following line as decision for
-                    # reception of the preamble of 't'
-                    if random_value < pdr:
-                        transmissions += [t]
+            # === decide which listener gets which packet (rxDone)
 
-                if transmissions == []:
+            if   self.settings.conn_propagation == 'scalar':
+                receptions = self._get_receptions(channel, alltransmissions)
+            elif self.settings.conn_propagation == 'vectorized':
+                receptions = self._get_receptions_vectorized(channel, alltransmissions)
+            else:
+                raise NotImplementedError()
+
+            # the decision for a listener is made only after the previous
+            # listener got its rxDone, so random numbers are drawn in the same
+            # order with both paths
+            for reception in receptions:
+                listener_id               = reception['listener_id']
+                random_value              = reception['random_value']
+                lockon_transmission       = reception['lockon_transmission']
+                interfering_transmissions = reception['interfering_transmissions']
+
+                if lockon_transmission is None:
                     # no transmissions
 
                     # idle listen
@@ -194,18 +524,8 @@ class ConnectivityBase(object):
                 else:
                     # there are transmissions
 
-                    # listener locks onto the earliest transmission
-                    lockon_transmission = None
-                    for t in transmissions:
-                        if lockon_transmission is None or t['txTime']<lockon_transmission['txTime']:
-                            lockon_transmission = t
-
-                    # all other transmissions are now intereferers
-                    interfering_transmissions = [t for t in transmissions if t!=lockon_transmission]
-                    assert len(transmissions) == len(interfering_transmissions)+1
-
                     # log
-                    if interfering_transmissions:
+                    if interfering_transmissions and self.log_enabled(SimEngine.SimLog.LOG_PROP_INTERFERENCE):
                         self.log(
                             SimEngine.SimLog.LOG_PROP_INTERFERENCE,
                             {
@@ -216,15 +536,8 @@ class ConnectivityBase(object):
                             }
                         )
 
-                    # calculate the resulting pdr when taking interferers into account
-                    pdr = self._compute_pdr_with_interference(
-                        listener_id               = listener_id,
-                        lockon_transmission       = lockon_transmission,
-                        interfering_transmissions = interfering_transmissions,
-                    )
-
                     # decide whether listener receives lockon_transmission or not
-                    if random_value < pdr:
+                    if random_value < reception['pdr']:
                         # listener receives!
 
                         # lockon_transmission received correctly
@@ -241,14 +554,15 @@ class ConnectivityBase(object):
                         sentAnAck = self.engine.motes[listener_id].radio.rxDone(
                             packet = None,
                         )
-                        self.log(
-                            SimEngine.SimLog.LOG_PROP_DROP_LOCKON,
-                            {
-                                '_mote_id':                    listener_id,
-                                'channel':                     lockon_transmission['channel'],
-                                'lockon_transmission':         lockon_transmission['packet']
-                            }
-                        )
+                        if self.log_enabled(SimEngine.SimLog.LOG_PROP_DROP_LOCKON):
+                            self.log(
+                                SimEngine.SimLog.LOG_PROP_DROP_LOCKON,
+                                {
+                                    '_mote_id':                    listener_id,
+                                    'channel':                     lockon_transmission['channel'],
+                                    'lockon_transmission':         lockon_transmission['packet']
+                                }
+                            )
                         assert sentAnAck == False
 
             # verify no more listener on this channel
@@ -271,13 +585,12 @@ class ConnectivityBase(object):
                 self.engine.motes[t['tx_mote_id']].radio.txDone(isACKed)
 
             # verify no more radios active on this channel
-            for mote in self.engine.motes:
-                assert mote.radio.channel != channel
+            assert channel not in self.transmitters
+            assert channel not in self.listeners
 
         # verify all radios off
-        for mote in self.engine.motes:
-            assert mote.radio.state == d.RADIO_STATE_OFF
-            assert mote.radio.channel == None
+        assert not self.transmitters
+        assert not self.listeners
 
         # schedule next propagation
         self._schedule_propagate()
@@ -288,27 +601,262 @@ class ConnectivityBase(object):
 
     def _schedule_propagate(self):
         '''
-        schedule a propagation task in the middle of the next slot.
-        FIXME: only schedule for next active slot.
+        schedule a propagation task in the middle of the next active slot.
         '''
-        self.engine.scheduleAtAsn(
-            asn              = self.engine.getAsn() + 1,
-            cb               = self.propagate,
-            uniqueTag        = (None, 'Connectivity.propagate'),
-            intraSlotOrder   = d.INTRASLOTORDER_PROPAGATE,
-        )
 
-    # === listeners
+        # forget the active ASNs which are not in the future
+        while self.active_asns and (self.active_asns[0] <= self.engine.getAsn()):
+            self.active_asn_set.remove(heapq.heappop(self.active_asns))
+
+        if self.active_asns:
+            self.engine.scheduleAtAsn(
+                asn              = self.active_asns[0],
+                cb               = self.propagate,
+                uniqueTag        = (None, 'Connectivity.propagate'),
+                intraSlotOrder   = d.INTRASLOTORDER_PROPAGATE,
+            )
+
+    # === transmitters and listeners
+
+    def _get_transmitter_id_list(self, channel):
+        # sorted so that transmissions are processed in the order of mote ids
+        return sorted(self.transmitters.get(channel, []))
 
     def _get_listener_id_list(self, channel):
-        returnVal = []
-        for mote in self.engine.motes:
-            if (mote.radio.state == d.RADIO_STATE_RX) and (mote.radio.channel == channel):
-                returnVal.append(mote.id)
-        return returnVal
+        # sorted so that listeners are processed in the order of mote ids
+        return sorted(self.listeners.get(channel, []))
+
+    def _add_active_radio(self, radios, mote_id, channel):
+        if channel not in radios:
+            radios[channel] = set()
+        assert mote_id not in radios[channel]
+        radios[channel].add(mote_id)
+
+    def _remove_active_radio(self, radios, mote_id, channel):
+        radios[channel].remove(mote_id)
+        if not radios[channel]:
+            del radios[channel]
+
+    # === connectivity matrix
+
+    def _prune_neighbor_lists(self):
+        for per_src_links in self.neighbors.values():
+            for (src_id, link) in per_src_links.items():
+                if not any(link['pdr']):
+                    del per_src_links[src_id]
+
+    def _set_link(self, src_id, dst_id, channel, pdr, rssi):
+        self._set_link_pdr(src_id, dst_id, channel, pdr)
+        self._set_link_rssi(src_id, dst_id, channel, rssi)
+
+    def _set_link_pdr(self, src_id, dst_id, channel, pdr):
+        if self.neighbors is None:
+            self.pdr_matrix[src_id, dst_id, channel] = pdr
+        else:
+            link = self.neighbors[dst_id].get(src_id)
+            if link is None:
+                if pdr == 0:
+                    # a mote which cannot be heard is not a neighbor
+                    return
+                link = {
+                    'pdr':  [0.0] * self.settings.phy_numChans,
+                    'rssi': [-1000.0] * self.settings.phy_numChans,
+                }
+                self.neighbors[dst_id][src_id] = link
+            link['pdr'][channel] = float(pdr)
+
+    def _set_link_rssi(self, src_id, dst_id, channel, rssi):
+        # with conn_sparse, the RSSI is kept for the neighbors only, the PDR
+        # of a link is to be set first
+        if self.neighbors is None:
+            self.rssi_matrix[src_id, dst_id, channel] = rssi
+        elif src_id in self.neighbors[dst_id]:
+            self.neighbors[dst_id][src_id]['rssi'][channel] = float(rssi)
+
+    def _get_link_matrices(self, src_id_list, dst_id_list, channel):
+        """ Return PDR and RSSI arrays indexed by [source, destination]. """
+        if self.neighbors is None:
+            index = numpy.ix_(src_id_list, dst_id_list, [channel])
+            return (
+                self.pdr_matrix[index][:, :, 0],
+                self.rssi_matrix[index][:, :, 0],
+            )
+        else:
+            shape       = (len(src_id_list), len(dst_id_list))
+            pdr_matrix  = numpy.zeros(shape)
+            rssi_matrix = numpy.full(shape, -1000.0)
+            for (j, dst_id) in enumerate(dst_id_list):
+                for (i, src_id) in enumerate(src_id_list):
+                    if src_id in self.neighbors[dst_id]:
+                        pdr_matrix[i, j]  = self.neighbors[dst_id][src_id]['pdr'][channel]
+                        rssi_matrix[i, j] = self.neighbors[dst_id][src_id]['rssi'][channel]
+            return (pdr_matrix, rssi_matrix)
+
+    def _get_audible_transmissions(self, listener_id, transmissions):
+        if self.neighbors is None:
+            return transmissions
+        else:
+            # skip the transmitters the listener cannot hear at all
+            neighbors = self.neighbors[listener_id]
+            return [t for t in transmissions if t['tx_mote_id'] in neighbors]
 
     # === wireless
 
+    def _get_receptions(self, channel, alltransmissions):
+        """ Decide, one listener at a time, which transmission it receives.
+
+        Yields a dict per listener with the random value drawn for that
+        listener, the transmission it locks onto (None if it hears none), the
+        interfering transmissions and the PDR of the lock-on transmission.
+        """
+
+        for listener_id in self._get_listener_id_list(channel):
+
+            # random_value will be used for comparison against PDR
+            random_value = random.random()
+
+            # list the transmissions that listener can hear
+            transmissions = []
+            for t in self._get_audible_transmissions(listener_id, alltransmissions):
+                pdr = self.get_pdr(
+                    src_id  = t['tx_mote_id'],
+                    dst_id  = listener_id,
+                    channel = channel,
+                )
+
+                # you can interpret the following line as decision for
+                # reception of the preamble of 't'
+                if random_value < pdr:
+                    transmissions += [t]
+
+            if transmissions == []:
+                yield {
+                    'listener_id':               listener_id,
+                    'random_value':              random_value,
+                    'lockon_transmission':       None,
+                    'interfering_transmissions': [],
+                    'pdr':                       None,
+                }
+                continue
+
+            # listener locks onto the earliest transmission
+            lockon_transmission = None
+            for t in transmissions:
+                if lockon_transmission is None or t['txTime']<lockon_transmission['txTime']:
+                    lockon_transmission = t
+
+            # all other transmissions are now intereferers
+            interfering_transmissions = [t for t in transmissions if t!=lockon_transmission]
+            assert len(transmissions) == len(interfering_transmissions)+1
+
+            # calculate the resulting pdr when taking interferers into account
+            pdr = self._compute_pdr_with_interference(
+                listener_id               = listener_id,
+                lockon_transmission       = lockon_transmission,
+                interfering_transmissions = interfering_transmissions,
+            )
+
+            yield {
+                'listener_id':               listener_id,
+                'random_value':              random_value,
+                'lockon_transmission':       lockon_transmission,
+                'interfering_transmissions': interfering_transmissions,
+                'pdr':                       pdr,
+            }
+
+    def _get_receptions_vectorized(self, channel, alltransmissions):
+        """ Same as _get_receptions(), using NumPy arrays.
+
+        PDR, RSSI and their conversion to mW are computed for all the
+        (transmitter, listener) pairs of the channel in one pass. Each
+        listener then only compares its random value against a column of
+        those arrays. The floating point operations are the same as in
+        _compute_pdr_with_interference(), and sums are done in the same
+        order, so the results are identical.
+        """
+
+        listener_id_list = self._get_listener_id_list(channel)
+        if not alltransmissions:
+            # nothing to receive; listeners only need their random value
+            for listener_id in listener_id_list:
+                yield {
+                    'listener_id':               listener_id,
+                    'random_value':              random.random(),
+                    'lockon_transmission':       None,
+                    'interfering_transmissions': [],
+                    'pdr':                       None,
+                }
+            return
+
+        # arrays indexed by [transmission, listener]
+        (pdr_matrix, rssi_matrix) = self._get_link_matrices(
+            src_id_list = [t['tx_mote_id'] for t in alltransmissions],
+            dst_id_list = listener_id_list,
+            channel     = channel,
+        )
+        noise_dBm = numpy.array(
+            [self.engine.motes[listener_id].radio.noisepower for listener_id in listener_id_list],
+            dtype = float,
+        )
+        noise_mW        = numpy.power(10.0, noise_dBm / 10.0)
+        signal_mW       = numpy.power(10.0, rssi_matrix / 10.0) - noise_mW
+        interference_mW = numpy.where(signal_mW < 0.0, 0.0, signal_mW)
+        tx_times        = numpy.array([t['txTime'] for t in alltransmissions], dtype=float)
+
+        for (i, listener_id) in enumerate(listener_id_list):
+
+            # random_value will be used for comparison against PDR
+            random_value = random.random()
+
+            # indices of the transmissions that listener can hear
+            heard = numpy.flatnonzero(random_value < pdr_matrix[:, i])
+
+            if len(heard) == 0:
+                yield {
+                    'listener_id':               listener_id,
+                    'random_value':              random_value,
+                    'lockon_transmission':       None,
+                    'interfering_transmissions': [],
+                    'pdr':                       None,
+                }
+                continue
+
+            # listener locks onto the earliest transmission; argmin() returns
+            # the first one on a tie, as the scalar path does
+            lockon      = heard[numpy.argmin(tx_times[heard])]
+            interferers = heard[heard != lockon]
+
+            # SINR
+            if signal_mW[lockon, i] < 0.0:
+                # RSSI has not to be below the noise level.
+                pdr = -10.0
+            else:
+                if len(interferers):
+                    # cumsum() adds up in order, unlike sum()
+                    totalInterference_mW = numpy.cumsum(interference_mW[interferers, i])[-1]
+                else:
+                    totalInterference_mW = 0.0
+                sinr_dB = mW_to_dBm(
+                    signal_mW.item(lockon, i) / (totalInterference_mW + noise_mW.item(i))
+                )
+
+                # PDR of the interfering transmissions
+                interference_rssi = mW_to_dBm(
+                    dBm_to_mW(sinr_dB + noise_dBm.item(i)) +
+                    dBm_to_mW(noise_dBm.item(i))
+                )
+                interference_pdr = rssi_to_pdr(interference_rssi)
+
+                pdr = pdr_matrix.item(lockon, i) * interference_pdr
+
+            yield {
+                'listener_id':               listener_id,
+                'random_value':              random_value,
+                'lockon_transmission':       alltransmissions[lockon],
+                'interfering_transmissions': [alltransmissions[j] for j in interferers],
+                'pdr':                       pdr,
+            }
+
     def _compute_pdr_with_interference(self, listener_id, lockon_transmission, interfering_transmissions):
 
         # shorthand
@@ -319,11 +867,11 @@ class ConnectivityBase(object):
 
         # === compute the SINR
 
-        noise_mW   = self._dBm_to_mW(self.engine.motes[listener_id].radio.noisepower)
+        noise_mW   = dBm_to_mW(self.engine.motes[listener_id].radio.noisepower)
 
         # S = RSSI - N
 
-        signal_mW = self._dBm_to_mW(self.get_rssi(lockon_tx_mote_id, listener_id, channel)) - noise_mW
+        signal_mW = dBm_to_mW(self.get_rssi(lockon_tx_mote_id, listener_id, channel)) - noise_mW
         if signal_mW < 0.0:
             # RSSI has not to be below the noise level.
             # If this happens, return very low SINR (-10.0dB)
@@ -334,14 +882,14 @@ class ConnectivityBase(object):
         totalInterference_mW = 0.0
         for interfering_tran in interfering_transmissions:
             interfering_tx_mote_id = interfering_tran['tx_mote_id']
-            interference_mW = self._dBm_to_mW(self.get_rssi(interfering_tx_mote_id, listener_id, channel)) - noise_mW
+            interference_mW = dBm_to_mW(self.get_rssi(interfering_tx_mote_id, listener_id, channel)) - noise_mW
             if interference_mW < 0.0:
                 # RSSI has not to be below noise level.
                 # If this happens, set interference to 0.0
                 interference_mW = 0.0
             totalInterference_mW += interference_mW
 
-        sinr_dB = self._mW_to_dBm( signal_mW / (totalInterference_mW + noise_mW) )
+        sinr_dB = mW_to_dBm( signal_mW / (totalInterference_mW + noise_mW) )
 
         # === compute the interference PDR
 
@@ -349,13 +897,13 @@ class ConnectivityBase(object):
         noise_dBm = self.engine.motes[listener_id].radio.noisepower
 
         # RSSI of the interfering transmissions
-        interference_rssi = self._mW_to_dBm(
-            self._dBm_to_mW(sinr_dB + noise_dBm) +
-            self._dBm_to_mW(noise_dBm)
+        interference_rssi = mW_to_dBm(
+            dBm_to_mW(sinr_dB + noise_dBm) +
+            dBm_to_mW(noise_dBm)
         )
 
         # PDR of the interfering transmissions
-        interference_pdr = self._rssi_to_pdr(interference_rssi)
+        interference_pdr = rssi_to_pdr(interference_rssi)
 
         # === compute the resulting PDR
 
@@ -367,74 +915,20 @@ class ConnectivityBase(object):
 
         return returnVal
 
-    # === helpers
-
-    def _dBm_to_mW(self,dBm):
-        return math.pow(10.0, dBm / 10.0)
-
-    def _mW_to_dBm(self,mW):
-        return 10 * math.log10(mW)
-
-    def _rssi_to_pdr(self,rssi):
-        """
-        rssi and pdr relationship obtained by experiment below
-        http://wsn.eecs.berkeley.edu/connectivity/?dataset=dust
-        """
-
-        rssi_pdr_table = {
-            -97:    0.0000,  # this value is not from experiment
-            -96:    0.1494,
-            -95:    0.2340,
-            -94:    0.4071,
-            # <-- 50% PDR is here, at RSSI=-93.6
-            -93:    0.6359,
-            -92:    0.6866,
-            -91:    0.7476,
-            -90:    0.8603,
-            -89:    0.8702,
-            -88:    0.9324,
-            -87:    0.9427,
-            -86:    0.9562,
-            -85:    0.9611,
-            -84:    0.9739,
-            -83:    0.9745,
-            -82:    0.9844,
-            -81:    0.9854,
-            -80:    0.9903,
-            -79:    1.0000,  # this value is not from experiment
-        }
-
-        minRssi = min(rssi_pdr_table.keys())
-        maxRssi = max(rssi_pdr_table.keys())
-
-        floorRssi = int(math.floor(rssi))
-        if  floorRssi < minRssi:
-            pdr = 0.0
-        elif floorRssi >= maxRssi:
-            pdr = 1.0
-        else:
-            pdrLow  = rssi_pdr_table[floorRssi]
-            pdrHigh = rssi_pdr_table[floorRssi+1]
-            # linear interpolation
-            pdr = (pdrHigh - pdrLow) * (rssi - float(floorRssi)) + pdrLow
-
-        assert 0 <= pdr <= 1.0
-
-        return pdr
-
 class ConnectivityFullyMeshed(ConnectivityBase):
     """
     All nodes can hear all nodes with PDR=100%.
     """
 
     def _init_connectivity_matrix(self):
-        for source in self.engine.motes:
-            for destination in self.engine.motes:
-                for channel in range(self.settings.phy_numChans):
-                    self.connectivity_matrix[source.id][destination.id][channel] = {
-                        "pdr": 1.00,
-                        "rssi": -10,
-                    }
+        if self.neighbors is None:
+            self.pdr_matrix[:]  = 1.00
+            self.rssi_matrix[:] =  -10
+        else:
+            for src in self.engine.motes:
+                for dst in self.engine.motes:
+                    for channel in range(self.settings.phy_numChans):
+                        self._set_link(src.id, dst.id, channel, pdr=1.00, rssi=-10)
 
 class ConnectivityLinear(ConnectivityBase):
     """
@@ -448,19 +942,19 @@ class ConnectivityLinear(ConnectivityBase):
         for mote in self.engine.motes:
             if parent is not None:
                 for channel in range(self.settings.phy_numChans):
-                    self.connectivity_matrix[mote.id][parent.id][channel] = {
-                        "pdr": 1.00,
-                        "rssi": -10,
-                    }
-                    self.connectivity_matrix[parent.id][mote.id][channel] = {
-                        "pdr": 1.00,
-                        "rssi": -10,
-                    }
+                    self._set_link(mote.id, parent.id, channel, pdr=1.00, rssi=-10)
+                    self._set_link(parent.id, mote.id, channel, pdr=1.00, rssi=-10)
             parent = mote
 
 class ConnectivityK7(ConnectivityBase):
     """
     Replay K7 connectivity trace.
+
+    The trace is read once, into `trace_updates`: an array per field of the
+    (asn, src, dst, channel, pdr, rssi, transaction_id) updates, one update per
+    channel of each row of the trace, in the order of the trace. The matrix is
+    filled with the first transaction at startup; the following updates are
+    applied as the ASN of the engine goes past theirs.
     """
 
     # ======================= inheritance =====================================
@@ -470,133 +964,104 @@ class ConnectivityK7(ConnectivityBase):
     def _init_connectivity_matrix(self):
         """ Fill the matrix using the connectivity trace"""
 
-        # create the matrix (You take the red pill and stay in Wonderland)
-        for source in self.engine.motes:
-            self.connectivity_matrix[source.id] = {}
-            for dest in self.engine.motes:
-                self.connectivity_matrix[source.id][dest.id] = {}
-                for chan in range(self.settings.phy_numChans):
-                    self.connectivity_matrix[source.id][dest.id][chan] = {}
-
-        # load first trace transaction and init
-        self.first_date = None
-        with gzip.open(self.settings.conn_trace, 'r') as trace:
-            trace_header = json.loads(trace.readline())
-            csv_header = trace.readline().strip().split(',')
-
-            for line in trace:
-                # parse line
-                row = self._parse_line(csv_header, line)
-
-                # only read first transaction
-                if row['transaction_id'] > 0:
-                    break
-
-                # save file position
-                self.trace_position = trace.tell()
-
-                # update matrix value
-                first_channel = trace_header['channels'][0]
-                for channel in row['channels']:
-                    channel_offset = channel - first_channel
-                    self.connectivity_matrix[row['src']][row['dst']][channel_offset] = {
-                        'pdr': float(row['pdr']),
-                        'rssi': row['mean_rssi'],
-                    }
-
-                # save matrix timestamp
-                self.connectivity_matrix_timestamp = row['asn']
+        if self.settings.conn_trace_cache:
+            self.trace_updates = load_compiled_k7_trace(
+                self.settings.conn_trace,
+                self.settings.tsch_slotDuration,
+                self.settings.phy_numChans,
+                self.settings.conn_trace_cache_dir,
+            )
+        else:
+            self.trace_updates = get_k7_trace_fields(
+                load_k7_trace(
+                    self.settings.conn_trace,
+                    self.settings.tsch_slotDuration,
+                    self.settings.phy_numChans,
+                )
+            )
 
-    # overloaded methods
+        # fill the matrix with the first transaction
+        self.trace_next_update = numpy.searchsorted(
+            self.trace_updates['transaction_id'],
+            0,
+            side = 'right'
+        )
+        self._apply_updates(0, self.trace_next_update)
 
-    def get_pdr(self, source, destination, channel):
-        # update PDR matrix if we are a new row in our K7 file
-        if  self.connectivity_matrix_timestamp < self.engine.asn:
-            self.connectivity_matrix_timestamp = self._update_connectivity_matrix_from_trace()
+        # the matrix is updated again at the ASN of the next update
+        self.connectivity_matrix_timestamp = self._get_next_update_asn()
 
-        # then call the parent's method
-        return super(ConnectivityK7, self).get_pdr(source, destination, channel)
+    # overloaded methods
 
-    def get_rssi(self, source, destination, channel):
-        # update PDR matrix if we are a new row in our K7 file
-        if  self.connectivity_matrix_timestamp < self.engine.asn:
-            self.connectivity_matrix_timestamp = self._update_connectivity_matrix_from_trace()
+    def get_pdr(self, src_id, dst_id, channel):
+        # update PDR matrix if we are past the next update of our K7 file
+        self._update_connectivity_matrix_from_trace()
 
         # then call the parent's method
-        print source, destination, channel
-        return super(ConnectivityK7, self).get_rssi(source, destination, channel)
+        return super(ConnectivityK7, self).get_pdr(src_id, dst_id, channel)
 
-    # ======================= private =========================================
+    def get_rssi(self, src_id, dst_id, channel):
+        # update PDR matrix if we are past the next update of our K7 file
+        self._update_connectivity_matrix_from_trace()
 
-    def _update_connectivity_matrix_from_trace(self):
-        """ Read the connectivity trace and fill the connectivity matrix
-        :return: Timestamp when to update the matrix again
-        """
+        # then call the parent's method
+        return super(ConnectivityK7, self).get_rssi(src_id, dst_id, channel)
 
-        with gzip.open(self.settings.conn_trace, 'r') as trace:
-            trace_header = json.loads(trace.readline())
-            csv_header = trace.readline().strip().split(',')
-
-            # move to last recorded position
-            trace.seek(self.trace_position)
-
-            for line in trace:
-                # parse line
-                row = self._parse_line(csv_header, line)
-
-                # save file position
-                self.trace_position = trace.tell()
-
-                # return next update ASN
-                if row['asn'] > self.engine.asn:
-                    return row['asn']
-
-                # update matrix value
-                first_channel = trace_header['channels'][0]
-                for channel in row['channels']:
-                    channel_offset = channel - first_channel
-                    self.connectivity_matrix[row['src']][row['dst']][channel_offset] = {
-                        'pdr': float(row['pdr']),
-                        'rssi': row['mean_rssi'],
-                    }
-
-        raise Exception("""
-                        Reached the end of the trace file without finding a matching row.
-                        The simulation duration is longer than the trace duration.
-                        """)
-
-    def _parse_line(self, csv_header, line):
-        # === read and parse line
-        vals = line.strip().split(',')
-        row = dict(zip(csv_header, vals))
-
-        # === change row format
-
-        row['src'] = int(row['src'])
-        row['dst'] = int(row['dst'])
-        row['transaction_id'] = int(row['transaction_id'])
-        row['datetime'] = datetime.strptime(row['datetime'], "%Y-%m-%d %H:%M:%S")
-
-        # rssi
-        if row['mean_rssi'] == '':
-            row['mean_rssi'] = -1000
-        else:
-            row['mean_rssi'] = float(row['mean_rssi'])
+    def _get_link_matrices(self, src_id_list, dst_id_list, channel):
+        # update PDR matrix if we are past the next update of our K7 file
+        self._update_connectivity_matrix_from_trace()
 
-        # channel string to list
-        row['channels'] = [int(c) for c in row['channels'].strip("[]").split(';')]
+        # then call the parent's method
+        return super(ConnectivityK7, self)._get_link_matrices(src_id_list, dst_id_list, channel)
 
-        # === add ASN value to row
+    # ======================= private =========================================
 
-        # save first row datetime if it does not exits
-        if self.first_date is None:
-            self.first_date = row['datetime']
+    def _update_connectivity_matrix_from_trace(self):
+        """ Apply the updates of the trace up to the current ASN """
 
-        # convert row datetime to ASN
-        time_delta = row['datetime'] - self.first_date
-        row['asn'] = int(time_delta.total_seconds() / float(self.settings.tsch_slotDuration))
+        if self.engine.asn < self.connectivity_matrix_timestamp:
+            # nothing to update yet
+            return
 
-        return row
+        # updates are sorted by ASN
+        end = self.trace_next_update + numpy.searchsorted(
+            self.trace_updates['asn'][self.trace_next_update:],
+            self.engine.asn,
+            side = 'right'
+        )
+        if end == len(self.trace_updates['asn']):
+            raise Exception("""
+                            Reached the end of the trace file without finding a matching row.
+                            The simulation duration is longer than the trace duration.
+                            """)
+
+        self._apply_updates(self.trace_next_update, end)
+        self.trace_next_update             = end
+        self.connectivity_matrix_timestamp = self._get_next_update_asn()
+
+    def _get_next_update_asn(self):
+        if self.trace_next_update < len(self.trace_updates['asn']):
+            return int(self.trace_updates['asn'][self.trace_next_update])
+        else:
+            # the trace is over; the next update raises an exception
+            return int(self.trace_updates['asn'][-1])
+
+    def _apply_updates(self, start, end):
+        updates = self.trace_updates
+        for (src_id, dst_id, channel, pdr, rssi) in zip(
+                updates['src'][start:end].tolist(),
+                updates['dst'][start:end].tolist(),
+                updates['channel'][start:end].tolist(),
+                updates['pdr'][start:end].tolist(),
+                updates['rssi'][start:end].tolist(),
+            ):
+            self._set_link(
+                src_id  = src_id,
+                dst_id  = dst_id,
+                channel = channel,
+                pdr     = pdr,
+                rssi    = rssi,
+            )
 
 class ConnectivityRandom(ConnectivityBase):
     """Random (topology) connectivity using the Pister-Hack model
@@ -681,9 +1146,9 @@ class ConnectivityRandom(ConnectivityBase):
                         }
                     )
                     pdr = self.pister_hack.convert_rssi_to_pdr(rssi)
-                    # memorize the rssi and pdr values at channel 0
-                    self._set_rssi(target_mote.id, deployed_mote_id, 0, rssi)
+                    # memorize the pdr and rssi values at channel 0
                     self._set_pdr(target_mote.id, deployed_mote_id, 0, pdr)
+                    self._set_rssi(target_mote.id, deployed_mote_id, 0, rssi)
 
                     if init_min_pdr <= pdr:
                         good_pdr_count += 1
@@ -704,13 +1169,13 @@ class ConnectivityRandom(ConnectivityBase):
                     ):
                     # fix the coordinate of the mote
                     self.coordinates[target_mote.id] = coordinate
-                    # copy the rssi and pdr values to other channels
+                    # copy the pdr and rssi values to other channels
                     for deployed_mote_id in self.coordinates.keys():
                         rssi = self.get_rssi(target_mote.id, deployed_mote_id, channel=0)
                         pdr  = self.get_pdr(target_mote.id, deployed_mote_id, channel=0)
                         for channel in range(1, self.settings.phy_numChans):
-                            self._set_rssi(target_mote.id, deployed_mote_id, channel, rssi)
                             self._set_pdr(target_mote.id, deployed_mote_id, channel, pdr)
+                            self._set_rssi(target_mote.id, deployed_mote_id, channel, rssi)
                     mote_is_deployed = True
                 else:
                     # remove memorized values at channel 0
@@ -727,17 +1192,17 @@ class ConnectivityRandom(ConnectivityBase):
 
     def _set_rssi(self, mote_id_1, mote_id_2, channel, rssi):
         # set the same RSSI to the both directions
-        self.connectivity_matrix[mote_id_1][mote_id_2][channel]['rssi'] = rssi
-        self.connectivity_matrix[mote_id_2][mote_id_1][channel]['rssi'] = rssi
+        self._set_link_rssi(mote_id_1, mote_id_2, channel, rssi)
+        self._set_link_rssi(mote_id_2, mote_id_1, channel, rssi)
 
     def _clear_rssi(self, mote_id_1, mote_id_2, channel):
         INVALID_RSSI = -1000
         self._set_rssi(mote_id_1, mote_id_2, channel, rssi=INVALID_RSSI)
 
     def _set_pdr(self, mote_id_1, mote_id_2, channel, pdr):
-        # set the same RSSI to the both directions
-        self.connectivity_matrix[mote_id_1][mote_id_2][channel]['pdr'] = pdr
-        self.connectivity_matrix[mote_id_2][mote_id_1][channel]['pdr'] = pdr
+        # set the same PDR to the both directions
+        self._set_link_pdr(mote_id_1, mote_id_2, channel, pdr)
+        self._set_link_pdr(mote_id_2, mote_id_1, channel, pdr)
 
     def _clear_pdr(self, mote_id_1, mote_id_2, channel):
         self._set_pdr(mote_id_1, mote_id_2, channel, pdr=0)
@@ -749,32 +1214,6 @@ class PisterHackModel(object):
     TWO_DOT_FOUR_GHZ         = 2400000000 # Hz
     SPEED_OF_LIGHT           =  299792458 # m/s
 
-    # RSSI and PDR relationship obtained by experiment; dataset was available
-    # at the link shown below:
-    # http://wsn.eecs.berkeley.edu/connectivity/?dataset=dust
-    RSSI_PDR_TABLE = {
-        -97:    0.0000,  # this value is not from experiment
-        -96:    0.1494,
-        -95:    0.2340,
-        -94:    0.4071,
-        # <-- 50% PDR is here, at RSSI=-93.6
-        -93:    0.6359,
-        -92:    0.6866,
-        -91:    0.7476,
-        -90:    0.8603,
-        -89:    0.8702,
-        -88:    0.9324,
-        -87:    0.9427,
-        -86:    0.9562,
-        -85:    0.9611,
-        -84:    0.9739,
-        -83:    0.9745,
-        -82:    0.9844,
-        -81:    0.9854,
-        -80:    0.9903,
-        -79:    1.0000,  # this value is not from experiment
-    }
-
     def __init__(self):
 
         # singleton
@@ -830,23 +1269,7 @@ class PisterHackModel(object):
         return rssi
 
     def convert_rssi_to_pdr(self, rssi):
-        minRssi = min(self.RSSI_PDR_TABLE.keys())
-        maxRssi = max(self.RSSI_PDR_TABLE.keys())
-
-        if rssi < minRssi:
-            pdr = 0.0
-        elif rssi > maxRssi:
-            pdr = 1.0
-        else:
-            floor_rssi = int(math.floor(rssi))
-            pdr_low    = self.RSSI_PDR_TABLE[floor_rssi]
-            pdr_high   = self.RSSI_PDR_TABLE[floor_rssi + 1]
-            # linear interpolation
-            pdr = (pdr_high - pdr_low) * (rssi - float(floor_rssi)) + pdr_low
-
-        assert pdr >= 0.0
-        assert pdr <= 1.0
-        return pdr
+        return rssi_to_pdr(rssi)
 
     @staticmethod
     def _get_distance_in_meters(a, b):
@@ -46,6 +46,7 @@ class AppBase(object):
         self.engine     = SimEngine.SimEngine.SimEngine()
         self.settings   = SimEngine.SimSettings.SimSettings()
         self.log        = SimEngine.SimLog.SimLog().log
+        self.log_enabled = SimEngine.SimLog.SimLog().is_enabled
         
         # local variables
         self.appcounter = 0
@@ -64,13 +65,14 @@ class AppBase(object):
         """Receive a packet destined to this application
         """
         # log and mote stats
-        self.log(
-            SimEngine.SimLog.LOG_APP_RX,
-            {
-                '_mote_id': self.mote.id,
-                'packet'  : packet
-            }
-        )
+        if self.log_enabled(SimEngine.SimLog.LOG_APP_RX):
+            self.log(
+                SimEngine.SimLog.LOG_APP_RX,
+                {
+                    '_mote_id': self.mote.id,
+                    'packet'  : packet
+                }
+            )
 
     #======================== private ==========================================
 
@@ -114,13 +116,14 @@ class AppBase(object):
         )
         
         # log
-        self.log(
-            SimEngine.SimLog.LOG_APP_TX,
-            {
-                '_mote_id':       self.mote.id,
-                'packet':         packet,
-            }
-        )
+        if self.log_enabled(SimEngine.SimLog.LOG_APP_TX):
+            self.log(
+                SimEngine.SimLog.LOG_APP_TX,
+                {
+                    '_mote_id':       self.mote.id,
+                    'packet':         packet,
+                }
+            )
         
         # send
         self.mote.sixlowpan.sendPacket(packet)
@@ -145,13 +148,14 @@ class AppRoot(AppBase):
         assert self.mote.dagRoot
 
         # log and update mote stats
-        self.log(
-            SimEngine.SimLog.LOG_APP_RX,
-            {
-                '_mote_id': self.mote.id,
-                'packet'  : packet
-            }
-        )
+        if self.log_enabled(SimEngine.SimLog.LOG_APP_RX):
+            self.log(
+                SimEngine.SimLog.LOG_APP_RX,
+                {
+                    '_mote_id': self.mote.id,
+                    'packet'  : packet
+                }
+            )
 
     #======================== private ==========================================
     
@@ -42,6 +42,10 @@ class Radio(object):
 
     # ======================= public ==========================================
 
+    def register_active_asn(self, asn):
+        """the radio may be turned on at asn; make sure propagation happens"""
+        self.engine.connectivity.register_active_asn(asn)
+
     # TX
 
     def startTx(self, channel, packet):
@@ -59,9 +63,11 @@ class Radio(object):
             'channel': channel,
             'packet':  packet,
         }
+        self.engine.connectivity.add_transmitter(self.mote.id, channel)
 
     def txDone(self, isACKed):
         """end of tx slot"""
+        self.engine.connectivity.remove_transmitter(self.mote.id, self.channel)
         self.state = d.RADIO_STATE_OFF
         self.channel = None
 
@@ -93,11 +99,13 @@ class Radio(object):
         assert self.state != d.RADIO_STATE_RX
         self.state = d.RADIO_STATE_RX
         self.channel = channel
+        self.engine.connectivity.add_listener(self.mote.id, channel)
 
     def rxDone(self, packet):
         """end of RX radio activity"""
 
         # switch radio state
+        self.engine.connectivity.remove_listener(self.mote.id, self.channel)
         self.state   = d.RADIO_STATE_OFF
         self.channel = None
 
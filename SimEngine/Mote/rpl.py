@@ -47,6 +47,7 @@ class Rpl(object):
         self.engine                    = SimEngine.SimEngine.SimEngine()
         self.settings                  = SimEngine.SimSettings.SimSettings()
         self.log                       = SimEngine.SimLog.SimLog().log
+        self.log_enabled               = SimEngine.SimLog.SimLog().is_enabled
 
         # local variables
         self.dodagId                   = None
@@ -188,13 +189,14 @@ class Rpl(object):
         dio = self._create_DIO(dstIp)
 
         # log
-        self.log(
-            SimEngine.SimLog.LOG_RPL_DIO_TX,
-            {
-                "_mote_id":  self.mote.id,
-                "packet":    dio,
-            }
-        )
+        if self.log_enabled(SimEngine.SimLog.LOG_RPL_DIO_TX):
+            self.log(
+                SimEngine.SimLog.LOG_RPL_DIO_TX,
+                {
+                    "_mote_id":  self.mote.id,
+                    "packet":    dio,
+                }
+            )
 
         self.mote.sixlowpan.sendPacket(dio)
 
@@ -238,13 +240,14 @@ class Rpl(object):
             return
 
         # log
-        self.log(
-            SimEngine.SimLog.LOG_RPL_DIO_RX,
-            {
-                "_mote_id":  self.mote.id,
-                "packet":    packet,
-            }
-        )
+        if self.log_enabled(SimEngine.SimLog.LOG_RPL_DIO_RX):
+            self.log(
+                SimEngine.SimLog.LOG_RPL_DIO_RX,
+                {
+                    "_mote_id":  self.mote.id,
+                    "packet":    packet,
+                }
+            )
 
         # record dodagId
         if self.dodagId is None:
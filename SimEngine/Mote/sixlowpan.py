@@ -32,6 +32,7 @@ class Sixlowpan(object):
         self.settings             = SimEngine.SimSettings.SimSettings()
         self.engine               = SimEngine.SimEngine.SimEngine()
         self.log                  = SimEngine.SimLog.SimLog().log
+        self.log_enabled          = SimEngine.SimLog.SimLog().is_enabled
 
         # local variables
         self.fragmentation        = globals()[self.settings.fragmentation](self)
@@ -66,13 +67,14 @@ class Sixlowpan(object):
             packet['net']['downward'] = False
 
         # log
-        self.log(
-            SimEngine.SimLog.LOG_SIXLOWPAN_PKT_TX,
-            {
-                '_mote_id':       self.mote.id,
-                'packet':         packet,
-            }
-        )
+        if self.log_enabled(SimEngine.SimLog.LOG_SIXLOWPAN_PKT_TX):
+            self.log(
+                SimEngine.SimLog.LOG_SIXLOWPAN_PKT_TX,
+                {
+                    '_mote_id':       self.mote.id,
+                    'packet':         packet,
+                }
+            )
 
         # add source route, if needed
         if goOn:
@@ -141,13 +143,14 @@ class Sixlowpan(object):
         goOn = True
 
         # log
-        self.log(
-            SimEngine.SimLog.LOG_SIXLOWPAN_PKT_RX,
-            {
-                '_mote_id':        self.mote.id,
-                'packet':          packet,
-            }
-        )
+        if self.log_enabled(SimEngine.SimLog.LOG_SIXLOWPAN_PKT_RX):
+            self.log(
+                SimEngine.SimLog.LOG_SIXLOWPAN_PKT_RX,
+                {
+                    '_mote_id':        self.mote.id,
+                    'packet':          packet,
+                }
+            )
 
         # add the source mode to the neighbor_cache if it's on-link
         # FIXME: IPv6 prefix should be examined
@@ -258,7 +261,7 @@ class Sixlowpan(object):
                     }
 
         # log
-        if goOn:
+        if goOn and self.log_enabled(SimEngine.SimLog.LOG_SIXLOWPAN_PKT_FWD):
             self.log(
                 SimEngine.SimLog.LOG_SIXLOWPAN_PKT_FWD,
                 {
@@ -351,6 +354,7 @@ class Fragmentation(object):
         self.settings             = SimEngine.SimSettings.SimSettings()
         self.engine               = SimEngine.SimEngine.SimEngine()
         self.log                  = SimEngine.SimLog.SimLog().log
+        self.log_enabled          = SimEngine.SimLog.SimLog().is_enabled
 
         # local variables
         self.mote                 = sixlowpan.mote
@@ -478,13 +482,14 @@ class Fragmentation(object):
                 returnVal += [fragment]
 
                 # log
-                self.log(
-                    SimEngine.SimLog.LOG_SIXLOWPAN_FRAG_GEN,
-                    {
-                        '_mote_id': self.mote.id,
-                        'packet':   fragment
-                    }
-                )
+                if self.log_enabled(SimEngine.SimLog.LOG_SIXLOWPAN_FRAG_GEN):
+                    self.log(
+                        SimEngine.SimLog.LOG_SIXLOWPAN_FRAG_GEN,
+                        {
+                            '_mote_id': self.mote.id,
+                            'packet':   fragment
+                        }
+                    )
 
         else:
             # the input packet doesn't need fragmentation
@@ -37,6 +37,7 @@ class SixP(object):
         self.engine                = SimEngine.SimEngine.SimEngine()
         self.settings              = SimEngine.SimSettings.SimSettings()
         self.log                   = SimEngine.SimLog.SimLog().log
+        self.log_enabled           = SimEngine.SimLog.SimLog().is_enabled
 
         # local variables
         self.seqnum_table          = {} # indexed by neighbor_id
@@ -47,13 +48,14 @@ class SixP(object):
     def recv_packet(self, packet):
 
         # log
-        self.log(
-            SimEngine.SimLog.LOG_SIXP_RX,
-            {
-                '_mote_id': self.mote.id,
-                'packet':   packet
-            }
-        )
+        if self.log_enabled(SimEngine.SimLog.LOG_SIXP_RX):
+            self.log(
+                SimEngine.SimLog.LOG_SIXP_RX,
+                {
+                    '_mote_id': self.mote.id,
+                    'packet':   packet
+                }
+            )
 
         if   packet['app']['msgType'] == d.SIXP_MSG_TYPE_REQUEST:
             self._recv_request(packet)
@@ -257,13 +259,14 @@ class SixP(object):
     # ======================= private ==========================================
 
     def _tsch_enqueue(self, packet):
-        self.log(
-            SimEngine.SimLog.LOG_SIXP_TX,
-            {
-                '_mote_id': self.mote.id,
-                'packet':   packet
-            }
-        )
+        if self.log_enabled(SimEngine.SimLog.LOG_SIXP_TX):
+            self.log(
+                SimEngine.SimLog.LOG_SIXP_TX,
+                {
+                    '_mote_id': self.mote.id,
+                    'packet':   packet
+                }
+            )
         self.mote.tsch.enqueue(packet, priority=True)
 
     def _recv_request(self, request):
@@ -33,6 +33,7 @@ class Tsch(object):
         self.engine   = SimEngine.SimEngine.SimEngine()
         self.settings = SimEngine.SimSettings.SimSettings()
         self.log      = SimEngine.SimLog.SimLog().log
+        self.log_enabled = SimEngine.SimLog.SimLog().is_enabled
 
         # local variables
         self.slotframes      = {}
@@ -163,6 +164,7 @@ class Tsch(object):
             uniqueTag        = (self.mote.id, '_action_listeningForEB_cell'),
             intraSlotOrder   = d.INTRASLOTORDER_STARTSLOT,
         )
+        self.mote.radio.register_active_asn(self.engine.getAsn()+1)
 
     # minimal
 
@@ -418,15 +420,16 @@ class Tsch(object):
         assert self.waitingFor == d.WAITING_FOR_TX
 
         # log
-        self.log(
-            SimEngine.SimLog.LOG_TSCH_TXDONE,
-            {
-                '_mote_id':       self.mote.id,
-                'channel':        self.channel,
-                'packet':         self.pktToSend,
-                'isACKed':        isACKed,
-            }
-        )
+        if self.log_enabled(SimEngine.SimLog.LOG_TSCH_TXDONE):
+            self.log(
+                SimEngine.SimLog.LOG_TSCH_TXDONE,
+                {
+                    '_mote_id':       self.mote.id,
+                    'channel':        self.channel,
+                    'packet':         self.pktToSend,
+                    'isACKed':        isACKed,
+                }
+            )
 
         if self.pktToSend['mac']['dstMac'] == d.BROADCAST_ADDRESS:
             # I just sent a broadcast packet
@@ -537,13 +540,14 @@ class Tsch(object):
         # if I get here, I received a frame at the link layer (either unicast for me, or broadcast)
 
         # log
-        self.log(
-            SimEngine.SimLog.LOG_TSCH_RXDONE,
-            {
-                '_mote_id':        self.mote.id,
-                'packet':          packet,
-            }
-        )
+        if self.log_enabled(SimEngine.SimLog.LOG_TSCH_RXDONE):
+            self.log(
+                SimEngine.SimLog.LOG_TSCH_RXDONE,
+                {
+                    '_mote_id':        self.mote.id,
+                    'packet':          packet,
+                }
+            )
 
         # time correction
         if self.clock.source == packet['mac']['srcMac']:
@@ -691,6 +695,7 @@ class Tsch(object):
             uniqueTag      = (self.mote.id, '_action_active_cell'),
             intraSlotOrder = d.INTRASLOTORDER_STARTSLOT,
         )
+        self.mote.radio.register_active_asn(asn+tsDiffMin)
 
     def _action_active_cell(self):
 
@@ -808,13 +813,14 @@ class Tsch(object):
             }
 
             # log
-            self.log(
-                SimEngine.SimLog.LOG_TSCH_EB_TX,
-                {
-                    "_mote_id": self.mote.id,
-                    "packet":   newEB,
-                }
-            )
+            if self.log_enabled(SimEngine.SimLog.LOG_TSCH_EB_TX):
+                self.log(
+                    SimEngine.SimLog.LOG_TSCH_EB_TX,
+                    {
+                        "_mote_id": self.mote.id,
+                        "packet":   newEB,
+                    }
+                )
 
         return newEB
 
@@ -823,13 +829,14 @@ class Tsch(object):
         assert packet['type'] == d.PKT_TYPE_EB
 
         # log
-        self.log(
-            SimEngine.SimLog.LOG_TSCH_EB_RX,
-            {
-                "_mote_id": self.mote.id,
-                "packet":   packet,
-            }
-        )
+        if self.log_enabled(SimEngine.SimLog.LOG_TSCH_EB_RX):
+            self.log(
+                SimEngine.SimLog.LOG_TSCH_EB_RX,
+                {
+                    "_mote_id": self.mote.id,
+                    "packet":   packet,
+                }
+            )
 
         # abort if I'm the root
         if self.mote.dagRoot:
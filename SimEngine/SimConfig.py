@@ -53,7 +53,7 @@ class SimConfig(dict):
     _startTime          = None
     _log_directory_name = None
 
-    def __init__(self, configfile=None, configdata=None):
+    def __init__(self, configfile=None, configdata=None, log_directory_name=None):
 
         if SimConfig._startTime is None:
             # startTime needs to be initialized
@@ -78,8 +78,10 @@ class SimConfig(dict):
         # store config
         self.config   = DotableDict(json.loads(self._raw_data))
 
-        # decide a directory name for log files
-        if SimConfig._log_directory_name is None:
+        # decide a directory name for log files, unless given one
+        if log_directory_name is not None:
+            SimConfig._log_directory_name = log_directory_name
+        elif SimConfig._log_directory_name is None:
             self._decide_log_directory_name()
 
     def __getattr__(self, name):
@@ -5,6 +5,7 @@
 # ========================== imports =========================================
 
 import hashlib
+import heapq
 import platform
 import random
 import sys
@@ -15,11 +16,24 @@ import traceback
 import Mote
 import SimSettings
 import SimLog
+import SimKpi
 import Connectivity
 import SimConfig
 
 # =========================== defines =========================================
 
+# an entry of the event queue is a list of:
+#   [asn, intraSlotOrder, seq, uniqueTag, cb]
+# (asn, intraSlotOrder, seq) is the key of the priority queue; 'seq' is a
+# monotonically increasing number which keeps events having the same asn and
+# intraSlotOrder in their insertion order. A cancelled entry stays in the heap
+# with its uniqueTag and cb set to None (tombstone).
+EVENT_ASN            = 0
+EVENT_INTRASLOTORDER = 1
+EVENT_SEQ            = 2
+EVENT_UNIQUETAG      = 3
+EVENT_CB             = 4
+
 # =========================== body ============================================
 
 class DiscreteEventEngine(threading.Thread):
@@ -56,7 +70,12 @@ class DiscreteEventEngine(threading.Thread):
             self.goOn                           = True
             self.asn                            = 0
             self.exc                            = None
-            self.events                         = []
+            self.events                         = [] # heap, see EVENT_* above
+            self.event_seq                      = 0
+            self.event_index                    = {} # live event indexed by uniqueTag
+            self.event_stats                    = {} # indexed by layer, see get_event_stats()
+            self.event_stats_by_code            = {} # counters of event_stats, indexed by callback code
+            self.num_cancelled_events           = 0
             self.random_seed                    = None
             self._init_additional_local_variables()
 
@@ -104,26 +123,32 @@ class DiscreteEventEngine(threading.Thread):
 
                 with self.dataLock:
                     
+                    # discard cancelled events at the head of the queue
+                    self._discard_cancelled_events()
+
                     # abort simulation when no more events
                     if not self.events:
                         break
-                    
+
                     # make sure we are in the future
-                    (a, b, cb, c) = self.events[0]
-                    if c[1] != '_actionPauseSim':
-                        assert self.events[0][0] >= self.asn
-                    
+                    (asn, _, _, uniqueTag, _) = self.events[0]
+                    if uniqueTag[1] != '_actionPauseSim':
+                        assert asn >= self.asn
+
                     # update the current ASN
-                    self.asn = self.events[0][0]
-                    
+                    self.asn = asn
+
                     # find callbacks for this ASN
                     cbs = []
                     while True:
-                        if (not self.events) or (self.events[0][0] != self.asn):
+                        self._discard_cancelled_events()
+                        if (not self.events) or (self.events[0][EVENT_ASN] != self.asn):
                             break
-                        (_, _, cb, _) = self.events.pop(0)
-                        cbs += [cb]
-                        
+                        event = heapq.heappop(self.events)
+                        if self.event_index.get(event[EVENT_UNIQUETAG]) is event:
+                            del self.event_index[event[EVENT_UNIQUETAG]]
+                        cbs += [event[EVENT_CB]]
+
                 # call the callbacks (outside the dataLock)
                 
                 for cb in cbs:
@@ -185,8 +210,8 @@ class DiscreteEventEngine(threading.Thread):
             cls._instance                      = None
             cls._init                          = False
 
-    def join(self):
-        super(DiscreteEventEngine, self).join()
+    def join(self, timeout=None):
+        super(DiscreteEventEngine, self).join(timeout)
         if self.exc:
             raise self.exc
 
@@ -202,6 +227,19 @@ class DiscreteEventEngine(threading.Thread):
             if mote.is_my_mac_addr(mac_addr):
                 return mote
         return None
+
+    def get_event_stats(self):
+        """
+        Return how many events each layer scheduled, indexed by the name of
+        the module implementing the callback (e.g. 'tsch', 'trickle_timer'):
+        - 'inserts':      events scheduled with a uniqueTag not in the queue
+        - 'replacements': events replacing a future event with the same uniqueTag
+        - 'removals':     future events removed by removeFutureEvent()
+        """
+        with self.dataLock:
+            return dict(
+                (layer, dict(counters)) for (layer, counters) in self.event_stats.items()
+            )
     
     #=== scheduling
     
@@ -214,19 +252,21 @@ class DiscreteEventEngine(threading.Thread):
         # make sure we are scheduling in the future
         assert asn > self.asn
 
-        # remove all events with same uniqueTag (the event will be rescheduled)
-        self.removeFutureEvent(uniqueTag)
-
         with self.dataLock:
 
-            # find correct index in schedule
-            i = 0
-            while i<len(self.events) and (self.events[i][0] < asn or (self.events[i][0] == asn and self.events[i][1] <= intraSlotOrder)):
-                i +=1
+            # remove the event with same uniqueTag (the event will be rescheduled)
+            if self._remove_future_event(uniqueTag):
+                self._update_event_stats(cb, 'replacements')
+            else:
+                self._update_event_stats(cb, 'inserts')
+
+            # add to schedule; the sequence number keeps events of the same
+            # asn and intraSlotOrder in their insertion order
+            event = [asn, intraSlotOrder, self.event_seq, uniqueTag, cb]
+            heapq.heappush(self.events, event)
+            self.event_index[uniqueTag] = event
+            self.event_seq += 1
 
-            # add to schedule
-            self.events.insert(i, (asn, intraSlotOrder, cb, uniqueTag))
-    
     def scheduleIn(self, delay, cb, uniqueTag, intraSlotOrder):
         """
         Schedule an event 'delay' seconds into the future.
@@ -255,12 +295,11 @@ class DiscreteEventEngine(threading.Thread):
 
     def removeFutureEvent(self, uniqueTag):
         with self.dataLock:
-            i = 0
-            while i<len(self.events):
-                if (self.events[i][3]==uniqueTag) and (self.events[i][0]!=self.asn):
-                    self.events.pop(i)
-                else:
-                    i += 1
+            event = self.event_index.get(uniqueTag)
+            if event is not None:
+                cb = event[EVENT_CB] # cleared when the event is cancelled
+            if self._remove_future_event(uniqueTag):
+                self._update_event_stats(cb, 'removals')
 
     def terminateSimulation(self,delay):
         with self.dataLock:
@@ -274,6 +313,67 @@ class DiscreteEventEngine(threading.Thread):
 
     # ======================== private ========================================
 
+    # === event queue
+
+    def _remove_future_event(self, uniqueTag):
+        """
+        Cancel the future event having uniqueTag, if any.
+        Return True if an event was cancelled.
+        """
+        event = self.event_index.get(uniqueTag)
+        if (event is None) or (event[EVENT_ASN] == self.asn):
+            return False
+
+        del self.event_index[uniqueTag]
+        self._cancel_event(event)
+
+        # compact the heap when it's mostly made of tombstones
+        if self.num_cancelled_events > len(self.events) / 2:
+            self._compact_events()
+
+        return True
+
+    def _cancel_event(self, event):
+        # leave a tombstone in the heap; it is discarded when it reaches the
+        # head of the queue, or when the heap is compacted
+        event[EVENT_UNIQUETAG] = None
+        event[EVENT_CB]        = None
+        self.num_cancelled_events += 1
+
+    def _compact_events(self):
+        self.events = [e for e in self.events if e[EVENT_CB] is not None]
+        heapq.heapify(self.events)
+        self.num_cancelled_events = 0
+
+    def _discard_cancelled_events(self):
+        while self.events and (self.events[0][EVENT_CB] is None):
+            heapq.heappop(self.events)
+            self.num_cancelled_events -= 1
+
+    def _update_event_stats(self, cb, counter):
+        # the counters of a callback are looked up by its code, which the
+        # bound methods and the lambdas of the same function share
+        code = getattr(getattr(cb, 'im_func', cb), '__code__', None)
+        counters = self.event_stats_by_code.get(code)
+        if counters is None:
+            counters = self._get_layer_event_stats(cb)
+            if code is not None:
+                self.event_stats_by_code[code] = counters
+        counters[counter] += 1
+
+    def _get_layer_event_stats(self, cb):
+        # the layer is identified by the module implementing the callback
+        layer = getattr(cb, '__module__', None)
+        if layer is not None:
+            layer = layer.split('.')[-1]
+        if layer not in self.event_stats:
+            self.event_stats[layer] = {
+                'inserts':      0,
+                'replacements': 0,
+                'removals':     0,
+            }
+        return self.event_stats[layer]
+
     def _actionPauseSim(self):
         assert self.simPaused==False
         self.simPaused = True
@@ -351,6 +451,12 @@ class SimEngine(DiscreteEventEngine):
         self.log                        = SimLog.SimLog().log
         SimLog.SimLog().set_simengine(self)
 
+        # compute the KPIs during the run
+        if self.settings.kpi_collector:
+            self.kpi_collector          = SimKpi.KpiCollector()
+        else:
+            self.kpi_collector          = None
+
         # log the random seed
         self.log(
             SimLog.LOG_SIMULATOR_RANDOM_SEED,
@@ -404,6 +510,12 @@ class SimEngine(DiscreteEventEngine):
 
     def _routine_thread_ended(self):
         # log
+        self.log(
+            SimLog.LOG_SIMULATOR_EVENT_STATS,
+            {
+                "stats": self.get_event_stats()
+            }
+        )
         self.log(
             SimLog.LOG_SIMULATOR_STATE,
             {
@@ -411,3 +523,7 @@ class SimEngine(DiscreteEventEngine):
                 "state": "stopped"
             }
         )
+
+        # write the KPIs of the run
+        if self.kpi_collector is not None:
+            self.kpi_collector.write_kpi_file()
@@ -0,0 +1,298 @@
+"""
+Computes the KPIs of simulation runs (sync and join times, upstream latency,
+reliability and hop count, packet drops, battery lifetime) from their logs.
+
+KpiAccumulator is fed logs one by one, either read from a log file by
+bin/compute_kpis.py, or during the simulation by KpiCollector, which writes
+the KPIs of the run in the .kpi file of the log file.
+"""
+
+# ========================== imports =========================================
+
+import json
+import os
+
+import netaddr
+
+import SimLog
+import SimSettings
+import Mote.MoteDefines as d
+
+# =========================== defines =========================================
+
+DAGROOT_ID = 0  # we assume first mote is DAGRoot
+DAGROOT_IP = 'fd00::1:0'
+
+# =========================== helpers =========================================
+
+def get_kpi_file_path(log_file_path):
+    return '{0}.kpi'.format(log_file_path)
+
+def get_kpi_logs():
+    # the logs the KPIs are computed from
+    return [
+        SimLog.LOG_TSCH_SYNCED,
+        SimLog.LOG_SECJOIN_JOINED,
+        SimLog.LOG_APP_TX,
+        SimLog.LOG_APP_RX,
+        SimLog.LOG_PACKET_DROPPED,
+        SimLog.LOG_BATT_CHARGE,
+    ]
+
+# =========================== body ============================================
+
+class KpiAccumulator(object):
+
+    def __init__(self, slot_duration, drop_weight=1):
+        """
+        :param float slot_duration: tsch_slotDuration of the runs
+        :param int drop_weight: number of drops a packet_dropped log stands for
+        """
+
+        # store params
+        self.slot_duration = slot_duration
+        self.drop_weight   = drop_weight
+
+        # local variables
+        self.allstats      = {} # indexed by run_id, mote_id
+        self.handlers      = {
+            SimLog.LOG_TSCH_SYNCED['type']:     self._handle_tsch_synced,
+            SimLog.LOG_SECJOIN_JOINED['type']:  self._handle_secjoin_joined,
+            SimLog.LOG_APP_TX['type']:          self._handle_app_tx,
+            SimLog.LOG_APP_RX['type']:          self._handle_app_rx,
+            SimLog.LOG_PACKET_DROPPED['type']:  self._handle_packet_dropped,
+            SimLog.LOG_BATT_CHARGE['type']:     self._handle_batt_charge,
+        }
+
+    # ======================= public ==========================================
+
+    def add_log(self, logline):
+        # shorthands
+        run_id = logline['_run_id']
+
+        # populate
+        if run_id not in self.allstats:
+            self.allstats[run_id] = {}
+
+        handler = self.handlers.get(logline['_type'])
+        if handler is not None:
+            handler(self.allstats[run_id], logline)
+
+    def get_kpis(self):
+        """ Return the KPIs of all the runs, indexed by run_id and mote_id
+
+        This is to be called once, after all the logs have been added.
+        """
+
+        allstats = self.allstats
+
+        # === compute advanced motestats
+
+        for (run_id, per_mote_stats) in allstats.items():
+            for (mote_id, motestats) in per_mote_stats.items():
+                if mote_id != 0:
+
+                    if   'sync_asn' not in motestats:
+                        motestats['WARNING'] = "mote didn't sync"
+                    elif 'charge_asn' not in motestats:
+                        motestats['WARNING'] = "log doesn't have battery info"
+                    else:
+                        # avg_current, lifetime_AA
+                        if (
+                                (motestats['charge'] <= 0)
+                                or
+                                (motestats['charge_asn'] == motestats['sync_asn'])
+                            ):
+                            motestats['lifetime_AA_years'] = 'N/A'
+                        else:
+                            motestats['avg_current_uA'] = motestats['charge']/float((motestats['charge_asn']-motestats['sync_asn']) * self.slot_duration)
+                            assert motestats['avg_current_uA'] > 0
+                            motestats['lifetime_AA_years'] = (2200*1000/float(motestats['avg_current_uA']))/(24.0*365)
+                    if 'join_asn' in motestats:
+                        # upstream_num_lost; latencies, hops, upstream_num_tx
+                        # and upstream_num_rx are counted as the packets are
+                        # received
+                        motestats['upstream_num_lost'] = (
+                            motestats['upstream_num_tx'] - motestats['upstream_num_rx']
+                        )
+                        if (motestats['upstream_num_rx'] > 0) and (motestats['upstream_num_tx'] > 0):
+                            motestats['latency_min_s'] = min(motestats['latencies'])
+                            motestats['latency_avg_s'] = sum(motestats['latencies'])/float(len(motestats['latencies']))
+                            motestats['latency_max_s'] = max(motestats['latencies'])
+                            motestats['upstream_reliability'] = motestats['upstream_num_rx']/float(motestats['upstream_num_tx'])
+                            motestats['avg_hops'] = sum(motestats['hops'])/float(len(motestats['hops']))
+                        else:
+                            motestats['WARNING'] = "mote didn't send or receive pkts"
+                    else:
+                        motestats['WARNING'] = "mote didn't join"
+
+        # === remove unnecessary stats
+
+        for (run_id, per_mote_stats) in allstats.items():
+            for (mote_id, motestats) in per_mote_stats.items():
+                if 'sync_asn' in motestats:
+                    del motestats['sync_asn']
+                if 'charge_asn' in motestats:
+                    del motestats['charge_asn']
+                    del motestats['charge']
+                if 'join_asn' in motestats:
+                    del motestats['upstream_pkts']
+                    del motestats['hops']
+                    del motestats['latencies']
+                    del motestats['join_asn']
+
+        return allstats
+
+    # ======================= private =========================================
+
+    def _handle_tsch_synced(self, runstats, logline):
+        # sync'ed
+
+        # shorthands
+        mote_id    = logline['_mote_id']
+        asn        = logline['_asn']
+
+        # only log non-dagRoot sync times
+        if mote_id == DAGROOT_ID:
+            return
+
+        # populate
+        if mote_id not in runstats:
+            runstats[mote_id] = {}
+
+        runstats[mote_id]['sync_asn']  = asn
+        runstats[mote_id]['sync_time_s'] = asn*self.slot_duration
+
+    def _handle_secjoin_joined(self, runstats, logline):
+        # joined
+
+        # shorthands
+        mote_id    = logline['_mote_id']
+        asn        = logline['_asn']
+
+        # only log non-dagRoot join times
+        if mote_id == DAGROOT_ID:
+            return
+
+        # populate
+        assert mote_id in runstats
+
+        runstats[mote_id]['join_asn']  = asn
+        runstats[mote_id]['join_time_s'] = asn*self.slot_duration
+        runstats[mote_id]['upstream_pkts']   = {} # tx_asn of the packets in flight, indexed by appcounter
+        runstats[mote_id]['upstream_num_tx'] = 0
+        runstats[mote_id]['upstream_num_rx'] = 0
+        runstats[mote_id]['latencies']       = []
+        runstats[mote_id]['hops']            = []
+
+    def _handle_app_tx(self, runstats, logline):
+        # packet transmission
+
+        # shorthands
+        mote_id    = logline['_mote_id']
+        dstIp      = logline['packet']['net']['dstIp']
+        appcounter = logline['packet']['app']['appcounter']
+        tx_asn     = logline['_asn']
+
+        # only log upstream packets
+        if dstIp != DAGROOT_IP:
+            return
+
+        # populate
+        assert mote_id in runstats
+        if appcounter not in runstats[mote_id]['upstream_pkts']:
+            runstats[mote_id]['upstream_num_tx'] += 1
+
+        runstats[mote_id]['upstream_pkts'][appcounter] = tx_asn
+
+    def _handle_app_rx(self, runstats, logline):
+        # packet reception
+
+        # shorthands
+        mote_id    = netaddr.IPAddress(logline['packet']['net']['srcIp']).words[-1]
+        dstIp      = logline['packet']['net']['dstIp']
+        hop_limit  = logline['packet']['net']['hop_limit']
+        appcounter = logline['packet']['app']['appcounter']
+        rx_asn     = logline['_asn']
+
+        # only log upstream packets
+        if dstIp != DAGROOT_IP:
+            return
+
+        # the packet is not in flight anymore; a duplicate of a packet which
+        # has been received already is ignored
+        tx_asn = runstats[mote_id]['upstream_pkts'].pop(appcounter, None)
+        if tx_asn is None:
+            return
+
+        runstats[mote_id]['upstream_num_rx'] += 1
+        runstats[mote_id]['latencies']       += [(rx_asn-tx_asn)*self.slot_duration]
+        runstats[mote_id]['hops']            += [d.IPV6_DEFAULT_HOP_LIMIT - hop_limit + 1]
+
+    def _handle_packet_dropped(self, runstats, logline):
+        # packet dropped
+
+        # shorthands
+        mote_id    = logline['_mote_id']
+        reason     = logline['reason']
+
+        # populate
+        if mote_id not in runstats:
+            runstats[mote_id] = {}
+        if 'packet_drops' not in runstats[mote_id]:
+            runstats[mote_id]['packet_drops'] = {}
+        if reason not in runstats[mote_id]['packet_drops']:
+            runstats[mote_id]['packet_drops'][reason] = 0
+
+        runstats[mote_id]['packet_drops'][reason] += self.drop_weight
+
+    def _handle_batt_charge(self, runstats, logline):
+        # battery charge
+
+        # shorthands
+        mote_id    = logline['_mote_id']
+        asn        = logline['_asn']
+        charge     = logline['charge']
+
+        # only log non-dagRoot charge
+        if mote_id == DAGROOT_ID:
+            return
+
+        # populate
+        if mote_id not in runstats:
+            runstats[mote_id] = {}
+        if 'charge' in runstats[mote_id]:
+            assert charge >= runstats[mote_id]['charge']
+
+        runstats[mote_id]['charge_asn'] = asn
+        runstats[mote_id]['charge']     = charge
+
+class KpiCollector(object):
+    """ Computes the KPIs of a run during the simulation, from the logs it
+    subscribes to, whatever the log policies are
+    """
+
+    def __init__(self):
+
+        # get singletons
+        self.settings    = SimSettings.SimSettings()
+
+        # local variables
+        self.accumulator = KpiAccumulator(self.settings.tsch_slotDuration)
+
+        # subscribe to the logs the KPIs are computed from
+        for simlog in get_kpi_logs():
+            SimLog.SimLog().subscribe(simlog, self.accumulator.add_log)
+
+    def write_kpi_file(self):
+        # the KPIs of the runs previously written in the same log file are
+        # kept; run_ids are keys of JSON objects, hence strings
+        kpi_file_path = get_kpi_file_path(self.settings.getOutputFile())
+        if os.path.exists(kpi_file_path):
+            with open(kpi_file_path, 'r') as f:
+                kpis = json.load(f)
+        else:
+            kpis = {}
+        kpis.update(json.loads(json.dumps(self.accumulator.get_kpis())))
+        with open(kpi_file_path, 'w') as f:
+            f.write(json.dumps(kpis, indent=4))
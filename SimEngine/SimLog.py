@@ -14,17 +14,39 @@ Usage:
 # ========================== imports =========================================
 
 import copy
+import gzip
+import itertools
 import json
+import os
+import struct
+import threading
 import traceback
+import Queue
+
+import numpy
 
 import SimSettings
 import SimEngine
 
 # =========================== defines =========================================
 
+# === log file formats
+LOG_FORMAT_JSON                   = 'json'   # one JSON object per line
+LOG_FORMAT_BINARY                 = 'binary' # see BinaryLogEncoder
+
+# === log file compression
+LOG_COMPRESSION_GZIP              = 'gzip'   # one gzip member per run
+GZIP_MAGIC                        = '\x1f\x8b'
+
+# lines handed over at once to the writer thread
+LOG_BATCH_SIZE                    = 1000
+# batches waiting to be written; log() blocks when the writer is this late
+LOG_QUEUE_SIZE                    = 16
+
 # === simulator
 LOG_SIMULATOR_STATE               = {'type': 'simulator.state',           'keys': ['state', 'name']}
 LOG_SIMULATOR_RANDOM_SEED         = {'type': 'simulator.random_seed',     'keys': ['value']}
+LOG_SIMULATOR_EVENT_STATS         = {'type': 'simulator.event_stats',     'keys': ['stats']}
 
 # === packet drops
 LOG_PACKET_DROPPED                = {'type': 'packet_dropped',            'keys': ['_mote_id','packet','reason']}
@@ -83,11 +105,117 @@ LOG_TSCH_BACKOFF_EXPONENT_UPDATED = {'type': 'tsch.be.updated',           'keys'
 # === batt
 LOG_BATT_CHARGE                   = {'type': 'batt.charge',               'keys': ['_mote_id','charge']}
 
+# === SimLog
+LOG_SIMLOG_COUNTERS               = {'type': 'simlog.counters',           'keys': ['log_type','window_start_asn','counts']}
+
 # === propagation
 LOG_PROP_TRANSMISSION             = {'type': 'prop.transmission',         'keys': ['channel','packet']}
 LOG_PROP_INTERFERENCE             = {'type': 'prop.interference',         'keys': ['_mote_id','channel','lockon_transmission','interfering_transmissions']}
 LOG_PROP_DROP_LOCKON              = {'type': 'prop.drop_lockon' ,         'keys': ['_mote_id','channel','lockon_transmission']}
 
+# all the logs defined above
+LOG_DEFINITIONS = [
+    value for (name, value) in sorted(globals().items())
+    if name.startswith('LOG_') and isinstance(value, dict)
+]
+
+# === log policies
+# the "logging" section of the configuration file is either 'all', a list of
+# the log types to write, or a policy per log type (the policy of the types
+# which are not listed being the one of 'default', 'all' if missing):
+# - 'all':               every log of that type is written
+# - 'off':               no log of that type is written
+# - {'sample': N}:       1 log in N is written (the first, the N+1th, etc.)
+# - {'window_s': S}:     logs are counted per mote over windows of S seconds,
+#                        each window being written as a LOG_SIMLOG_COUNTERS log
+LOG_POLICY_ALL           = 'all'
+LOG_POLICY_OFF           = 'off'
+LOG_POLICY_SAMPLE        = 'sample'
+LOG_POLICY_WINDOW        = 'window_s'
+LOG_POLICY_DEFAULT_KEY   = 'default'
+
+# === columnar log files
+# with "log_columnar", the logs of these types are also written in a columnar
+# file per type, see get_columnar_file_path(). A column is a field of the log,
+# nested fields being separated by '.', and its NumPy type. Missing fields are
+# written as -1, NaN, False or ''.
+COLUMNS_COMMON           = [
+    ('_run_id',                  '<i4'),
+    ('_asn',                     '<i8'),
+    ('_mote_id',                 '<i4'),
+]
+COLUMNS_PACKET           = [
+    ('packet.type',              'S16'),
+    ('packet.mac.srcMac',        'S23'),
+    ('packet.mac.dstMac',        'S23'),
+    ('packet.mac.retriesLeft',   '<i2'),
+    ('packet.net.srcIp',         'S39'),
+    ('packet.net.dstIp',         'S39'),
+    ('packet.net.hop_limit',     '<i2'),
+    ('packet.net.packet_length', '<i2'),
+    ('packet.app.appcounter',    '<i4'),
+]
+LOG_COLUMNS              = {
+    LOG_APP_TX['type']:      COLUMNS_COMMON + COLUMNS_PACKET,
+    LOG_APP_RX['type']:      COLUMNS_COMMON + COLUMNS_PACKET,
+    LOG_TSCH_TXDONE['type']: COLUMNS_COMMON + [
+        ('channel',                  '<i2'),
+        ('isACKed',                  '?'),
+    ] + COLUMNS_PACKET,
+    LOG_BATT_CHARGE['type']: COLUMNS_COMMON + [
+        ('charge',                   '<f8'),
+    ],
+}
+COLUMNAR_FILE_EXTENSION  = '.col'
+
+# ============================ helpers ========================================
+
+def _emit_nothing(content):
+    # emitter of the log types which are filtered out
+    pass
+
+def _sample_emitter(emit, num_logs):
+    # returns an emitter writing 1 log in num_logs
+    count = [0]
+    def emit_sample(content):
+        if count[0] == 0:
+            emit(content)
+        count[0] = (count[0] + 1) % num_logs
+    return emit_sample
+
+def _is_number(value, types):
+    # bool is a subclass of int, but true is not a number of logs
+    return isinstance(value, types) and not isinstance(value, bool)
+
+def _compile_row_getter(columns):
+    # returns a function building the row of a columnar file from a log
+    fields = []
+    for (name, type_str) in columns:
+        kind = numpy.dtype(type_str).kind
+        if   kind in 'iu':
+            default = -1
+        elif kind == 'f':
+            default = float('nan')
+        elif kind == 'b':
+            default = False
+        else:
+            default = ''
+        fields.append((name.split('.'), default))
+
+    def get_row(content):
+        row = []
+        for (path, default) in fields:
+            value = content
+            try:
+                for key in path:
+                    value = value[key]
+            except (KeyError, TypeError):
+                value = None
+            row.append(default if value is None else value)
+        return tuple(row)
+
+    return get_row
+
 # ============================ SimLog =========================================
 
 class SimLog(object):
@@ -120,20 +248,61 @@ class SimLog(object):
 
         # local variables
         self.log_filters = []
+        self.emitters    = {} # function writing a log, indexed by log type
+        self.subscribers = {} # functions called with the logs, indexed by log type
 
         # open log file
-        self.log_output_file = open(self.settings.getOutputFile(), 'a')
+        if   self.settings.log_format == LOG_FORMAT_JSON:
+            mode                 = 'a'
+            self.encode_line     = self._encode_json_line
+        elif self.settings.log_format == LOG_FORMAT_BINARY:
+            mode                 = 'ab'
+            self.encode_line     = BinaryLogEncoder().encode
+        else:
+            raise NotImplementedError(
+                'log_format "{0}" is not supported'.format(self.settings.log_format)
+            )
+        if   self.settings.log_compression is None:
+            self.log_output_file = open(self.settings.getOutputFile(), mode)
+        elif self.settings.log_compression == LOG_COMPRESSION_GZIP:
+            # each run appends a gzip member to the file; lines are compressed
+            # by the writer thread, which is the one calling write()
+            self.log_output_file = gzip.open(
+                self.settings.getOutputFile(),
+                'ab',
+                self.settings.log_compression_level
+            )
+        else:
+            raise NotImplementedError(
+                'log_compression "{0}" is not supported'.format(self.settings.log_compression)
+            )
 
-        # write config to log file; if a file with the same file name exists,
-        # append logs to the file. this happens if you multiple runs on the
-        # same CPU. And amend config line; config line in log file should have
-        # '_type' field. And 'run_id' type should be '_run_id'
-        config_line = copy.deepcopy(self.settings.__dict__)
-        config_line['_type']   = 'config'
-        config_line['_run_id'] = config_line['run_id']
-        del config_line['run_id']
-        json_string = json.dumps(config_line)
-        self.log_output_file.write(json_string + '\n')
+        # open the columnar files, and describe their columns next to them
+        self.columnar_files  = {} # (file, NumPy type), indexed by log type
+        if self.settings.log_columnar:
+            for (log_type, columns) in LOG_COLUMNS.items():
+                file_path = get_columnar_file_path(self.settings.getOutputFile(), log_type)
+                dtype     = numpy.dtype(columns)
+                with open(file_path + '.json', 'w') as f:
+                    json.dump({'type': log_type, 'dtype': dtype.descr}, f)
+                self.columnar_files[log_type] = (open(file_path, 'ab'), dtype)
+
+        # the config line is written with the log policies, see
+        # _write_config_line(); nothing is logged before that
+        self.config_line_written = False
+        self.log_counters        = [] # functions writing the pending counters
+
+        # lines are serialized by log(), then written by a separate thread
+        self.pending_lines   = []
+        self.pending_rows    = dict([(t, []) for t in self.columnar_files])
+        self.write_queue     = Queue.Queue(maxsize=LOG_QUEUE_SIZE)
+        self.writer_exc      = None
+        self.writer_thread   = threading.Thread(
+            target           = self._write_batches,
+            name             = 'SimLog writer'
+        )
+        self.writer_thread.daemon = True
+        self.writer_thread.start()
 
     def log(self, simlog, content):
         """
@@ -141,67 +310,622 @@ class SimLog(object):
         :param dict content:
         """
 
-        # ignore types that are not listed in the simulation config
-        if (self.log_filters != 'all') and (simlog['type'] not in self.log_filters):
-            return
-
-        # if a key is passed but is not listed in the log definition, raise error
-        if ("keys" in simlog) and (sorted(simlog["keys"]) != sorted(content.keys())):
-            raise Exception(
-                "Wrong keys passed to log() function for type {0}!\n    - expected {1}\n    - got      {2}".format(
-                    simlog['type'],
-                    sorted(simlog["keys"]),
-                    sorted(content.keys()),
-                )
-            )
+        # each log type has its own emitter, see _compile_emitter()
+        try:
+            emit = self.emitters[simlog['type']]
+        except KeyError:
+            emit = self._compile_emitter(simlog)
+        emit(content)
 
-        # update the log content
-        content.update(
-            {
-                "_asn":       self.engine.asn,
-                "_type":      simlog["type"],
-                "_run_id":    self.engine.run_id
-            }
-        )
+    def is_enabled(self, simlog):
+        """
+        Tell whether logs of a type are written, so that callers can skip
+        building the content of the logs which are filtered out.
 
-        # write line
+        :param dict simlog:
+        """
         try:
-            json_string = json.dumps(content, sort_keys=True)
-            self.log_output_file.write(json_string + '\n')
-        except Exception as err:
-            output  = []
-            output += ['----------------------']
-            output += ['']
-            output += ['log() FAILED for content']
-            output += [str(content)]
-            output += ['']
-            output += [str(err)]
-            output += ['']
-            output += [traceback.format_exc(err)]
-            output += ['']
-            output += ['----------------------']
-            output  = '\n'.join(output)
-            print output
-            raise
+            emit = self.emitters[simlog['type']]
+        except KeyError:
+            emit = self._compile_emitter(simlog)
+        return emit is not _emit_nothing
 
     def flush(self):
-        # flush the internal buffer, write data to the file
+        # wait for all the lines to be written, then flush the file buffer
         assert not self.log_output_file.closed
+        if not self.config_line_written:
+            self._write_config_line()
+        self._submit_pending_lines()
+        for log_type in self.pending_rows:
+            self._submit_pending_rows(log_type)
+        self.write_queue.join()
+        self._raise_writer_exc()
         self.log_output_file.flush()
+        for (columnar_file, _) in self.columnar_files.values():
+            columnar_file.flush()
 
     def set_simengine(self, engine):
         self.engine = engine
+        self._compile_emitters()
+
+    def subscribe(self, simlog, callback):
+        """
+        Have callback called with each log of a type, including the logs which
+        are not written because of the log policies. The log must not be
+        modified, nor kept.
+
+        :param dict simlog:
+        :param callback: function taking the log as argument
+        """
+        self.subscribers.setdefault(simlog['type'], []).append(callback)
+        self._compile_emitter(simlog)
 
     def set_log_filters(self, log_filters):
+        """
+        :param log_filters: 'all', list of log types, or log policies
+        """
         self.log_filters = log_filters
+        if not self.config_line_written:
+            self._write_config_line()
+        self._compile_emitters()
 
     def destroy(self):
-        # close log file
+        # stop the writer thread once it has written everything, close log file
         if not self.log_output_file.closed:
+            if not self.config_line_written:
+                self._write_config_line()
+            self._write_counters()
+            self._submit_pending_lines()
+            for log_type in self.pending_rows:
+                self._submit_pending_rows(log_type)
+            self.write_queue.put(None)
+            self.writer_thread.join()
             self.log_output_file.close()
+            for (columnar_file, _) in self.columnar_files.values():
+                columnar_file.close()
+            self._raise_writer_exc()
 
         cls = type(self)
         cls._instance       = None
         cls._init           = False
 
     # ============================== private ==================================
+
+    def _write_config_line(self):
+        # write config to log file; if a file with the same file name exists,
+        # append logs to the file. this happens if you multiple runs on the
+        # same CPU. And amend config line; config line in log file should have
+        # '_type' field. And 'run_id' type should be '_run_id'. The log
+        # policies are recorded, so that sampled logs can be re-weighted
+        config_line = copy.deepcopy(self.settings.__dict__)
+        config_line['_type']         = 'config'
+        config_line['_run_id']       = config_line['run_id']
+        config_line['_log_policies'] = self.log_filters
+        del config_line['run_id']
+        if self.settings.log_format == LOG_FORMAT_JSON:
+            self.log_output_file.write(json.dumps(config_line) + '\n')
+        else:
+            self.log_output_file.write(self.encode_line(config_line))
+        self.config_line_written = True
+
+    def _compile_emitters(self):
+        # compile the emitters of the logs defined in this module; emitters of
+        # other log types are compiled when first used
+        self._write_counters()
+        self.emitters     = {}
+        self.log_counters = []
+        for simlog in LOG_DEFINITIONS:
+            self._compile_emitter(simlog)
+
+    def _compile_emitter(self, simlog):
+        log_type = simlog['type']
+        policy   = get_log_policy(self.log_filters, log_type)
+
+        if   policy == LOG_POLICY_OFF:
+            # ignore types that are not listed in the simulation config
+            emit = _emit_nothing
+        elif policy == LOG_POLICY_ALL:
+            emit = self._create_emitter(simlog)
+        elif LOG_POLICY_SAMPLE in policy:
+            emit = _sample_emitter(
+                self._create_emitter(simlog),
+                policy[LOG_POLICY_SAMPLE]
+            )
+        else:
+            emit = self._create_counter(simlog, policy[LOG_POLICY_WINDOW])
+
+        # subscribers get all the logs, whether they are written or not
+        if log_type in self.subscribers:
+            emit = self._notify_emitter(simlog, emit, self.subscribers[log_type])
+
+        self.emitters[log_type] = emit
+        return emit
+
+    def _notify_emitter(self, simlog, emit, callbacks):
+        # returns an emitter also calling callbacks with the log
+        log_type = simlog['type']
+        engine   = self.engine
+
+        def emit_and_notify(content):
+            emit(content)
+            content['_asn']    = engine.asn
+            content['_type']   = log_type
+            content['_run_id'] = engine.run_id
+            for callback in callbacks:
+                callback(content)
+
+        return emit_and_notify
+
+    def _create_counter(self, simlog, window_s):
+        # returns an emitter counting the logs per mote, over windows of
+        # window_s seconds
+        log_type      = simlog['type']
+        engine        = self.engine
+        window_length = max(1, int(round(window_s / self.settings.tsch_slotDuration)))
+        emit_counters = self._create_emitter(LOG_SIMLOG_COUNTERS)
+        window        = {'start_asn': None, 'counts': {}}
+
+        def write_counters():
+            if window['counts']:
+                emit_counters(
+                    {
+                        'log_type':         log_type,
+                        'window_start_asn': window['start_asn'],
+                        'counts':           sorted(window['counts'].items()),
+                    }
+                )
+                window['counts'] = {}
+
+        def count(content):
+            start_asn = engine.asn - (engine.asn % window_length)
+            if start_asn != window['start_asn']:
+                write_counters()
+                window['start_asn'] = start_asn
+            mote_id = content.get('_mote_id')
+            window['counts'][mote_id] = window['counts'].get(mote_id, 0) + 1
+
+        self.log_counters.append(write_counters)
+        return count
+
+    def _write_counters(self):
+        # write the counters of the current windows
+        for write_counters in self.log_counters:
+            write_counters()
+
+    def _create_emitter(self, simlog):
+        # local shorthands, bound once for all the logs of that type
+        log_type    = simlog['type']
+        engine      = self.engine
+        encode_line = self.encode_line
+        if self.settings.log_strict and ('keys' in simlog):
+            expected_keys = sorted(simlog['keys'])
+        else:
+            expected_keys = None
+        if log_type in self.columnar_files:
+            get_row = _compile_row_getter(LOG_COLUMNS[log_type])
+        else:
+            get_row = None
+
+        def emit(content):
+
+            # if a key is passed but is not listed in the log definition, raise error
+            if (expected_keys is not None) and (expected_keys != sorted(content.keys())):
+                raise Exception(
+                    "Wrong keys passed to log() function for type {0}!\n    - expected {1}\n    - got      {2}".format(
+                        log_type,
+                        expected_keys,
+                        sorted(content.keys()),
+                    )
+                )
+
+            # update the log content
+            content['_asn']    = engine.asn
+            content['_type']   = log_type
+            content['_run_id'] = engine.run_id
+
+            # serialize line now, content may be modified after this call
+            try:
+                line = encode_line(content)
+            except Exception as err:
+                self._print_log_failure(content, err)
+                raise
+
+            # hand the line over to the writer thread
+            pending_lines = self.pending_lines
+            pending_lines.append(line)
+            if len(pending_lines) >= LOG_BATCH_SIZE:
+                self._raise_writer_exc()
+                self._submit_pending_lines()
+
+            # same for the row of the columnar file
+            if get_row is not None:
+                pending_rows = self.pending_rows[log_type]
+                pending_rows.append(get_row(content))
+                if len(pending_rows) >= LOG_BATCH_SIZE:
+                    self._submit_pending_rows(log_type)
+
+        return emit
+
+    @staticmethod
+    def _print_log_failure(content, err):
+        output  = []
+        output += ['----------------------']
+        output += ['']
+        output += ['log() FAILED for content']
+        output += [str(content)]
+        output += ['']
+        output += [str(err)]
+        output += ['']
+        output += [traceback.format_exc(err)]
+        output += ['']
+        output += ['----------------------']
+        output  = '\n'.join(output)
+        print output
+
+    @staticmethod
+    def _encode_json_line(content):
+        return json.dumps(content, sort_keys=True) + '\n'
+
+    def _submit_pending_lines(self):
+        if self.pending_lines:
+            self.write_queue.put((self.log_output_file, None, self.pending_lines))
+            self.pending_lines = []
+
+    def _submit_pending_rows(self, log_type):
+        if self.pending_rows[log_type]:
+            (columnar_file, dtype) = self.columnar_files[log_type]
+            self.write_queue.put((columnar_file, dtype, self.pending_rows[log_type]))
+            self.pending_rows[log_type] = []
+
+    def _write_batches(self):
+        # runs in the writer thread; a batch is either lines, or rows of a
+        # columnar file when dtype is given
+        while True:
+            item = self.write_queue.get()
+            try:
+                if item is None:
+                    # destroy() was called
+                    return
+                (output_file, dtype, batch) = item
+                if self.writer_exc is None:
+                    if dtype is None:
+                        output_file.write(''.join(batch))
+                    else:
+                        output_file.write(numpy.array(batch, dtype=dtype).tostring())
+            except Exception as err:
+                # raised in the simulation thread by log(), flush() and
+                # destroy(); nothing more gets written
+                self.writer_exc = err
+            finally:
+                self.write_queue.task_done()
+
+    def _raise_writer_exc(self):
+        if self.writer_exc is not None:
+            raise self.writer_exc
+
+# ========================== log file formats =================================
+
+# A JSON log file has one log per line. When reading logs of some types only,
+# the type of a line is found after JSON_TYPE_MARKER, without decoding it.
+
+JSON_TYPE_MARKER      = '"_type": "'
+
+# A binary log file is a sequence of segments, one per SimLog instance (i.e. per
+# run), which can be concatenated. A segment starts with BINARY_LOG_MAGIC,
+# followed by records: a record type (one byte), the length of the record body
+# (varint), and the body:
+# - BINARY_RECORD_STRING: a UTF-8 string, which is given the next index of the
+#   string table of the segment. Strings (log types, keys, addresses, etc.)
+#   are written once per segment, then referred to by their index
+# - BINARY_RECORD_LOG: the index of the log type (varint), then the log
+#   content, without '_type', as a dict
+# Values start with a tag; integers (ASNs, mote ids, ...) are zigzag varints.
+
+BINARY_LOG_MAGIC      = '\x89SIMLOG\x01'
+BINARY_RECORD_STRING  = 0x00
+BINARY_RECORD_LOG     = 0x01
+BINARY_TAG_NONE       = 0x00
+BINARY_TAG_TRUE       = 0x01
+BINARY_TAG_FALSE      = 0x02
+BINARY_TAG_INT        = 0x03
+BINARY_TAG_FLOAT      = 0x04
+BINARY_TAG_STRING     = 0x05
+BINARY_TAG_LIST       = 0x06
+BINARY_TAG_DICT       = 0x07
+BINARY_READ_SIZE      = 1024 * 1024
+
+class BinaryLogEncoder(object):
+    """ Encode logs in the binary log format
+
+    A config log starts a new segment.
+    """
+
+    def __init__(self):
+        self.strings = None # index in the string table, indexed by string
+
+    def encode(self, content):
+        output = bytearray()
+        if (self.strings is None) or (content['_type'] == 'config'):
+            output.extend(BINARY_LOG_MAGIC)
+            self.strings = {}
+
+        body = bytearray()
+        _write_varint(body, self._intern(output, content['_type']))
+        self._write_dict(output, body, content, skip_key='_type')
+
+        output.append(BINARY_RECORD_LOG)
+        _write_varint(output, len(body))
+        output.extend(body)
+        return str(output)
+
+    # ======================= private =========================================
+
+    def _intern(self, output, string):
+        index = self.strings.get(string)
+        if index is None:
+            index = len(self.strings)
+            self.strings[string] = index
+            if isinstance(string, unicode):
+                string = string.encode('utf-8')
+            output.append(BINARY_RECORD_STRING)
+            _write_varint(output, len(string))
+            output.extend(string)
+        return index
+
+    def _write_dict(self, output, body, value, skip_key=None):
+        items = [(k, v) for (k, v) in value.iteritems() if k != skip_key]
+        body.append(BINARY_TAG_DICT)
+        _write_varint(body, len(items))
+        for (k, v) in items:
+            if not isinstance(k, basestring):
+                # same as JSON, which has only string keys
+                k = json.dumps(k)
+            _write_varint(body, self._intern(output, k))
+            self._write_value(output, body, v)
+
+    def _write_value(self, output, body, value):
+        if   value is None:
+            body.append(BINARY_TAG_NONE)
+        elif value is True:
+            body.append(BINARY_TAG_TRUE)
+        elif value is False:
+            body.append(BINARY_TAG_FALSE)
+        elif isinstance(value, (int, long)):
+            body.append(BINARY_TAG_INT)
+            _write_varint(body, (value << 1) if value >= 0 else ((-value << 1) - 1))
+        elif isinstance(value, float):
+            body.append(BINARY_TAG_FLOAT)
+            body.extend(struct.pack('<d', value))
+        elif isinstance(value, basestring):
+            body.append(BINARY_TAG_STRING)
+            _write_varint(body, self._intern(output, value))
+        elif isinstance(value, (list, tuple)):
+            body.append(BINARY_TAG_LIST)
+            _write_varint(body, len(value))
+            for v in value:
+                self._write_value(output, body, v)
+        elif isinstance(value, dict):
+            self._write_dict(output, body, value)
+        else:
+            raise TypeError('{0!r} cannot be written in a binary log'.format(value))
+
+def read_logs(log_file, types=None):
+    """ Iterate over the logs of a log file, whatever its format
+
+    :param file log_file: log file opened in binary mode, at its beginning or
+        at the beginning of a run
+    :param types: if given, only logs of these types are returned
+    """
+    if types is not None:
+        types = set(types)
+
+    log_file = decompress_log_file(log_file)
+    head = log_file.read(len(BINARY_LOG_MAGIC))
+    if head == BINARY_LOG_MAGIC:
+        logs = _read_binary_logs(log_file, types)
+    else:
+        logs = _read_json_logs(head + log_file.readline(), log_file, types)
+
+    for log in logs:
+        yield log
+
+def get_log_policy(log_filters, log_type):
+    """ Return the policy of a log type, see LOG_POLICY_ALL
+
+    :param log_filters: the "logging" section of the configuration file
+    :param str log_type:
+    """
+    if   log_filters == LOG_POLICY_ALL:
+        return LOG_POLICY_ALL
+    elif isinstance(log_filters, dict):
+        policy = log_filters.get(
+            log_type,
+            log_filters.get(LOG_POLICY_DEFAULT_KEY, LOG_POLICY_ALL)
+        )
+    elif log_type in log_filters:
+        return LOG_POLICY_ALL
+    else:
+        return LOG_POLICY_OFF
+
+    if (
+            (policy in [LOG_POLICY_ALL, LOG_POLICY_OFF])
+            or
+            (
+                isinstance(policy, dict) and policy.keys() == [LOG_POLICY_SAMPLE]
+                and
+                _is_number(policy[LOG_POLICY_SAMPLE], (int, long)) and policy[LOG_POLICY_SAMPLE] >= 1
+            )
+            or
+            (
+                isinstance(policy, dict) and policy.keys() == [LOG_POLICY_WINDOW]
+                and
+                _is_number(policy[LOG_POLICY_WINDOW], (int, long, float)) and policy[LOG_POLICY_WINDOW] > 0
+            )
+        ):
+        return policy
+    else:
+        raise NotImplementedError(
+            'log policy {0} of "{1}" is not supported'.format(policy, log_type)
+        )
+
+def get_log_sampling(config_line, log_type):
+    """ Return N when 1 log in N of a type was written, 1 when all were
+
+    :param dict config_line: first line of a run in a log file
+    :param str log_type:
+    """
+    policy = get_log_policy(config_line.get('_log_policies', LOG_POLICY_ALL), log_type)
+    if isinstance(policy, dict) and (LOG_POLICY_SAMPLE in policy):
+        return policy[LOG_POLICY_SAMPLE]
+    else:
+        return 1
+
+def get_columnar_file_path(log_file_path, log_type):
+    """ Return the path of the columnar file of a log type, next to a log file
+
+    The columnar file is a sequence of rows of the NumPy type described in
+    the JSON file having the same path, plus '.json'.
+    """
+    return '{0}.{1}{2}'.format(
+        os.path.splitext(log_file_path)[0],
+        log_type,
+        COLUMNAR_FILE_EXTENSION
+    )
+
+def read_columnar_file(file_path):
+    """ Return the rows of a columnar file, as a read-only memory-mapped
+    NumPy structured array
+    """
+    with open(file_path + '.json', 'r') as f:
+        dtype = numpy.dtype(
+            [(str(name), str(type_str)) for (name, type_str) in json.load(f)['dtype']]
+        )
+    if os.path.getsize(file_path) == 0:
+        # an empty file cannot be memory-mapped
+        return numpy.zeros(0, dtype=dtype)
+    return numpy.memmap(file_path, dtype=dtype, mode='r')
+
+def decompress_log_file(log_file):
+    """ Return a file reading the decompressed log file if it is compressed,
+    the log file otherwise
+
+    :param file log_file: log file opened in binary mode, at the beginning of
+        a run
+    """
+    start = log_file.tell()
+    head  = log_file.read(len(GZIP_MAGIC))
+    log_file.seek(start)
+    if head == GZIP_MAGIC:
+        # members of all the runs are read one after the other
+        return gzip.GzipFile(fileobj=log_file, mode='rb')
+    else:
+        return log_file
+
+def _read_json_logs(first_line, log_file, types):
+    if not first_line:
+        # empty file
+        return
+    for line in itertools.chain([first_line], log_file):
+        if types is not None:
+            start = line.find(JSON_TYPE_MARKER)
+            if start >= 0:
+                start += len(JSON_TYPE_MARKER)
+                if line[start:line.find('"', start)] not in types:
+                    continue
+        log = json.loads(line)
+        if (types is None) or (log['_type'] in types):
+            yield log
+
+def _read_binary_logs(log_file, types):
+    # the segment magic has been read already
+    strings = []
+    data    = bytearray()
+    pos     = 0
+    while True:
+        # make sure the record header is in data
+        if len(data) - pos < 16:
+            data = data[pos:] + bytearray(log_file.read(BINARY_READ_SIZE))
+            pos  = 0
+            if not data:
+                return
+
+        # a new segment
+        if data[pos] == ord(BINARY_LOG_MAGIC[0]):
+            assert data[pos:pos + len(BINARY_LOG_MAGIC)] == BINARY_LOG_MAGIC
+            pos    += len(BINARY_LOG_MAGIC)
+            strings = []
+            continue
+
+        record_type  = data[pos]
+        (length, pos) = _read_varint(data, pos + 1)
+        if len(data) - pos < length:
+            data = data[pos:] + bytearray(log_file.read(max(length, BINARY_READ_SIZE)))
+            pos  = 0
+            if len(data) < length:
+                raise ValueError('truncated binary log file')
+        end = pos + length
+
+        if   record_type == BINARY_RECORD_STRING:
+            strings.append(data[pos:end].decode('utf-8'))
+        elif record_type == BINARY_RECORD_LOG:
+            (type_index, pos) = _read_varint(data, pos)
+            log_type = strings[type_index]
+            if (types is None) or (log_type in types):
+                (log, _) = _read_value(data, pos, strings)
+                log['_type'] = log_type
+                yield log
+        else:
+            raise ValueError('unknown record type {0}'.format(record_type))
+        pos = end
+
+def _write_varint(output, value):
+    while value >= 0x80:
+        output.append((value & 0x7f) | 0x80)
+        value >>= 7
+    output.append(value)
+
+def _read_varint(data, pos):
+    value = 0
+    shift = 0
+    while True:
+        byte   = data[pos]
+        pos   += 1
+        value |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return (value, pos)
+        shift += 7
+
+def _read_value(data, pos, strings):
+    tag  = data[pos]
+    pos += 1
+    if   tag == BINARY_TAG_NONE:
+        return (None, pos)
+    elif tag == BINARY_TAG_TRUE:
+        return (True, pos)
+    elif tag == BINARY_TAG_FALSE:
+        return (False, pos)
+    elif tag == BINARY_TAG_INT:
+        (value, pos) = _read_varint(data, pos)
+        return ((value >> 1) if not (value & 1) else -((value + 1) >> 1), pos)
+    elif tag == BINARY_TAG_FLOAT:
+        return (struct.unpack_from('<d', data, pos)[0], pos + 8)
+    elif tag == BINARY_TAG_STRING:
+        (index, pos) = _read_varint(data, pos)
+        return (strings[index], pos)
+    elif tag == BINARY_TAG_LIST:
+        (length, pos) = _read_varint(data, pos)
+        value = []
+        for _ in xrange(length):
+            (v, pos) = _read_value(data, pos, strings)
+            value.append(v)
+        return (value, pos)
+    elif tag == BINARY_TAG_DICT:
+        (length, pos) = _read_varint(data, pos)
+        value = {}
+        for _ in xrange(length):
+            (index, pos) = _read_varint(data, pos)
+            (v, pos)     = _read_value(data, pos, strings)
+            value[strings[index]] = v
+        return (value, pos)
+    else:
+        raise ValueError('unknown value tag {0}'.format(tag))
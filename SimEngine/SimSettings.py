@@ -47,6 +47,7 @@ class SimSettings(object):
         # store params
         self.cpuID                          = cpuID
         self.run_id                         = run_id
+        self.outputFileName                 = None
 
         self.__dict__.update(kwargs)
 
@@ -56,6 +57,10 @@ class SimSettings(object):
     def setCombinationKeys(self, combinationKeys):
         self.combinationKeys = combinationKeys
 
+    def setOutputFileName(self, output_file_name):
+        # the name of the output file, rather than the one of the CPU
+        self.outputFileName  = output_file_name
+
     def getOutputFile(self):
         # directory
         dirname   = os.path.join(
@@ -81,7 +86,9 @@ class SimSettings(object):
                     raise
 
         # file
-        if self.cpuID is None:
+        if self.outputFileName is not None:
+            tempname         = self.outputFileName
+        elif self.cpuID is None:
             tempname         = 'output.dat'
         else:
             tempname         = 'output_cpu{0}.dat'.format(self.cpuID)
@@ -0,0 +1,98 @@
+#!/usr/bin/python
+"""
+Compiles the K7 connectivity traces used by a configuration file into binary
+files, one per field of the updates, which simulations having
+"conn_trace_cache" set memory-map instead of parsing the traces. They are
+written in "conn_trace_cache_dir" if set, next to the traces otherwise.
+
+Example:
+    python compileK7.py --config config.json
+"""
+
+# =========================== adjust path =====================================
+
+import os
+import sys
+
+if __name__ == '__main__':
+    here = sys.path[0]
+    sys.path.insert(0, os.path.join(here, '..'))
+
+# =========================== imports =========================================
+
+import argparse
+import itertools
+import json
+
+from SimEngine import Connectivity
+
+# =========================== helpers =========================================
+
+def parseCliParams():
+
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument(
+        '--config',
+        dest       = 'config',
+        action     = 'store',
+        default    = 'config.json',
+        help       = 'Location of the configuration file.',
+    )
+    parser.add_argument(
+        'traces',
+        nargs      = '*',
+        help       = 'K7 traces to compile, instead of the one of the configuration file.',
+    )
+    cliparams      = parser.parse_args()
+    return cliparams.__dict__
+
+def get_setting_values(settings, key):
+    # a setting is either regular, or a list of values to combine
+    if key in settings['combination']:
+        return settings['combination'][key]
+    else:
+        return [settings['regular'][key]]
+
+# =========================== main ============================================
+
+def main():
+    # cli params
+    cliparams = parseCliParams()
+
+    with open(cliparams['config'], 'r') as f:
+        settings = json.load(f)['settings']
+
+    if cliparams['traces']:
+        traces = cliparams['traces']
+    else:
+        traces = [
+            trace for trace in get_setting_values(settings, 'conn_trace')
+            if trace is not None
+        ]
+    if not traces:
+        print 'No K7 trace to compile in {0}'.format(cliparams['config'])
+        exit(0)
+
+    # compile each trace for each combination of the settings it depends on
+    for (trace, slot_duration, num_chans, cache_dir) in itertools.product(
+            traces,
+            get_setting_values(settings, 'tsch_slotDuration'),
+            get_setting_values(settings, 'phy_numChans'),
+            get_setting_values(settings, 'conn_trace_cache_dir'),
+        ):
+        cache_path = Connectivity.compile_k7_trace(
+            trace,
+            slot_duration,
+            num_chans,
+            cache_dir
+        )
+        print '{0} (tsch_slotDuration={1}, phy_numChans={2}) -> {3}'.format(
+            trace,
+            slot_duration,
+            num_chans,
+            cache_path
+        )
+
+if __name__ == '__main__':
+    main()
@@ -3,238 +3,345 @@
 import os
 import sys
 
-import netaddr
-
 if __name__ == '__main__':
     here = sys.path[0]
     sys.path.insert(0, os.path.join(here, '..'))
 
 # ========================== imports ==========================================
 
+import argparse
+import hashlib
+import heapq
 import json
 import glob
+import multiprocessing
 
 from SimEngine import SimLog
-import SimEngine.Mote.MoteDefines as d
+from SimEngine import SimKpi
 
 # =========================== defines =========================================
 
-DAGROOT_ID = 0  # we assume first mote is DAGRoot
-DAGROOT_IP = 'fd00::1:0'
+# the config lines start the runs, the simulator.state logs end them, the KPIs
+# are computed from the other logs
+KPI_LOG_TYPES = (
+    ['config', SimLog.LOG_SIMULATOR_STATE['type']] +
+    [simlog['type'] for simlog in SimKpi.get_kpi_logs()]
+)
+RUN_END_STATES = ['stopped', 'crash']
+
+# the logs of these types are read from the columnar files of a log file when
+# its runs were written with log_columnar; the upstream packets only are read,
+# see SimKpi.KpiAccumulator
+COLUMNAR_KPI_LOG_TYPES = [
+    SimLog.LOG_APP_TX['type'],
+    SimLog.LOG_APP_RX['type'],
+    SimLog.LOG_BATT_CHARGE['type'],
+]
+
+# the checkpoint of a log file is valid for the log file it was written for,
+# or for that file with more runs appended, which is told by the digest of the
+# end of the file when the checkpoint was written
+CHECKPOINT_DIGEST_SIZE = 4096
 
 # =========================== decorators ======================================
 
 def openfile(func):
     def inner(inputfile):
-        with open(inputfile, 'r') as f:
+        with open(inputfile, 'rb') as f:
             return func(f)
     return inner
 
 # =========================== helpers =========================================
 
-@openfile
-def kpis_all(inputfile):
-
-    allstats = {} # indexed by run_id, mote_id
-
-    file_settings = json.loads(inputfile.readline())  # first line contains settings
-
-    # === gather raw stats
-
-    for line in inputfile:
-        logline = json.loads(line)
-
-        # shorthands
-        run_id = logline['_run_id']
-
-        # populate
-        if run_id not in allstats:
-            allstats[run_id] = {}
-
-        if   logline['_type'] == SimLog.LOG_TSCH_SYNCED['type']:
-            # sync'ed
-
-            # shorthands
-            mote_id    = logline['_mote_id']
-            asn        = logline['_asn']
-
-            # only log non-dagRoot sync times
-            if mote_id == DAGROOT_ID:
-                continue
-
-            # populate
-            if mote_id not in allstats[run_id]:
-                allstats[run_id][mote_id] = {}
-
-            allstats[run_id][mote_id]['sync_asn']  = asn
-            allstats[run_id][mote_id]['sync_time_s'] = asn*file_settings['tsch_slotDuration']
-
-        elif logline['_type'] == SimLog.LOG_SECJOIN_JOINED['type']:
-            # joined
-
-            # shorthands
-            mote_id    = logline['_mote_id']
-            asn        = logline['_asn']
-
-            # only log non-dagRoot join times
-            if mote_id == DAGROOT_ID:
-                continue
-
-            # populate
-            assert mote_id in allstats[run_id]
+def parseCliParams():
 
-            allstats[run_id][mote_id]['join_asn']  = asn
-            allstats[run_id][mote_id]['join_time_s'] = asn*file_settings['tsch_slotDuration']
-            allstats[run_id][mote_id]['upstream_pkts'] = {}
+    parser = argparse.ArgumentParser()
 
-        elif logline['_type'] == SimLog.LOG_APP_TX['type']:
-            # packet transmission
-
-            # shorthands
-            mote_id    = logline['_mote_id']
-            dstIp      = logline['packet']['net']['dstIp']
-            appcounter = logline['packet']['app']['appcounter']
-            tx_asn     = logline['_asn']
-
-            # only log upstream packets
-            if dstIp != DAGROOT_IP:
-                continue
-
-            # populate
-            assert mote_id in allstats[run_id]
-            if appcounter not in allstats[run_id][mote_id]['upstream_pkts']:
-                allstats[run_id][mote_id]['upstream_pkts'][appcounter] = {
-                    'hops': 0,
-                }
-
-            allstats[run_id][mote_id]['upstream_pkts'][appcounter]['tx_asn'] = tx_asn
-
-        elif logline['_type'] == SimLog.LOG_APP_RX['type']:
-            # packet reception
-
-            # shorthands
-            mote_id    = netaddr.IPAddress(logline['packet']['net']['srcIp']).words[-1]
-            dstIp      = logline['packet']['net']['dstIp']
-            hop_limit  = logline['packet']['net']['hop_limit']
-            appcounter = logline['packet']['app']['appcounter']
-            rx_asn     = logline['_asn']
-
-            # only log upstream packets
-            if dstIp != DAGROOT_IP:
+    parser.add_argument(
+        '--cpus',
+        dest       = 'numCPUs',
+        type       = int,
+        default    = multiprocessing.cpu_count(),
+        help       = 'Number of processes the log files are shared among.',
+    )
+    cliparams      = parser.parse_args()
+    return cliparams.__dict__
+
+def get_checkpoint_file_path(inputfile):
+    return '{0}.checkpoint'.format(SimKpi.get_kpi_file_path(inputfile))
+
+def get_digest(f, end):
+    # digest of the bytes of a file before end
+    f.seek(max(end - CHECKPOINT_DIGEST_SIZE, 0))
+    return hashlib.md5(f.read(end - f.tell())).hexdigest()
+
+def read_checkpoint(inputfile):
+    """ Return the checkpoint of a log file: the KPIs of its first runs, and
+    the offset the next runs start at
+
+    The checkpoint is discarded when the log file has been rewritten.
+    """
+    checkpoint = {'offset': 0, 'kpis': {}}
+    try:
+        with open(get_checkpoint_file_path(inputfile), 'r') as f:
+            saved = json.load(f)
+    except (IOError, ValueError):
+        return checkpoint
+
+    size  = os.path.getsize(inputfile)
+    mtime = os.path.getmtime(inputfile)
+    if (saved['size'], saved['mtime']) == (size, mtime):
+        # unchanged
+        return saved
+    elif size > saved['size']:
+        with open(inputfile, 'rb') as f:
+            if get_digest(f, saved['size']) == saved['digest']:
+                # runs were appended
+                return saved
+    return checkpoint
+
+def write_checkpoint(inputfile, checkpoint):
+    with open(inputfile, 'rb') as f:
+        checkpoint['size']   = os.path.getsize(inputfile)
+        checkpoint['mtime']  = os.path.getmtime(inputfile)
+        checkpoint['digest'] = get_digest(f, checkpoint['size'])
+    with open(get_checkpoint_file_path(inputfile), 'w') as f:
+        json.dump(checkpoint, f)
+
+def get_shards(inputfile, start=0):
+    """ Return the parts of a log file, from start, which KPIs can be computed
+    separately, as (inputfile, start, end, one_run) tuples
+
+    Each run of a JSON log file is a part, starting at its config line; the
+    runs of a binary or compressed log file are a single part.
+    """
+    with open(inputfile, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        end = f.tell()
+        if start == end:
+            return []
+
+        f.seek(start)
+        head = f.read(len(SimLog.BINARY_LOG_MAGIC))
+        if (
+                (head == SimLog.BINARY_LOG_MAGIC)
+                or
+                head.startswith(SimLog.GZIP_MAGIC)
+            ):
+            return [(inputfile, start, end, False)]
+
+        # lines are not decoded, the config lines are found by their type
+        config_marker = '{0}config"'.format(SimLog.JSON_TYPE_MARKER)
+        starts = []
+        f.seek(start)
+        for line in f:
+            if config_marker in line:
+                starts += [start]
+            start += len(line)
+        return [
+            (inputfile, run_start, run_end, True)
+            for (run_start, run_end) in zip(starts, starts[1:] + [start])
+        ]
+
+def read_columnar_kpi_rows(inputfile):
+    """ Return the rows of the columnar files of a log file, indexed by log
+    type, None if it has not all the columnar files of the KPIs
+    """
+    rows = {}
+    for log_type in COLUMNAR_KPI_LOG_TYPES:
+        file_path = SimLog.get_columnar_file_path(inputfile, log_type)
+        if not os.path.exists(file_path):
+            return None
+        rows[log_type] = SimLog.read_columnar_file(file_path)
+    return rows
+
+def get_columnar_logs(columnar_rows, run_id):
+    """ Return the logs of a run rebuilt from the rows of the columnar files,
+    as an iterator of (asn, rank, index, log) per log type
+
+    Only the fields the KPIs are computed from are rebuilt. The logs of a type
+    are in the order they were written; at the same ASN, they come after the
+    logs of the previous types.
+    """
+
+    # the missing run_id of the columnar files
+    row_run_id = -1 if run_id is None else run_id
+
+    def get_logs(rank, log_type, get_log, upstream):
+        rows = columnar_rows[log_type]
+        mask = rows['_run_id'] == row_run_id
+        if upstream:
+            mask &= rows['packet.net.dstIp'] == SimKpi.DAGROOT_IP
+        rows = rows[mask]
+        columns = dict([(name, rows[name].tolist()) for name in rows.dtype.names])
+        for i in range(len(rows)):
+            yield (columns['_asn'][i], rank, i, get_log(log_type, columns, i))
+
+    def get_packet_log(log_type, columns, i):
+        return {
+            '_type':    log_type,
+            '_run_id':  run_id,
+            '_asn':     columns['_asn'][i],
+            '_mote_id': columns['_mote_id'][i],
+            'packet':   {
+                'net': {
+                    'srcIp':     columns['packet.net.srcIp'][i],
+                    'dstIp':     columns['packet.net.dstIp'][i],
+                    'hop_limit': columns['packet.net.hop_limit'][i],
+                },
+                'app': {
+                    'appcounter': columns['packet.app.appcounter'][i],
+                },
+            },
+        }
+
+    def get_charge_log(log_type, columns, i):
+        return {
+            '_type':    log_type,
+            '_run_id':  run_id,
+            '_asn':     columns['_asn'][i],
+            '_mote_id': columns['_mote_id'][i],
+            'charge':   columns['charge'][i],
+        }
+
+    return [
+        get_logs(1, SimLog.LOG_APP_TX['type'],     get_packet_log, True),
+        get_logs(2, SimLog.LOG_APP_RX['type'],     get_packet_log, True),
+        get_logs(3, SimLog.LOG_BATT_CHARGE['type'], get_charge_log, False),
+    ]
+
+def kpis_shard(shard, columnar=True):
+    """ Return the KPIs of the runs of a part of a log file, indexed by run_id
+    and mote_id, and whether its last run has ended
+
+    When the log file has its columnar files, the logs they have are read
+    from them rather than from the log file, unless columnar is False.
+    """
+
+    (inputfile, start, _, one_run) = shard
+
+    columnar_rows = read_columnar_kpi_rows(inputfile) if columnar else None
+    if columnar_rows is None:
+        log_types = KPI_LOG_TYPES
+    else:
+        log_types = [t for t in KPI_LOG_TYPES if t not in COLUMNAR_KPI_LOG_TYPES]
+
+    kpis        = {}
+    accumulator = None
+    run_id      = None
+    run_logs    = None # logs of the run, merged with the columnar ones
+    ended       = False
+
+    def get_run_kpis():
+        if run_logs is not None:
+            # the logs of a run are in the order of their ASN
+            for (_, _, _, logline) in heapq.merge(
+                    [(l['_asn'], 0, i, l) for (i, l) in enumerate(run_logs)],
+                    *get_columnar_logs(columnar_rows, run_id)
+                ):
+                accumulator.add_log(logline)
+        return accumulator.get_kpis()
+
+    with open(inputfile, 'rb') as f:
+        f.seek(start)
+        for logline in SimLog.read_logs(f, types=log_types):
+            if logline['_type'] == SimLog.LOG_SIMULATOR_STATE['type']:
+                ended = logline['state'] in RUN_END_STATES
                 continue
 
-            allstats[run_id][mote_id]['upstream_pkts'][appcounter]['hops']   = (
-                d.IPV6_DEFAULT_HOP_LIMIT - hop_limit + 1
-            )
-            allstats[run_id][mote_id]['upstream_pkts'][appcounter]['rx_asn'] = rx_asn
-
-        elif logline['_type'] == SimLog.LOG_PACKET_DROPPED['type']:
-            # packet dropped
-
-            # shorthands
-            mote_id    = logline['_mote_id']
-            reason     = logline['reason']
-
-            # populate
-            if mote_id not in allstats[run_id]:
-                allstats[run_id][mote_id] = {}
-            if 'packet_drops' not in allstats[run_id][mote_id]:
-                allstats[run_id][mote_id]['packet_drops'] = {}
-            if reason not in allstats[run_id][mote_id]['packet_drops']:
-                allstats[run_id][mote_id]['packet_drops'][reason] = 0
+            if logline['_type'] == 'config':
+                # a run ends, another starts
+                ended = False
+                if accumulator is not None:
+                    kpis.update(get_run_kpis())
+                    accumulator = None
+                    if one_run:
+                        ended = True
+                        break
+
+                if (columnar_rows is not None) and (not logline.get('log_columnar')):
+                    # the columnar files do not have the logs of this run
+                    return kpis_shard(shard, columnar=False)
+
+                # each packet_dropped log stands for this number of drops when
+                # sampled
+                accumulator = SimKpi.KpiAccumulator(
+                    logline['tsch_slotDuration'],
+                    SimLog.get_log_sampling(logline, SimLog.LOG_PACKET_DROPPED['type'])
+                )
+                run_id = logline['_run_id']
+                if columnar_rows is not None:
+                    run_logs = []
+
+            if (run_logs is None) or (logline['_type'] == 'config'):
+                accumulator.add_log(logline)
+            else:
+                run_logs.append(logline)
+
+    if accumulator is not None:
+        kpis.update(get_run_kpis())
+
+    # run_ids and mote_ids are strings, as in the KPI files
+    return (json.loads(json.dumps(kpis)), ended)
+
+def compute_kpis(inputfiles, numCPUs=1, checkpoint=False):
+    """ Return the KPIs of log files, indexed by log file, run_id and mote_id
+
+    The runs are shared among numCPUs processes. With checkpoint, only the
+    runs after the checkpoint of each log file are read, and the checkpoint
+    is written next to it.
+    """
+
+    checkpoints = {}
+    shards      = []
+    for inputfile in inputfiles:
+        if checkpoint:
+            checkpoints[inputfile] = read_checkpoint(inputfile)
+        else:
+            checkpoints[inputfile] = {'offset': 0, 'kpis': {}}
+        shards += get_shards(inputfile, checkpoints[inputfile]['offset'])
+
+    if (numCPUs > 1) and (len(shards) > 1):
+        pool = multiprocessing.Pool(min(numCPUs, len(shards)))
+        results = pool.map(kpis_shard, shards, chunksize=1)
+        pool.close()
+        pool.join()
+    else:
+        results = map(kpis_shard, shards)
+
+    allkpis = dict(
+        [(inputfile, dict(checkpoints[inputfile]['kpis'])) for inputfile in inputfiles]
+    )
+    for ((inputfile, start, end, _), (kpis, ended)) in zip(shards, results):
+        allkpis[inputfile].update(kpis)
 
-            allstats[run_id][mote_id]['packet_drops'][reason] += 1
+        # the checkpoint moves past the runs which have ended; a run which is
+        # still being written is read again next time
+        file_checkpoint = checkpoints[inputfile]
+        if ended and (file_checkpoint['offset'] == start):
+            file_checkpoint['kpis'].update(kpis)
+            file_checkpoint['offset'] = end
 
-        elif logline['_type'] == SimLog.LOG_BATT_CHARGE['type']:
-            # battery charge
+    if checkpoint:
+        for inputfile in inputfiles:
+            write_checkpoint(inputfile, checkpoints[inputfile])
 
-            # shorthands
-            mote_id    = logline['_mote_id']
-            asn        = logline['_asn']
-            charge     = logline['charge']
+    return allkpis
 
-            # only log non-dagRoot charge
-            if mote_id == DAGROOT_ID:
-                continue
+def kpis_all(inputfile):
+    return compute_kpis([inputfile])[inputfile]
 
-            # populate
-            if mote_id not in allstats[run_id]:
-                allstats[run_id][mote_id] = {}
-            if 'charge' in allstats[run_id][mote_id]:
-                assert charge >= allstats[run_id][mote_id]['charge']
-
-            allstats[run_id][mote_id]['charge_asn'] = asn
-            allstats[run_id][mote_id]['charge']     = charge
-
-    # === compute advanced motestats
-
-    for (run_id, per_mote_stats) in allstats.items():
-        for (mote_id, motestats) in per_mote_stats.items():
-            if mote_id != 0:
-
-                if   'sync_asn' not in motestats:
-                    motestats['WARNING'] = "mote didn't sync"
-                elif 'charge_asn' not in motestats:
-                    motestats['WARNING'] = "log doesn't have battery info"
-                else:
-                    # avg_current, lifetime_AA
-                    if (
-                            (motestats['charge'] <= 0)
-                            or
-                            (motestats['charge_asn'] == motestats['sync_asn'])
-                        ):
-                        motestats['lifetime_AA_years'] = 'N/A'
-                    else:
-                        motestats['avg_current_uA'] = motestats['charge']/float((motestats['charge_asn']-motestats['sync_asn']) * file_settings['tsch_slotDuration'])
-                        assert motestats['avg_current_uA'] > 0
-                        motestats['lifetime_AA_years'] = (2200*1000/float(motestats['avg_current_uA']))/(24.0*365)
-                if 'join_asn' in motestats:
-                    # latencies, upstream_num_tx, upstream_num_rx, upstream_num_lost
-                    motestats['latencies']         = []
-                    motestats['hops']              = []
-                    motestats['upstream_num_tx']   = 0
-                    motestats['upstream_num_rx']   = 0
-                    motestats['upstream_num_lost'] = 0
-                    for (appcounter, pktstats) in allstats[run_id][mote_id]['upstream_pkts'].items():
-                        motestats['upstream_num_tx']      += 1
-                        if 'rx_asn' in pktstats:
-                            motestats['upstream_num_rx']  += 1
-                            thislatency = (pktstats['rx_asn']-pktstats['tx_asn'])*file_settings['tsch_slotDuration']
-                            motestats['latencies']  += [thislatency]
-                            motestats['hops']       += [pktstats['hops']]
-                        else:
-                            motestats['upstream_num_lost'] += 1
-                    if (motestats['upstream_num_rx'] > 0) and (motestats['upstream_num_tx'] > 0):
-                        motestats['latency_min_s'] = min(motestats['latencies'])
-                        motestats['latency_avg_s'] = sum(motestats['latencies'])/float(len(motestats['latencies']))
-                        motestats['latency_max_s'] = max(motestats['latencies'])
-                        motestats['upstream_reliability'] = motestats['upstream_num_rx']/float(motestats['upstream_num_tx'])
-                        motestats['avg_hops'] = sum(motestats['hops'])/float(len(motestats['hops']))
-                    else:
-                        motestats['WARNING'] = "mote didn't send or receive pkts"
-                else:
-                    motestats['WARNING'] = "mote didn't join"
-
-    # === remove unnecessary stats
-
-    for (run_id, per_mote_stats) in allstats.items():
-        for (mote_id, motestats) in per_mote_stats.items():
-            if 'sync_asn' in motestats:
-                del motestats['sync_asn']
-            if 'charge_asn' in motestats:
-                del motestats['charge_asn']
-                del motestats['charge']
-            if 'join_asn' in motestats:
-                del motestats['upstream_pkts']
-                del motestats['hops']
-                del motestats['latencies']
-                del motestats['join_asn']
-
-    return allstats
+@openfile
+def kpis_collected(inputfile):
+    # whether the KPIs were computed during the simulation
+    file_settings = next(SimLog.read_logs(inputfile))
+    return file_settings.get('kpi_collector', False)
 
 # =========================== main ============================================
 
 def main():
+    # cli params
+    cliparams = parseCliParams()
 
     # FIXME: This logic could be a helper method for other scripts
     # Identify simData having the latest results. That directory should have
@@ -246,17 +353,27 @@ def main():
         )
     )
     subfolder = max(subfolders, key=os.path.getmtime)
-    for infile in glob.glob(os.path.join(subfolder, '*.dat')):
-        print 'generating KPIs for {0}'.format(infile)
+    infiles   = []
+    for infile in sorted(glob.glob(os.path.join(subfolder, '*.dat'))):
+        outfile = SimKpi.get_kpi_file_path(infile)
+        if os.path.exists(outfile) and kpis_collected(infile):
+            print 'KPIs for {0} were computed during the simulation, in {1}'.format(infile, outfile)
+            continue
+        infiles += [infile]
+
+    # gather the kpis
+    allkpis = compute_kpis(infiles, cliparams['numCPUs'], checkpoint=True)
 
-        # gather the kpis
-        kpis = kpis_all(infile)
+    for infile in infiles:
+        outfile = SimKpi.get_kpi_file_path(infile)
+        kpis    = allkpis[infile]
+
+        print 'generating KPIs for {0}'.format(infile)
 
         # print on the terminal
         print json.dumps(kpis, indent=4)
 
         # add to the data folder
-        outfile = '{0}.kpi'.format(infile)
         with open(outfile, 'w') as f:
             f.write(json.dumps(kpis, indent=4))
         print 'KPIs saved in {0}'.format(outfile)
@@ -3,15 +3,29 @@
 This script merges log files under 'hostname' based log directory
 """
 
+# =========================== adjust path =====================================
+
+import os
+import sys
+
+if __name__ == '__main__':
+    here = sys.path[0]
+    sys.path.insert(0, os.path.join(here, '..'))
+
 # =========================== imports =========================================
 import argparse
 import filecmp
+import gzip
 import json
-import os
 import re
 import shutil
 import time
 
+import numpy
+
+from SimEngine import SimKpi
+from SimEngine import SimLog
+
 # =========================== helpers =========================================
 
 
@@ -121,6 +135,48 @@ def getTotalTargetFileNum(targetSubDirs):
     return returnVal
 
 
+def isBinaryLogFile(infile):
+    head = infile.read(len(SimLog.BINARY_LOG_MAGIC))
+    infile.seek(0)
+    return head == SimLog.BINARY_LOG_MAGIC
+
+
+def readJsonLogs(infile_path, infile, skipped_lines):
+    for line in infile:
+        # read a log line
+        try:
+            log = json.loads(line)
+        except ValueError:
+            # input line cannot be parsed as a json
+            # string. it may be corrupted
+            skipped_lines.append((infile_path, line))
+            continue
+        yield log
+
+
+def mergeColumnarFile(infile_path, outfile_path, run_id_offset):
+    rows = numpy.array(SimLog.read_columnar_file(infile_path))
+    rows['_run_id'] += run_id_offset
+    with open(outfile_path, 'ab') as outfile:
+        outfile.write(rows.tostring())
+    shutil.copy(infile_path + '.json', outfile_path + '.json')
+
+
+def mergeKpiFile(infile_path, outfile_path, run_id_offset):
+    # the KPIs are indexed by run_id, a string
+    with open(infile_path, 'r') as infile:
+        kpis = json.load(infile)
+    if os.path.exists(outfile_path):
+        with open(outfile_path, 'r') as outfile:
+            merged_kpis = json.load(outfile)
+    else:
+        merged_kpis = {}
+    for (run_id, run_kpis) in kpis.items():
+        merged_kpis[str(int(run_id) + run_id_offset)] = run_kpis
+    with open(outfile_path, 'w') as outfile:
+        outfile.write(json.dumps(merged_kpis, indent=4))
+
+
 def mergeLogFiles(logDir, targetSubDirs, dryRun):
 
     # get the total number of files to be processes
@@ -162,6 +218,26 @@ def mergeLogFiles(logDir, targetSubDirs, dryRun):
         run_id_list    = []
 
         for fileName in os.listdir(targetDir):
+            # columnar files follow their log file, with the same offset
+            if re.match('^.+\.col$', fileName) != None:
+                if not dryRun:
+                    mergeColumnarFile(
+                        os.path.join(targetDir, fileName),
+                        os.path.join(logDir, fileName),
+                        run_id_offset
+                    )
+                continue
+
+            # so do the KPI files written during the simulation
+            if fileName.endswith(SimKpi.get_kpi_file_path('.dat')):
+                if not dryRun:
+                    mergeKpiFile(
+                        os.path.join(targetDir, fileName),
+                        os.path.join(logDir, fileName),
+                        run_id_offset
+                    )
+                continue
+
             # merge only *.dat files
             if re.match('^.+\.dat$', fileName) == None:
                 continue
@@ -179,19 +255,25 @@ def mergeLogFiles(logDir, targetSubDirs, dryRun):
 
             if not dryRun:
                 # actual merger happens here
-                with open(infile_path, 'r') as infile:
-                    with open(outfile_path, 'a') as outfile:
-
-                        for line in infile:
-                            # read a log line
-                            try:
-                                log = json.loads(line)
-                            except ValueError:
-                                # input line cannot be parsed as a json
-                                # string. it may be corrupted
-                                skipped_lines.append((infile_path, line))
-                                continue
-
+                with open(infile_path, 'rb') as compressed_infile:
+                    infile = SimLog.decompress_log_file(compressed_infile)
+                    if infile is compressed_infile:
+                        outfile = open(outfile_path, 'ab')
+                    else:
+                        # compressed log files are written back compressed
+                        outfile = gzip.open(outfile_path, 'ab')
+                    with outfile:
+
+                        if isBinaryLogFile(infile):
+                            # binary log files are written back in binary
+                            encoder = SimLog.BinaryLogEncoder()
+                            logs    = SimLog.read_logs(infile)
+                            write   = lambda log: outfile.write(encoder.encode(log))
+                        else:
+                            logs    = readJsonLogs(infile_path, infile, skipped_lines)
+                            write   = lambda log: outfile.write(json.dumps(log) + "\n")
+
+                        for log in logs:
                             # collect cpuID and _runid that are used to compute
                             # cpu_id_offset and run_id_offset
                             if log['_type'] == 'config':
@@ -208,7 +290,7 @@ def mergeLogFiles(logDir, targetSubDirs, dryRun):
                                 log['_run_id'] += run_id_offset
 
                             # write the log line to outfile
-                            outfile.write(json.dumps(log) + "\n")
+                            write(log)
 
             total_processed_file_num += 1
 
@@ -8,7 +8,6 @@
 # =========================== adjust path =====================================
 
 import os
-import platform
 import sys
 
 if __name__ == '__main__':
@@ -21,18 +20,39 @@ import time
 import subprocess
 import itertools
 import threading
-import math
 import multiprocessing
 import argparse
 import json
 import glob
+import hashlib
+import re
 import shutil
+import signal
+import Queue
+
+import numpy
+import scipy.stats
 
 from SimEngine import SimConfig,   \
                       SimEngine,   \
                       SimLog, \
+                      SimKpi, \
                       SimSettings, \
                       Connectivity
+import compute_kpis
+
+# =========================== defines =========================================
+
+PROGRESS_PERIOD_S = 1 # the CPUs report the progress of their run every second
+CPU_ID_TIMEOUT_S  = 5 # a process of the pool waits that long for a cpuID
+
+# the runs done are recorded in the manifest of the log directory, so that an
+# interrupted sweep can be resumed
+MANIFEST_FILE_NAME = 'manifest.json'
+
+# the output files of a run are stored in the result cache under the names of
+# the output files of a run without cpuID, e.g. output.dat and output.dat.kpi
+RESULT_FILE_PREFIX = 'output'
 
 # =========================== helpers =========================================
 
@@ -47,41 +67,22 @@ def parseCliParams():
         default    = 'config.json',
         help       = 'Location of the configuration file.',
     )
+    parser.add_argument(
+        '--resume',
+        dest       = 'resume',
+        action     = 'store',
+        default    = None,
+        help       = 'Log directory of an interrupted sweep, whose remaining runs to do.',
+    )
     cliparams      = parser.parse_args()
     return cliparams.__dict__
 
-def getTemplogFileName(cpuID, pid):
-    hostname = platform.uname()[1]
-    return '{0}-pid{1}-cpu{2}.templog'.format(hostname, pid, cpuID)
-
-def printOrLog(cpuID, pid, output, verbose):
-    assert cpuID is not None
-
-    if not verbose:
-        with open(getTemplogFileName(cpuID, pid), 'w') as f:
-            f.write(output)
-    else:
-        print output
-
-def runSimCombinations(params):
+def getSimParams(simconfig):
     """
-    Runs simulations for all combinations of simulation settings.
-    This function may run independently on different CPUs.
+    Returns the simulation settings of all the combinations of simulation
+    settings.
     """
 
-    cpuID              = params['cpuID']
-    pid                = params['pid']
-    numRuns            = params['numRuns']
-    first_run          = params['first_run']
-    verbose            = params['verbose']
-    config_data        = params['config_data']
-
-    simconfig = SimConfig.SimConfig(configdata=config_data)
-
-    # record simulation start time
-    simStartTime        = time.time()
-
-    # compute all the simulation parameter combinations
     combinationKeys     = simconfig.settings.combination.keys()
     simParams           = []
     for p in itertools.product(*[simconfig.settings.combination[k] for k in combinationKeys]):
@@ -92,71 +93,563 @@ def runSimCombinations(params):
             if k not in simParam:
                 simParam[k] = v
         simParams      += [simParam]
+    return simParams
+
+def getExpectedDuration(simParam):
+    # the duration of a run grows with the number of motes, and with the
+    # number of slots simulated
+    return (
+        simParam['exec_numMotes']            *
+        simParam['exec_numSlotframesPerRun'] *
+        simParam['tsch_slotframeLength']
+    )
 
-    # run a simulation for each set of simParams
-    for (simParamNum, simParam) in enumerate(simParams):
+class SimTaskScheduler(object):
+    """
+    Decides which simulation runs to do: numRuns runs of each combination of
+    simulation settings or, with adaptiveRuns, runs of each combination until
+    the confidence intervals of the means of its KPIs are narrow enough.
+    """
 
-        # run the simulation runs
-        for run_id in xrange(first_run, first_run+numRuns):
+    def __init__(self, simconfig, taskKeysDone):
 
-            # printOrLog
-            output  = 'parameters {0}/{1}, run {2}/{3}'.format(
-               simParamNum+1,
-               len(simParams),
-               run_id+1-first_run,
-               numRuns
-            )
-            printOrLog(cpuID, pid, output, verbose)
-
-            # create singletons
-            settings         = SimSettings.SimSettings(cpuID=cpuID, run_id=run_id, **simParam)
-            settings.setLogDirectory(simconfig.get_log_directory_name())
-            settings.setCombinationKeys(combinationKeys)
-            simlog           = SimLog.SimLog()
-            simlog.set_log_filters(simconfig.logging)
-            simengine        = SimEngine.SimEngine(run_id=run_id, verbose=verbose)
+        # store params
+        self.simconfig    = simconfig
 
+        # local variables
+        self.simParams    = getSimParams(simconfig)
+        self.adaptiveRuns = simconfig.execution.get('adaptiveRuns')
+        if self.adaptiveRuns is None:
+            self.numRuns  = simconfig.execution.numRuns
+        else:
+            # a plain dict, which the tasks can be pickled with
+            self.adaptiveRuns = json.loads(json.dumps(self.adaptiveRuns))
+            assert 2 <= self.adaptiveRuns['minRuns'] <= self.adaptiveRuns['maxRuns']
+            assert 0 < self.adaptiveRuns['confidence'] < 1
+            self.numRuns  = self.adaptiveRuns['maxRuns']
+        self.resultCache  = simconfig.execution.get('resultCache')
+        if self.resultCache is not None:
+            self.codeDigest = getCodeDigest()
+
+        # KPIs of the runs done and run_ids of the runs to do or being done,
+        # per combination, indexed by simParamNum; with adaptiveRuns, a run
+        # recorded without the KPIs of the tolerances, e.g. by a sweep without
+        # adaptiveRuns, is done again
+        self.runsDone     = [{} for _ in self.simParams]
+        self.runsPending  = [set() for _ in self.simParams]
+        for taskKey in taskKeysDone:
+            if (
+                    (self.adaptiveRuns is not None)
+                    and
+                    not set(self.adaptiveRuns['tolerances']).issubset(taskKey.get('kpis') or {})
+                ):
+                continue
+            simParamNum = self._getSimParamNum(taskKey['combination'])
+            self.runsDone[simParamNum][taskKey['run_id']] = taskKey.get('kpis')
+
+    # ======================= public ==========================================
+
+    def getTasks(self):
+        """
+        Returns the tasks to start with, the longest ones first.
+        """
+        tasks = []
+        for simParamNum in range(len(self.simParams)):
+            if self.adaptiveRuns is None:
+                run_ids = [
+                    run_id for run_id in xrange(self.numRuns)
+                    if run_id not in self.runsDone[simParamNum]
+                ]
+            else:
+                run_ids = self._getNextRunIds(simParamNum)
+            tasks += [self._getTask(simParamNum, run_id) for run_id in run_ids]
+        tasks.sort(key=lambda task: -getExpectedDuration(task['simParam']))
+        return tasks
+
+    def taskDone(self, taskKey):
+        """
+        Records the end of a simulation run. Returns the tasks of the runs its
+        combination needs more of.
+        """
+        simParamNum = self._getSimParamNum(taskKey['combination'])
+        self.runsPending[simParamNum].discard(taskKey['run_id'])
+        self.runsDone[simParamNum][taskKey['run_id']] = taskKey.get('kpis')
+        if self.adaptiveRuns is None:
+            return []
+        return [
+            self._getTask(simParamNum, run_id)
+            for run_id in self._getNextRunIds(simParamNum)
+        ]
+
+    def getRunsNotDone(self):
+        """
+        Returns the settings and run_id of the runs which are not done, e.g.
+        the runs a combination which converged did not need.
+        """
+        return [
+            (simParam, run_id)
+            for (simParamNum, simParam) in enumerate(self.simParams)
+            for run_id in xrange(self.numRuns)
+            if run_id not in self.runsDone[simParamNum]
+        ]
+
+    def isStopped(self, task):
+        # whether the combination of a task needs no more runs; the run of a
+        # task stopped is not pending anymore
+        if (self.adaptiveRuns is None) or (not self.hasConverged(task['simParamNum'])):
+            return False
+        self.runsPending[task['simParamNum']].discard(task['run_id'])
+        return True
+
+    def hasConverged(self, simParamNum):
+        """
+        Returns whether the mean of each KPI over the runs of a combination is
+        known precisely enough: its confidence interval is narrower than its
+        tolerance. The KPIs no run has a value for are ignored.
+        """
+        runKpis = self.runsDone[simParamNum].values()
+        if len(runKpis) < self.adaptiveRuns['minRuns']:
+            return False
+        for (kpi, tolerance) in self.adaptiveRuns['tolerances'].items():
+            values = [kpis[kpi] for kpis in runKpis if kpis[kpi] is not None]
+            if not values:
+                continue
+            if len(values) < 2:
+                return False
+            if getConfidenceIntervalWidth(values, self.adaptiveRuns['confidence']) > tolerance:
+                return False
+        return True
+
+    def getSummary(self):
+        # the number of runs of each combination, and whether they converged
+        output = []
+        for simParamNum in range(len(self.simParams)):
+            output += [
+                'parameters {0}/{1}: {2} runs, {3}'.format(
+                    simParamNum+1,
+                    len(self.simParams),
+                    len(self.runsDone[simParamNum]),
+                    'converged' if self.hasConverged(simParamNum) else 'not converged',
+                )
+            ]
+        return '\n'.join(output)
+
+    # ======================= private =========================================
+
+    def _getSimParamNum(self, combination):
+        for (simParamNum, simParam) in enumerate(self.simParams):
+            if all([simParam[k] == v for (k, v) in combination.items()]):
+                return simParamNum
+        raise ValueError('unknown combination {0}'.format(combination))
+
+    def _getNextRunIds(self, simParamNum):
+        # minRuns runs of each combination are done at the same time, as long
+        # as it has not converged, and up to maxRuns runs
+        if self.hasConverged(simParamNum):
+            return []
+        runsDone    = self.runsDone[simParamNum]
+        runsPending = self.runsPending[simParamNum]
+        run_ids     = []
+        for run_id in xrange(self.numRuns):
+            if len(runsPending) >= self.adaptiveRuns['minRuns']:
+                break
+            if (run_id not in runsDone) and (run_id not in runsPending):
+                runsPending.add(run_id)
+                run_ids += [run_id]
+        return run_ids
+
+    def _getTask(self, simParamNum, run_id):
+        simParam = self.simParams[simParamNum]
+        task     = {
+            'simParamNum':        simParamNum,
+            'numSimParams':       len(self.simParams),
+            'simParam':           simParam,
+            'run_id':             run_id,
+            'numRuns':            self.numRuns,
+            'numSlotframes':      simParam['exec_numSlotframesPerRun'],
+            'combinationKeys':    self.simconfig.settings.combination.keys(),
+            'config_data':        self.simconfig.get_config_data(),
+            'resultCache':        self.resultCache,
+            'adaptiveRuns':       self.adaptiveRuns,
+        }
+        if self.resultCache is None:
+            task['resultKey'] = None
+        else:
+            task['resultKey'] = getResultKey(task, self.simconfig.logging, self.codeDigest)
+        return task
+
+def getConfidenceIntervalWidth(values, confidence):
+    # width of the confidence interval of the mean of values, with Student's
+    # t-distribution
+    return (
+        2 *
+        scipy.stats.t.ppf((1 + confidence) / 2.0, len(values) - 1) *
+        numpy.std(values, ddof=1) /
+        numpy.sqrt(len(values))
+    )
 
-            # start simulation run
-            simengine.start()
+def getRunKpis(output_file_path, kpiNames):
+    """
+    Returns the average over the motes of each KPI of a simulation run, None
+    for a KPI no mote has a value for.
+    """
+    kpi_file_path = SimKpi.get_kpi_file_path(output_file_path)
+    if os.path.exists(kpi_file_path):
+        # computed during the run
+        with open(kpi_file_path, 'r') as f:
+            kpis = json.load(f)
+    else:
+        (kpis, _) = compute_kpis.kpis_shard((output_file_path, 0, None, False))
+
+    runKpis = {}
+    for kpi in kpiNames:
+        values = [
+            motestats[kpi]
+            for per_mote_stats in kpis.values()
+            for motestats in per_mote_stats.values()
+            if isinstance(motestats.get(kpi), (int, long, float))
+        ]
+        if values:
+            runKpis[kpi] = sum(values) / float(len(values))
+        else:
+            runKpis[kpi] = None
+    return runKpis
+
+def getCodeDigest():
+    # digest of the source code of the simulator
+    md5        = hashlib.md5()
+    source_dir = os.path.dirname(os.path.abspath(SimEngine.__file__))
+    for (root, dirs, files) in sorted(os.walk(source_dir)):
+        for file_name in sorted(files):
+            if file_name.endswith('.py'):
+                file_path = os.path.join(root, file_name)
+                md5.update(os.path.relpath(file_path, source_dir))
+                with open(file_path, 'rb') as f:
+                    md5.update(f.read())
+    return md5.hexdigest()
+
+def getResultKey(task, logging, codeDigest):
+    """
+    Returns the key of the result of a simulation run in the result cache,
+    None if the run is not deterministic.
 
-            # wait for simulation run to end
-            simengine.join()
+    The output of a run is determined by its settings, run_id, logging, the
+    source code of the simulator and its connectivity trace, when its random
+    seed is given.
+    """
+    simParam = task['simParam']
+    if not isinstance(simParam['exec_randomSeed'], (int, long)):
+        return None
 
-            # destroy singletons
-            simlog.destroy()
-            simengine.destroy()
-            Connectivity.Connectivity().destroy()
-            settings.destroy() # destroy last, Connectivity needs it
+    if simParam.get('conn_trace') is not None:
+        with open(simParam['conn_trace'], 'rb') as f:
+            traceDigest = hashlib.md5(f.read()).hexdigest()
+    else:
+        traceDigest = None
+
+    md5 = hashlib.md5()
+    md5.update(
+        json.dumps(
+            {
+                'settings':    simParam,
+                'run_id':      task['run_id'],
+                'logging':     logging,
+                'code':        codeDigest,
+                'conn_trace':  traceDigest,
+            },
+            sort_keys = True
+        )
+    )
+    return md5.hexdigest()
 
-        # printOrLog
-        output  = 'simulation ended after {0:.0f}s ({1} runs).'.format(
-            time.time()-simStartTime,
-            numRuns * len(simParams)
+def restoreResult(task, output_file_path):
+    """
+    Writes the output files of a simulation run from the result cache.
+    Returns False if the result of the run is not in the cache.
+    """
+    result_path = os.path.join(task['resultCache'], task['resultKey'])
+    if not os.path.isdir(result_path):
+        return False
+    # the files are copied; the output files are appended to and merged,
+    # which must not change the ones in the cache
+    output_prefix = os.path.splitext(output_file_path)[0]
+    for file_name in os.listdir(result_path):
+        shutil.copy(
+            os.path.join(result_path, file_name),
+            output_prefix + file_name[len(RESULT_FILE_PREFIX):]
         )
-        printOrLog(cpuID, pid, output, verbose)
+    return True
+
+def storeResult(task, output_file_path):
+    # the output files are stored in a temporary directory first, so that a
+    # result in the cache is never partial
+    result_path = os.path.join(task['resultCache'], task['resultKey'])
+    if os.path.isdir(result_path):
+        return
+    temp_path   = '{0}.{1}.tmp'.format(result_path, os.getpid())
+    shutil.rmtree(temp_path, ignore_errors=True)
+    os.makedirs(temp_path)
+    output_prefix = os.path.splitext(output_file_path)[0]
+    for file_path in getOutputFiles(output_file_path):
+        shutil.copy(
+            file_path,
+            os.path.join(temp_path, RESULT_FILE_PREFIX + file_path[len(output_prefix):])
+        )
+    try:
+        os.rename(temp_path, result_path)
+    except OSError:
+        # stored by another process in the meantime
+        shutil.rmtree(temp_path)
+
+def getTaskKey(task):
+    # identifies a simulation run in the manifest
+    return {
+        'combination': dict([(k, task['simParam'][k]) for k in task['combinationKeys']]),
+        'run_id':      task['run_id'],
+    }
+
+def getTaskResult(task, output_file_path):
+    # the key of a simulation run done, recorded in the manifest; with
+    # adaptiveRuns, along with the KPIs of the run
+    taskKey = getTaskKey(task)
+    if task['adaptiveRuns'] is not None:
+        taskKey['kpis'] = getRunKpis(
+            output_file_path,
+            task['adaptiveRuns']['tolerances'].keys()
+        )
+    return taskKey
+
+def readManifest(folder_path):
+    """
+    Returns the keys of the simulation runs done, recorded in the manifest of
+    a log directory.
+    """
+    manifest_path = os.path.join(folder_path, MANIFEST_FILE_NAME)
+    if not os.path.exists(manifest_path):
+        return []
+    with open(manifest_path, 'r') as f:
+        return json.load(f)
+
+def writeManifest(folder_path, taskKeys):
+    # the manifest is replaced at once, it is never partially written
+    manifest_path = os.path.join(folder_path, MANIFEST_FILE_NAME)
+    with open(manifest_path + '.tmp', 'w') as f:
+        json.dump(taskKeys, f, indent=4)
+    os.rename(manifest_path + '.tmp', manifest_path)
+
+def getRunOutputFileName(run_id):
+    # each run is written in its own output file, whichever CPU it runs on;
+    # they are merged in the order of their run_id
+    return 'output_run{0}.dat'.format(run_id)
+
+def getOutputFiles(output_file_path):
+    # the output files of a run: its log file, and the files next to it, e.g.
+    # output_run1.dat.kpi or output_run1.app.tx.col
+    return glob.glob(
+        os.path.splitext(output_file_path)[0].replace('[', '[[]') + '.*'
+    )
+
+def removeOutputFiles(simParam, run_id, combinationKeys, log_directory_name):
+    # removes the output files of a simulation run
+    settings = SimSettings.SimSettings(run_id=run_id, **simParam)
+    settings.setLogDirectory(log_directory_name)
+    settings.setCombinationKeys(combinationKeys)
+    settings.setOutputFileName(getRunOutputFileName(run_id))
+    for file_path in getOutputFiles(settings.getOutputFile()):
+        os.remove(file_path)
+    settings.destroy()
+
+def getTaskName(task):
+    return 'parameters {0}/{1}, run {2}/{3}'.format(
+       task['simParamNum']+1,
+       task['numSimParams'],
+       task['run_id']+1,
+       task['numRuns']
+    )
+
+def initSimWorker(cpuIDs, progressQueue):
+    # each process of the pool takes a cpuID, which its progress is reported
+    # under; a process replacing one which has exited finds none left, and
+    # takes one past them, from its number among the processes of the pool
+    global simWorkerCpuID
+    global simWorkerProgressQueue
+    try:
+        simWorkerCpuID     = cpuIDs.get(timeout=CPU_ID_TIMEOUT_S)
+    except Queue.Empty:
+        simWorkerCpuID     = multiprocessing.current_process()._identity[-1] - 1
+    simWorkerProgressQueue = progressQueue
+
+    # an interruption is handled by the main process, which terminates the
+    # pool
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+simWorkerCpuID         = 0
+simWorkerProgressQueue = None
+def reportProgress(task, simengine, runStartTime, ended=False):
+    # the progress of a run, in slotframes; a run restored from the result
+    # cache has no simengine
+    if ended:
+        slotframes = task['numSlotframes']
+    else:
+        slotframes = simengine.getAsn() / float(simengine.settings.tsch_slotframeLength)
+    elapsed    = time.time() - runStartTime
+    if (slotframes > 0) and (elapsed > 0):
+        rate   = slotframes / elapsed
+        eta    = (task['numSlotframes'] - slotframes) / rate
+    else:
+        rate   = None
+        eta    = None
+
+    simWorkerProgressQueue.put({
+        'cpuID':           simWorkerCpuID,
+        'task':            getTaskName(task),
+        'asn':             None if simengine is None else simengine.getAsn(),
+        'slotframes':      slotframes,
+        'numSlotframes':   task['numSlotframes'],
+        'rate':            rate,
+        'eta':             eta,
+        'ended':           ended,
+    })
+
+def runSimTask(task):
+    """
+    Runs a simulation run of a combination of simulation settings.
+    This function may run independently on different CPUs.
+    """
+
+    simParam           = task['simParam']
+    run_id             = task['run_id']
+    verbose            = task['verbose']
+
+    simconfig = SimConfig.SimConfig(configdata=task['config_data'])
+
+    if verbose:
+        print getTaskName(task)
+
+    # create singletons
+    settings         = SimSettings.SimSettings(cpuID=simWorkerCpuID, run_id=run_id, **simParam)
+    settings.setLogDirectory(simconfig.get_log_directory_name())
+    settings.setCombinationKeys(task['combinationKeys'])
+    settings.setOutputFileName(getRunOutputFileName(run_id))
+
+    # remove the output of an interrupted attempt of the run
+    for file_path in getOutputFiles(settings.getOutputFile()):
+        os.remove(file_path)
+
+    # the result of the run is taken from the result cache if it is there
+    runStartTime     = time.time()
+    if (task['resultKey'] is not None) and restoreResult(task, settings.getOutputFile()):
+        if not verbose:
+            reportProgress(task, None, runStartTime, ended=True)
+        taskKey = getTaskResult(task, settings.getOutputFile())
+        settings.destroy()
+        return taskKey
+
+    simlog           = SimLog.SimLog()
+    simlog.set_log_filters(simconfig.logging)
+    simengine        = SimEngine.SimEngine(run_id=run_id, verbose=verbose)
+
+    # start simulation run
+    simengine.start()
+
+    # wait for simulation run to end, reporting its progress
+    if verbose:
+        simengine.join()
+    else:
+        while simengine.is_alive():
+            reportProgress(task, simengine, runStartTime)
+            simengine.join(PROGRESS_PERIOD_S)
+        reportProgress(task, simengine, runStartTime, ended=True)
+
+    # destroy singletons
+    simlog.destroy()
+    simengine.destroy()
+    Connectivity.Connectivity().destroy()
+
+    # store the result of the run in the result cache
+    if task['resultKey'] is not None:
+        storeResult(task, settings.getOutputFile())
+
+    taskKey = getTaskResult(task, settings.getOutputFile())
+
+    settings.destroy() # destroy last, Connectivity needs it
+
+    return taskKey
+
+def formatDuration(seconds):
+    if seconds is None:
+        return '?'
+    return '{0:.0f}s'.format(seconds)
 
 keep_printing_progress = True
-def printProgressPerCpu(cpuIDs, pid, clear_console=True):
+def printProgressPerCpu(progressQueue, cpuIDs, tasks, clear_console=True):
+    """
+    Prints the progress the CPUs report: per run, the ASN, the slotframes
+    simulated per second and the time left; for all the runs, the slotframes
+    simulated per second, and the time left at that pace.
+    """
+    progress           = {} # last progress of the run of each CPU
+    numEndedTasks      = 0
+    endedSlotframes    = 0
     while keep_printing_progress:
-        time.sleep(1)
-        output     = []
-        for cpuID in cpuIDs:
+        time.sleep(PROGRESS_PERIOD_S)
+
+        # tasks are added as runs end
+        totalSlotframes = sum([task['numSlotframes'] for task in tasks])
+
+        # read the progress reported
+        while True:
             try:
-                with open(getTemplogFileName(cpuID, pid), 'r') as f:
-                    output += ['[cpu {0}] {1}'.format(cpuID, f.read())]
-            except IOError:
-                output += ['[cpu {0}] no info (yet?)'.format(cpuID)]
-        allDone = True
-        for line in output:
-            if line.count('ended') == 0:
-                allDone = False
+                report = progressQueue.get_nowait()
+            except Queue.Empty:
+                break
+            if report['ended']:
+                numEndedTasks   += 1
+                endedSlotframes += report['numSlotframes']
+                progress.pop(report['cpuID'], None)
+            else:
+                progress[report['cpuID']] = report
+
+        # the processes replacing the ones which have exited report under
+        # cpuIDs of their own
+        output     = []
+        for cpuID in sorted(set(cpuIDs) | set(progress.keys())):
+            if cpuID in progress:
+                report  = progress[cpuID]
+                output += [
+                    '[cpu {0}] {1}: ASN {2}, slotframe {3:.0f}/{4}, {5} slotframes/s, ETA {6}'.format(
+                        cpuID,
+                        report['task'],
+                        report['asn'],
+                        report['slotframes'],
+                        report['numSlotframes'],
+                        '?' if report['rate'] is None else '{0:.1f}'.format(report['rate']),
+                        formatDuration(report['eta']),
+                    )
+                ]
+            else:
+                output += ['[cpu {0}] idle'.format(cpuID)]
+
+        # overall
+        rate = sum([report['rate'] for report in progress.values() if report['rate'] is not None])
+        leftSlotframes = (
+            totalSlotframes -
+            endedSlotframes -
+            sum([report['slotframes'] for report in progress.values()])
+        )
+        output += [
+            '{0}/{1} runs ended, {2:.1f} slotframes/s, ETA {3}'.format(
+                numEndedTasks,
+                len(tasks),
+                rate,
+                formatDuration(leftSlotframes / rate if rate > 0 else None),
+            )
+        ]
+
         output = '\n'.join(output)
         if clear_console:
             os.system('cls' if os.name == 'nt' else 'clear')
         print output
-        if allDone:
-            break
 
 def merge_output_files(folder_path):
     """
@@ -165,25 +658,80 @@ def merge_output_files(folder_path):
     """
 
     for subfolder in os.listdir(folder_path):
+        if not os.path.isdir(os.path.join(folder_path, subfolder)):
+            # config and manifest files
+            continue
+
         # subfolder could have '[' in its name, which is a special character
-        # for glob. This needs to be escaped.
+        # for glob. This needs to be escaped. Files are merged in the order
+        # of their run_id.
         file_path_list = sorted(
             glob.glob(
                 os.path.join(
                     folder_path,
                     subfolder.replace('[', '[[]'),
-                    'output_cpu*.dat'
+                    'output_run*.dat'
                 )
+            ),
+            key = lambda file_path: int(
+                re.search(r'output_run(\d+)\.dat$', file_path).group(1)
             )
         )
 
         # read files and concatenate results
-        with open(os.path.join(folder_path, subfolder + ".dat"), 'w') as outputfile:
+        with open(os.path.join(folder_path, subfolder + ".dat"), 'wb') as outputfile:
             for file_path in file_path_list:
-                with open(file_path, 'r') as inputfile:
-                    config = json.loads(inputfile.readline())
+                with open(file_path, 'rb') as inputfile:
+                    head = inputfile.read(len(SimLog.BINARY_LOG_MAGIC))
+                    if (
+                            head == SimLog.BINARY_LOG_MAGIC
+                            or
+                            head.startswith(SimLog.GZIP_MAGIC)
+                        ):
+                        # binary log files and gzip members are concatenated
+                        # as they are
+                        outputfile.write(head)
+                        shutil.copyfileobj(inputfile, outputfile)
+                        continue
+                    config = json.loads(head + inputfile.readline())
                     outputfile.write(json.dumps(config) + "\n")
                     outputfile.write(inputfile.read())
+
+        # KPIs computed during the simulations are merged; run ids are unique
+        kpi_path_list = [
+            SimKpi.get_kpi_file_path(file_path) for file_path in file_path_list
+        ]
+        kpi_path_list = [p for p in kpi_path_list if os.path.exists(p)]
+        if kpi_path_list:
+            kpis = {}
+            for kpi_path in kpi_path_list:
+                with open(kpi_path, 'r') as f:
+                    kpis.update(json.load(f))
+            kpi_output_path = SimKpi.get_kpi_file_path(
+                os.path.join(folder_path, subfolder + ".dat")
+            )
+            with open(kpi_output_path, 'w') as f:
+                f.write(json.dumps(kpis, indent=4))
+
+        # columnar files are concatenated as they are, with their description
+        for log_type in SimLog.LOG_COLUMNS:
+            col_path_list = [
+                SimLog.get_columnar_file_path(file_path, log_type)
+                for file_path in file_path_list
+            ]
+            col_path_list = [p for p in col_path_list if os.path.exists(p)]
+            if not col_path_list:
+                continue
+            col_output_path = SimLog.get_columnar_file_path(
+                os.path.join(folder_path, subfolder + ".dat"),
+                log_type
+            )
+            with open(col_output_path, 'wb') as outputfile:
+                for col_path in col_path_list:
+                    with open(col_path, 'rb') as inputfile:
+                        shutil.copyfileobj(inputfile, outputfile)
+            shutil.copy(col_path_list[0] + '.json', col_output_path + '.json')
+
         shutil.rmtree(os.path.join(folder_path, subfolder))
 
 # =========================== main ============================================
@@ -195,10 +743,25 @@ def main():
     # cli params
     cliparams = parseCliParams()
 
-    # sim config
-    simconfig = SimConfig.SimConfig(configfile=cliparams['config'])
+    # sim config; a sweep is resumed with the config file of its log
+    # directory
+    if cliparams['resume'] is None:
+        simconfig = SimConfig.SimConfig(configfile=cliparams['config'])
+    else:
+        log_directory_name = os.path.basename(os.path.normpath(cliparams['resume']))
+        simconfig = SimConfig.SimConfig(
+            configfile         = os.path.join('simData', log_directory_name, 'config.json'),
+            log_directory_name = log_directory_name,
+        )
     assert simconfig.version == 0
 
+    # copy config file into output directory
+    folder_path = os.path.join('simData', simconfig.get_log_directory_name())
+    if not os.path.exists(folder_path):
+        os.makedirs(folder_path)
+    with open(os.path.join(folder_path, 'config.json'), 'w') as f:
+        f.write(simconfig.get_config_data())
+
     #=== run simulations
 
     # decide number of CPUs to run on
@@ -210,37 +773,32 @@ def main():
         numCPUs = simconfig.execution.numCPUs
     assert numCPUs <= max_numCPUs
 
-    if numCPUs == 1:
-        # run on single CPU
+    # one task per simulation run, pulled by the CPUs as they become idle;
+    # the runs done already are skipped, the scheduler adds tasks as runs end
+    simStartTime = time.time()
+    taskKeysDone = readManifest(folder_path)
+    scheduler    = SimTaskScheduler(simconfig, taskKeysDone)
+    tasks        = scheduler.getTasks()
+    numRunsDone  = 0
 
-        runSimCombinations({
-            'cpuID':              0,
-            'pid':                os.getpid(),
-            'numRuns':            simconfig.execution.numRuns,
-            'first_run':          0,
-            'verbose':            True,
-            'config_data':        simconfig.get_config_data()
-        })
+    if numCPUs == 1:
+        # run on single CPU; the runs of a combination which needs no more
+        # runs in the meantime are not done
+        taskQueue = list(tasks)
+        while taskQueue:
+            task = taskQueue.pop(0)
+            if scheduler.isStopped(task):
+                continue
+            task['verbose'] = True
+            taskKey       = runSimTask(task)
+            numRunsDone  += 1
+            taskKeysDone += [taskKey]
+            writeManifest(folder_path, taskKeysDone)
+            newTasks      = scheduler.taskDone(taskKey)
+            tasks        += newTasks
+            taskQueue    += newTasks
 
     else:
-        # distribute runs on different CPUs
-        runsPerCPU = [
-            int(
-                math.floor(float(simconfig.execution.numRuns) / float(numCPUs))
-            )
-        ]*numCPUs
-        idx         = 0
-        while sum(runsPerCPU) < simconfig.execution.numRuns:
-            runsPerCPU[idx] += 1
-            idx              += 1
-
-        # distribute run ids on different CPUs (transform runsPerCPU into a list of tuples)
-        first_run = 0
-        for cpuID in range(numCPUs):
-            runs = runsPerCPU[cpuID]
-            runsPerCPU[cpuID] = (runs, first_run)
-            first_run += runs
-
         # print progress, wait until done
         cpuIDs                = [i for i in range(numCPUs)]
         if simconfig.log_directory_name == 'hostname':
@@ -251,9 +809,10 @@ def main():
             clear_console = False
         else:
             clear_console = True
+        progressQueue         = multiprocessing.Queue()
         print_progress_thread = threading.Thread(
             target = printProgressPerCpu,
-            args   = (cpuIDs, os.getpid(), clear_console)
+            args   = (progressQueue, cpuIDs, tasks, clear_console)
         )
 
         print_progress_thread.start()
@@ -263,46 +822,78 @@ def main():
             time.sleep(0.5)
 
         # start simulations
-        pool = multiprocessing.Pool(numCPUs)
-        async_result = pool.map_async(
-            runSimCombinations,
-            [
-                {
-                    'cpuID':              cpuID,
-                    'pid':                os.getpid(),
-                    'numRuns':            runs,
-                    'first_run':          first_run,
-                    'verbose':            False,
-                    'config_data':        simconfig.get_config_data()
-                } for [cpuID, (runs, first_run)] in enumerate(runsPerCPU)
-            ]
-        )
-
-        # get() raises an exception raised by a thread if any
+        freeCpuIDs = multiprocessing.Queue()
+        for cpuID in cpuIDs:
+            freeCpuIDs.put(cpuID)
+        pool = multiprocessing.Pool(numCPUs, initSimWorker, (freeCpuIDs, progressQueue))
+        # the pool pulls the tasks from taskQueue until None; a task is put
+        # there when a CPU is idle, unless the runs of its combination which
+        # ended in the meantime made it needless
+        taskQueue        = Queue.Queue()
+        tasksNotStarted  = list(tasks)
+        numTasksRunning  = 0
+        # the results raise an exception raised by a thread if any; they are
+        # waited for with a timeout, which lets an interruption through
+        taskKeys = pool.imap_unordered(runSimTask, iter(taskQueue.get, None), chunksize=1)
         try:
-            async_result.get()
-        except Exception:
+            while True:
+                while tasksNotStarted and (numTasksRunning < numCPUs):
+                    task = tasksNotStarted.pop(0)
+                    if scheduler.isStopped(task):
+                        # not counted in the progress
+                        tasks.remove(task)
+                        continue
+                    task['verbose'] = False
+                    taskQueue.put(task)
+                    numTasksRunning += 1
+                if numTasksRunning == 0:
+                    break
+                taskKey          = taskKeys.next(sys.maxint)
+                numTasksRunning -= 1
+                numRunsDone     += 1
+                taskKeysDone    += [taskKey]
+                writeManifest(folder_path, taskKeysDone)
+                newTasks         = scheduler.taskDone(taskKey)
+                tasks           += newTasks
+                tasksNotStarted += newTasks
+        except BaseException:
+            # the runs of an interrupted sweep are stopped; the pool stops
+            # pulling tasks first
+            taskQueue.put(None)
+            pool.terminate()
             raise
+        else:
+            pool.close()
         finally:
+            # the pool does not wait for tasks anymore
+            taskQueue.put(None)
             # stop print_proress_thread if it's alive
             if print_progress_thread.is_alive():
                 global keep_printing_progress
                 keep_printing_progress = False
                 print_progress_thread.join()
+            pool.join()
 
-        # cleanup
-        hostname = platform.uname()[1]
-        for i in range(numCPUs):
-            os.remove(getTemplogFileName(i, os.getpid()))
+    print 'simulation ended after {0:.0f}s ({1} runs).'.format(
+        time.time()-simStartTime,
+        numRunsDone
+    )
+    if scheduler.adaptiveRuns is not None:
+        print scheduler.getSummary()
+
+    # the output of the runs which are not done, left by an interrupted
+    # sweep, is not merged
+    for (simParam, run_id) in scheduler.getRunsNotDone():
+        removeOutputFiles(
+            simParam,
+            run_id,
+            simconfig.settings.combination.keys(),
+            simconfig.get_log_directory_name()
+        )
 
     # merge output files
-    folder_path = os.path.join('simData', simconfig.get_log_directory_name())
     merge_output_files(folder_path)
 
-    # copy config file into output directory
-    with open(os.path.join(folder_path, 'config.json'), 'w') as f:
-        f.write(simconfig.get_config_data())
-
     #=== post-simulation actions
 
     if simconfig.log_directory_name == 'hostname':
@@ -7,6 +7,7 @@ import types
 import pytest
 
 import test_utils as u
+from SimEngine import SimKpi
 from SimEngine import SimLog
 from SimEngine import SimSettings
 import SimEngine.Mote.MoteDefines as d
@@ -126,3 +127,158 @@ def test_avg_hops(sim_engine, fragmentation, app_pkLength, pkt_loss_mode):
     # the avg_hops should be the same number as leaf.id since we use a linear
     # topology here.
     assert kpis['null'][str(leaf.id)]['avg_hops'] == leaf.id
+
+
+def test_kpi_collector(sim_engine):
+    sim_engine = sim_engine(
+        diff_config = {
+            'exec_numSlotframesPerRun': 40,
+            'exec_numMotes'           : 5,
+            'app_pkPeriod'            : 1,
+            'conn_class'              : 'Linear',
+            'kpi_collector'           : True,
+        },
+        force_initial_routing_and_scheduling_state = True,
+    )
+
+    # run the simulator until it ends, and write the KPIs as the end of the
+    # run does
+    u.run_until_end(sim_engine)
+    sim_engine.kpi_collector.write_kpi_file()
+
+    with open(SimKpi.get_kpi_file_path(sim_engine.settings.getOutputFile())) as f:
+        kpis = json.load(f)
+
+    # the KPIs are the same as the ones computed from the log file
+    accumulator = SimKpi.KpiAccumulator(sim_engine.settings.tsch_slotDuration)
+    for log in u.read_log_file():
+        accumulator.add_log(log)
+    expected = json.loads(json.dumps(accumulator.get_kpis()))
+    assert kpis == expected
+    assert kpis['null'][str(sim_engine.motes[-1].id)]['upstream_num_tx'] > 0
+
+
+def test_kpi_columnar(sim_engine):
+    sim_engine = sim_engine(
+        diff_config = {
+            'exec_numSlotframesPerRun': 40,
+            'exec_numMotes'           : 5,
+            'app_pkPeriod'            : 1,
+            'conn_class'              : 'Linear',
+            'log_columnar'            : True,
+        },
+        force_initial_routing_and_scheduling_state = True,
+    )
+    u.run_until_end(sim_engine)
+    SimLog.SimLog().flush()
+
+    accumulator = SimKpi.KpiAccumulator(sim_engine.settings.tsch_slotDuration)
+    for log in u.read_log_file():
+        accumulator.add_log(log)
+    expected = json.loads(json.dumps(accumulator.get_kpis()))
+    assert expected['null'][str(sim_engine.motes[-1].id)]['upstream_num_rx'] > 0
+
+    # remove from the log file the logs which are in the columnar files
+    log_file_path = sim_engine.settings.getOutputFile()
+    with open(log_file_path, 'rb') as f:
+        lines = f.readlines()
+    with open(log_file_path, 'wb') as f:
+        for line in lines:
+            if not re.search('"_type": "(app.tx|app.rx|batt.charge)"', line):
+                f.write(line)
+
+    # compute_kpis.py reads them from the columnar files
+    compute_kpis_path = os.path.join(
+        os.path.dirname(__file__),
+        '../bin',
+        'compute_kpis.py'
+    )
+    subprocess.check_output(
+        'python \'{0}\''.format(compute_kpis_path),
+        shell=True
+    )
+    with open(SimKpi.get_kpi_file_path(log_file_path), 'r') as f:
+        assert json.load(f) == expected
+
+
+def test_kpi_checkpoint(sim_engine):
+    sim_engine = sim_engine(
+        diff_config = {
+            'exec_numSlotframesPerRun': 40,
+            'exec_numMotes'           : 3,
+            'app_pkPeriod'            : 1,
+            'conn_class'              : 'Linear',
+        },
+        force_initial_routing_and_scheduling_state = True,
+    )
+
+    # run the simulator until it ends, and log it as the end of the run does
+    u.run_until_end(sim_engine)
+    sim_engine.log(
+        SimLog.LOG_SIMULATOR_STATE,
+        {
+            'name':  sim_engine.name,
+            'state': 'stopped'
+        }
+    )
+    SimLog.SimLog().flush()
+
+    log_file_path = sim_engine.settings.getOutputFile()
+    kpi_file_path = SimKpi.get_kpi_file_path(log_file_path)
+    compute_kpis_path = os.path.join(
+        os.path.dirname(__file__),
+        '../bin',
+        'compute_kpis.py'
+    )
+
+    def compute_kpis():
+        subprocess.check_output(
+            'python \'{0}\''.format(compute_kpis_path),
+            shell=True
+        )
+        with open(kpi_file_path, 'r') as f:
+            return json.load(f)
+
+    def write_run(run_id, mode):
+        # write the first run of the log file, with another run_id
+        with open(log_file_path, 'rb') as f:
+            lines = f.readlines()
+        with open(log_file_path, mode) as f:
+            for (i, line) in enumerate(lines):
+                if (i > 0) and ('"_type": "config"' in line):
+                    break
+                f.write(
+                    line.replace('"_run_id": null', '"_run_id": {0}'.format(run_id))
+                )
+
+    # the KPIs of a log file are computed without a checkpoint, unless
+    # compute_kpis.py is run
+    subprocess.check_output(
+        [
+            'python', '-c',
+            'import sys; sys.path.insert(0, \'{0}\'); import compute_kpis; '
+            'compute_kpis.kpis_all(\'{1}\')'.format(
+                os.path.dirname(compute_kpis_path),
+                log_file_path
+            )
+        ]
+    )
+    assert not os.path.exists(log_file_path + '.kpi.checkpoint')
+
+    # the checkpoint has the KPIs of the run, which has ended
+    kpis = compute_kpis()
+    with open(log_file_path + '.kpi.checkpoint', 'r') as f:
+        checkpoint = json.load(f)
+    assert checkpoint['offset'] == os.path.getsize(log_file_path)
+    assert checkpoint['kpis'] == kpis
+
+    # KPIs of the runs appended are added to the checkpointed ones
+    write_run(1, 'ab')
+    write_run(2, 'ab')
+    kpis = compute_kpis()
+    assert sorted(kpis.keys()) == ['1', '2', 'null']
+    assert kpis['1'] == kpis['null']
+
+    # the checkpoint is discarded when the log file is rewritten
+    write_run(3, 'wb')
+    assert compute_kpis().keys() == ['3']
@@ -7,12 +7,15 @@ import random
 import shutil
 import types
 
+import pytest
+import numpy
 from scipy.stats import t
 from numpy import average, std
 from math import sqrt
 
 import test_utils as u
-from SimEngine import SimLog
+from SimEngine import SimLog, Connectivity
+import SimEngine.Mote.MoteDefines as d
 
 
 #============================ helpers =========================================
@@ -23,26 +26,26 @@ def destroy_all_singletons(engine):
     engine.settings.destroy()
     SimLog.SimLog().destroy()
 
-def print_connectivity_matrix(matrix):
+def print_connectivity_matrix(pdr_matrix):
     output         = []
     output        += ['\n']
 
     # header
     line           = []
-    for source in matrix:
+    for source in range(len(pdr_matrix)):
         line      += [str(source)]
     line           = '\t|'.join(line)
     output        += ['\t|'+line]
 
     # body
-    for source in matrix:
+    for source in range(len(pdr_matrix)):
         line       = []
         line      += [str(source)]
-        for dest in matrix:
+        for dest in range(len(pdr_matrix)):
             if source == dest:
                 line += ['N/A']
             else:
-                line  += [str(matrix[source][dest][0]['pdr'])]
+                line  += [str(pdr_matrix[source][dest][0])]
         line       = '\t|'.join(line)
         output    += [line]
 
@@ -65,10 +68,11 @@ def test_linear_matrix(sim_engine):
             'conn_class':    'Linear',
         }
     )
-    motes  = engine.motes
-    matrix = engine.connectivity.connectivity_matrix
+    motes       = engine.motes
+    pdr_matrix  = engine.connectivity.pdr_matrix
+    rssi_matrix = engine.connectivity.rssi_matrix
 
-    print_connectivity_matrix(matrix)
+    print_connectivity_matrix(pdr_matrix)
 
     assert motes[0].dagRoot is True
 
@@ -76,12 +80,12 @@ def test_linear_matrix(sim_engine):
         for p in range(0, num_motes):
             if (c == p+1) or (c+1 == p):
                 for channelOffset in range(engine.settings.phy_numChans):
-                    assert matrix[c][p][channelOffset]['pdr']  ==  1.00
-                    assert matrix[c][p][channelOffset]['rssi'] ==   -10
+                    assert pdr_matrix[c][p][channelOffset]  ==  1.00
+                    assert rssi_matrix[c][p][channelOffset] ==   -10
             else:
                 for channelOffset in range(engine.settings.phy_numChans):
-                    assert matrix[c][p][channelOffset]['pdr']  ==  0.00
-                    assert matrix[c][p][channelOffset]['rssi'] == -1000
+                    assert pdr_matrix[c][p][channelOffset]  ==  0.00
+                    assert rssi_matrix[c][p][channelOffset] == -1000
 
 def test_k7_matrix(sim_engine):
     """ verify the connectivity matrix for the 'K7' class is as expected """
@@ -96,24 +100,184 @@ def test_k7_matrix(sim_engine):
             'phy_numChans':  15,
         }
     )
-    motes  = engine.motes
-    matrix = engine.connectivity.connectivity_matrix
+    motes       = engine.motes
+    pdr_matrix  = engine.connectivity.pdr_matrix
+    rssi_matrix = engine.connectivity.rssi_matrix
 
-    print_connectivity_matrix(matrix)
+    print_connectivity_matrix(pdr_matrix)
 
     assert motes[0].dagRoot is True
 
+    assert pdr_matrix.shape  == (num_motes, num_motes, engine.settings.phy_numChans)
+    assert rssi_matrix.shape == (num_motes, num_motes, engine.settings.phy_numChans)
+
     for src in range(0, num_motes):
         for dst in range(0, num_motes):
             if src == dst:
                 continue
             for channelOffset in range(engine.settings.phy_numChans):
-                assert 'pdr' in matrix[src][dst][channelOffset]
-                assert 'rssi' in matrix[src][dst][channelOffset]
-                assert isinstance(matrix[src][dst][channelOffset]['pdr'], (int, long, float))
-                assert isinstance(matrix[src][dst][channelOffset]['rssi'], (int, long, float))
-                assert 0 <= matrix[src][dst][channelOffset]['pdr'] <= 1
-                assert -1000 <= matrix[src][dst][channelOffset]['rssi'] <= 0
+                pdr  = engine.connectivity.get_pdr(src, dst, channelOffset)
+                rssi = engine.connectivity.get_rssi(src, dst, channelOffset)
+                assert isinstance(pdr, (int, long, float))
+                assert isinstance(rssi, (int, long, float))
+                assert 0 <= pdr <= 1
+                assert -1000 <= rssi <= 0
+
+@pytest.mark.parametrize('conn_class', ['FullyMeshed', 'Linear', 'K7'])
+def test_sparse_matrix(sim_engine, conn_class):
+    """ verify the neighbor lists give the same links as the matrix, without
+    the matrix being allocated """
+
+    here = os.path.dirname(__file__)
+    diff_config = {
+        'exec_numMotes': 50 if conn_class == 'K7' else 10, # motes of the trace
+        'conn_class':    conn_class,
+        'conn_trace':    os.path.join(here, '..', 'traces', 'grenoble.k7.gz'),
+        'phy_numChans':  2,
+    }
+
+    links = {}
+    for conn_sparse in [False, True]:
+        diff_config['conn_sparse'] = conn_sparse
+        engine = sim_engine(
+            diff_config                                = diff_config,
+            force_initial_routing_and_scheduling_state = False,
+        )
+        if conn_sparse:
+            assert engine.connectivity.pdr_matrix  is None
+            assert engine.connectivity.rssi_matrix is None
+        links[conn_sparse] = {}
+        for src, dst in itertools.permutations(engine.motes, 2):
+            for channel in range(engine.settings.phy_numChans):
+                pdr  = engine.connectivity.get_pdr(src.id, dst.id, channel)
+                rssi = engine.connectivity.get_rssi(src.id, dst.id, channel)
+                if pdr == 0:
+                    rssi = None
+                links[conn_sparse][(src.id, dst.id, channel)] = (pdr, rssi)
+        destroy_all_singletons(engine)
+
+    assert links[False] == links[True]
+
+def test_k7_replay(sim_engine):
+    """ verify the updates of the K7 trace are applied as time goes by """
+
+    here = os.path.dirname(__file__)
+    engine = sim_engine(
+        diff_config = {
+            'exec_numMotes': 50,
+            'conn_class':    'K7',
+            'conn_trace':    os.path.join(here, '..', 'traces', 'grenoble.k7.gz'),
+            'phy_numChans':  15,
+        }
+    )
+    connectivity = engine.connectivity
+    updates      = connectivity.trace_updates
+
+    # the matrix holds the first transaction only
+    assert updates['transaction_id'][connectivity.trace_next_update - 1] == 0
+    assert updates['transaction_id'][connectivity.trace_next_update]     == 1
+
+    # jump to the ASN of the next update; the link of that update gets the
+    # last value the trace gives it up to that ASN
+    update = dict(
+        [(name, values[connectivity.trace_next_update]) for (name, values) in updates.items()]
+    )
+    engine.asn = int(update['asn'])
+    link = (
+        (updates['src']     == update['src']) &
+        (updates['dst']     == update['dst']) &
+        (updates['channel'] == update['channel']) &
+        (updates['asn']     <= update['asn'])
+    )
+    expected = {'pdr': updates['pdr'][link][-1]}
+    pdr = connectivity.get_pdr(
+        int(update['src']),
+        int(update['dst']),
+        int(update['channel'])
+    )
+    assert pdr == expected['pdr']
+    assert connectivity.connectivity_matrix_timestamp > engine.asn
+    assert updates['asn'][connectivity.trace_next_update - 1] <= engine.asn
+
+@pytest.mark.parametrize('cache_dir', [None, 'cache'])
+def test_k7_trace_cache(sim_engine, tmpdir, cache_dir):
+    """ verify the compiled K7 trace gives the same updates as the trace """
+
+    here = os.path.dirname(__file__)
+    trace = str(tmpdir.join('grenoble.k7.gz'))
+    shutil.copy(os.path.join(here, '..', 'traces', 'grenoble.k7.gz'), trace)
+    if cache_dir is not None:
+        # the directory of the trace may be read-only
+        cache_dir = str(tmpdir.join(cache_dir))
+        os.chmod(str(tmpdir), 0o555)
+
+    try:
+        engine = sim_engine(
+            diff_config = {
+                'exec_numMotes':        50,
+                'conn_class':           'K7',
+                'conn_trace':           trace,
+                'conn_trace_cache':     True,
+                'conn_trace_cache_dir': cache_dir,
+                'phy_numChans':         15,
+            }
+        )
+    finally:
+        os.chmod(str(tmpdir), 0o755)
+
+    # the trace has been compiled, one file per field, then memory-mapped
+    (cache_path, sidecar_path, _) = Connectivity.get_k7_cache_paths(
+        trace,
+        engine.settings.tsch_slotDuration,
+        engine.settings.phy_numChans,
+        cache_dir
+    )
+    if cache_dir is not None:
+        assert os.path.dirname(cache_path) == cache_dir
+    assert os.path.isdir(cache_path)
+    assert os.path.exists(sidecar_path)
+    expected = Connectivity.load_k7_trace(
+        trace,
+        engine.settings.tsch_slotDuration,
+        engine.settings.phy_numChans
+    )
+    updates = engine.connectivity.trace_updates
+    assert sorted(updates.keys()) == sorted(Connectivity.K7_TRACE_UPDATE_DTYPE.names)
+    for (name, values) in updates.items():
+        assert isinstance(values, numpy.memmap)
+        assert values.flags['C_CONTIGUOUS']
+        assert numpy.array_equal(values, expected[name])
+
+    # the compiled trace is reused as long as the settings are the same
+    mtime = os.path.getmtime(sidecar_path)
+    Connectivity.load_compiled_k7_trace(
+        trace,
+        engine.settings.tsch_slotDuration,
+        engine.settings.phy_numChans,
+        cache_dir
+    )
+    assert os.path.getmtime(sidecar_path) == mtime
+    assert Connectivity.get_k7_cache_paths(trace, 0.015, 15, cache_dir)[0] != cache_path
+
+#=== verify the RSSI to PDR conversion
+def test_rssi_to_pdr():
+    table = Connectivity.RSSI_PDR_TABLE
+
+    # values of the table
+    for rssi in table:
+        assert Connectivity.rssi_to_pdr(rssi) == table[rssi]
+
+    # linear interpolation between two values of the table
+    assert (
+        Connectivity.rssi_to_pdr(-93.5) ==
+        (table[-93] - table[-94]) * 0.5 + table[-94]
+    )
+
+    # out of the table
+    assert Connectivity.rssi_to_pdr(-200) == 0.0
+    assert Connectivity.rssi_to_pdr(-97.5) == 0.0
+    assert Connectivity.rssi_to_pdr(-78.5) == 1.0
+    assert Connectivity.rssi_to_pdr(0) == 1.0
 
 #=== verify propagate function doesn't raise exception
 
@@ -122,6 +286,90 @@ def test_propagate(sim_engine):
     engine.connectivity.propagate()
 
 
+#=== verify propagate() runs only at ASNs where a radio is active
+def test_propagate_only_at_active_slots(sim_engine):
+    engine = sim_engine(
+        diff_config = {
+            'exec_numMotes'           : 1,
+            'exec_numSlotframesPerRun': 10,
+        }
+    )
+    slotframe_length = engine.settings.tsch_slotframeLength
+
+    # record the ASNs at which propagate() is called
+    propagated_asns = []
+    original_propagate = engine.connectivity.propagate
+    def propagate(self):
+        propagated_asns.append(self.engine.getAsn())
+        original_propagate()
+    engine.connectivity.propagate = types.MethodType(
+        propagate,
+        engine.connectivity
+    )
+
+    u.run_until_asn(engine, slotframe_length * 5 + 1)
+
+    # the root has only the minimal cell, at slot offset 0
+    assert len(propagated_asns) > 0
+    assert [asn % slotframe_length for asn in propagated_asns] == [0] * len(propagated_asns)
+
+#=== verify the transmitters and listeners are registered per channel
+def test_active_radios(sim_engine):
+    engine = sim_engine(
+        diff_config = {
+            'exec_numMotes'           : 3,
+            'exec_numSlotframesPerRun': 100,
+            'conn_class'              : 'Linear',
+        }
+    )
+    connectivity = engine.connectivity
+
+    # a mote which stops listening is not a listener anymore, the channel is
+    # forgotten with its last radio
+    connectivity.add_listener(2, 5)
+    connectivity.add_listener(1, 5)
+    assert connectivity.listeners == {5: set([1, 2])}
+    connectivity.remove_listener(2, 5)
+    assert connectivity.listeners == {5: set([1])}
+    connectivity.remove_listener(1, 5)
+    assert connectivity.listeners == {}
+
+    # at each propagation, the radios registered are the radios on, on their
+    # channel; none is registered anymore once the frames are propagated
+    registries = []
+    original_propagate = connectivity.propagate
+    def propagate(self):
+        for (radios, state) in [
+                (self.transmitters, d.RADIO_STATE_TX),
+                (self.listeners,    d.RADIO_STATE_RX),
+            ]:
+            expected = {}
+            for mote in self.engine.motes:
+                if mote.radio.state == state:
+                    expected.setdefault(mote.radio.channel, set()).add(mote.id)
+            assert radios == expected
+        registries.append(
+            (
+                dict([(c, set(ids)) for (c, ids) in self.transmitters.items()]),
+                dict([(c, set(ids)) for (c, ids) in self.listeners.items()]),
+            )
+        )
+        original_propagate()
+        assert self.transmitters == {}
+        assert self.listeners    == {}
+        for mote in self.engine.motes:
+            assert mote.radio.state == d.RADIO_STATE_OFF
+    connectivity.propagate = types.MethodType(propagate, connectivity)
+
+    u.run_until_end(engine)
+
+    # some slots had a transmission, some had a listener receiving nothing
+    assert [t for (t, l) in registries if t]
+    assert [
+        l for (t, l) in registries
+        if [c for c in l if c not in t]
+    ]
+
 #=== test for ConnectivityRandom
 class TestRandom(object):
 
@@ -246,10 +494,75 @@ class TestRandom(object):
         assert coordinates[('SFNone', 1)] != coordinates[('SFNone', 2)]
         assert coordinates[('MSF', 1)]    != coordinates[('MSF', 2)]
 
+    def test_sparse(self, sim_engine):
+        diff_config = {
+            'exec_numMotes'          : 10,
+            'exec_randomSeed'        : 1,
+            'conn_class'             : 'Random',
+            'conn_random_square_side': 4.000,
+            'phy_numChans'           : 2,
+        }
+
+        # the neighbor lists should give the same PDR values as the full
+        # connectivity matrix, and the same RSSI values for the links which
+        # can be used (RSSI of the other links is never read by propagate())
+        links = {}
+        for conn_sparse in [False, True]:
+            diff_config['conn_sparse'] = conn_sparse
+            engine = sim_engine(
+                diff_config                                = diff_config,
+                force_initial_routing_and_scheduling_state = False,
+            )
+            links[conn_sparse] = {}
+            for src, dst in itertools.permutations(engine.motes, 2):
+                for channel in range(engine.settings.phy_numChans):
+                    pdr  = engine.connectivity.get_pdr(src.id, dst.id, channel)
+                    rssi = engine.connectivity.get_rssi(src.id, dst.id, channel)
+                    if pdr == 0:
+                        rssi = None
+                    links[conn_sparse][(src.id, dst.id, channel)] = (pdr, rssi)
+            if conn_sparse:
+                assert engine.connectivity.pdr_matrix is None
+                # only the motes which can be heard are in the neighbor lists
+                neighbors = engine.connectivity.neighbors
+                for src, dst in itertools.permutations(engine.motes, 2):
+                    pdr = links[conn_sparse][(src.id, dst.id, 0)][0]
+                    assert (src.id in neighbors[dst.id]) == (pdr > 0)
+            destroy_all_singletons(engine)
+
+        assert links[False] == links[True]
+
+#=== verify the vectorized propagation gives the same results as the scalar one
+def test_vectorized_propagation(sim_engine):
+    diff_config = {
+        'exec_numMotes'           : 10,
+        'exec_numSlotframesPerRun': 100,
+        'exec_randomSeed'         : 1,
+        'conn_class'              : 'Random',
+        'sf_class'                : 'MSF',
+    }
+
+    logs = {}
+    for conn_propagation in ['scalar', 'vectorized']:
+        diff_config['conn_propagation'] = conn_propagation
+        engine = sim_engine(diff_config=diff_config)
+        u.run_until_end(engine)
+        logs[conn_propagation] = u.read_log_file()
+        destroy_all_singletons(engine)
+
+    # some frames should have collided
+    assert [
+        log for log in logs['scalar']
+        if log['_type'] == SimLog.LOG_PROP_INTERFERENCE['type']
+    ]
+    assert logs['scalar'] == logs['vectorized']
+
 #=== test for LockOn mechanism that is implemented in propagate()
-def test_lockon(sim_engine):
+@pytest.mark.parametrize('conn_propagation', ['scalar', 'vectorized'])
+def test_lockon(sim_engine, conn_propagation):
     sim_engine = sim_engine(
         diff_config = {
+            'conn_propagation'        : conn_propagation,
             'exec_numMotes'           : 2,
             'exec_numSlotframesPerRun': 1,
             'conn_class'              : 'Linear',
@@ -60,3 +60,122 @@ def test_event_execution_order(repeat4times):
 
     # verify we got the right events
     assert stateoftest.events == ['1.1','1.2','2.0']
+
+def test_event_execution_order_same_slot(repeat4times):
+
+    # create engine
+    engine = SimEngine.DiscreteEventEngine()
+    engine.scheduleAtAsn(
+        asn             = 10,
+        cb              = engine._actionEndSim,
+        uniqueTag       = ('engine','_actionEndSim'),
+        intraSlotOrder  = 3,
+    )
+    stateoftest = StateOfTest()
+
+    # events having the same ASN and intraSlotOrder are executed in the order
+    # they are scheduled
+    engine.scheduleAtAsn(
+        asn             = 1,
+        cb              = stateoftest._cb_asn_1_2,
+        uniqueTag       = ('stateoftest','_cb_asn_1_2'),
+        intraSlotOrder  = 1,
+    )
+    engine.scheduleAtAsn(
+        asn             = 1,
+        cb              = stateoftest._cb_asn_1_1,
+        uniqueTag       = ('stateoftest','_cb_asn_1_1'),
+        intraSlotOrder  = 1,
+    )
+
+    # run engine, run until done
+    engine.start()
+    engine.join()
+
+    # verify we got the right events
+    assert stateoftest.events == ['1.2','1.1']
+
+def test_remove_future_event(repeat4times):
+
+    # create engine
+    engine = SimEngine.DiscreteEventEngine()
+    engine.scheduleAtAsn(
+        asn             = 10,
+        cb              = engine._actionEndSim,
+        uniqueTag       = ('engine','_actionEndSim'),
+        intraSlotOrder  = 3,
+    )
+    stateoftest = StateOfTest()
+
+    engine.scheduleAtAsn(
+        asn             = 1,
+        cb              = stateoftest._cb_asn_1_1,
+        uniqueTag       = ('stateoftest','_cb_asn_1_1'),
+        intraSlotOrder  = 1,
+    )
+    engine.scheduleAtAsn(
+        asn             = 2,
+        cb              = stateoftest._cb_asn_2_0,
+        uniqueTag       = ('stateoftest','_cb_asn_2_0'),
+        intraSlotOrder  = 0,
+    )
+
+    # rescheduling an event with the same uniqueTag replaces it
+    engine.scheduleAtAsn(
+        asn             = 3,
+        cb              = stateoftest._cb_asn_1_1,
+        uniqueTag       = ('stateoftest','_cb_asn_1_1'),
+        intraSlotOrder  = 1,
+    )
+
+    # a removed event is never executed
+    engine.removeFutureEvent(('stateoftest','_cb_asn_2_0'))
+
+    # run engine, run until done
+    engine.start()
+    engine.join()
+
+    # verify we got the right events
+    assert stateoftest.events == ['1.1']
+
+def test_event_stats():
+
+    # create engine
+    engine = SimEngine.DiscreteEventEngine()
+    stateoftest = StateOfTest()
+
+    # two fresh inserts, one replacement, one removal
+    engine.scheduleAtAsn(
+        asn             = 1,
+        cb              = stateoftest._cb_asn_1_1,
+        uniqueTag       = ('stateoftest','_cb_asn_1_1'),
+        intraSlotOrder  = 1,
+    )
+    engine.scheduleAtAsn(
+        asn             = 2,
+        cb              = stateoftest._cb_asn_2_0,
+        uniqueTag       = ('stateoftest','_cb_asn_2_0'),
+        intraSlotOrder  = 0,
+    )
+    engine.scheduleAtAsn(
+        asn             = 3,
+        cb              = stateoftest._cb_asn_1_1,
+        uniqueTag       = ('stateoftest','_cb_asn_1_1'),
+        intraSlotOrder  = 1,
+    )
+    engine.removeFutureEvent(('stateoftest','_cb_asn_2_0'))
+
+    # removing an event which is not scheduled changes nothing
+    engine.removeFutureEvent(('stateoftest','_cb_asn_2_0'))
+
+    # the callbacks are implemented in this module
+    layer = __name__.split('.')[-1]
+    assert engine.get_event_stats() == {
+        layer: {
+            'inserts':      2,
+            'replacements': 1,
+            'removals':     1,
+        }
+    }
+
+    engine.destroy()
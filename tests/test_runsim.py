@@ -1,16 +1,236 @@
+import glob
+import json
+import multiprocessing
 import os
+import shutil
 import subprocess
 
+import pytest
+
+import test_utils as u
+from SimEngine import SimLog
+
 #============================ helpers =========================================
 
+def run_sim_in_log_dir(tmpdir, config, taskKeysDone=None):
+    # runs a sweep in the log directory named after tmpdir, resuming it after
+    # the runs of taskKeysDone; returns the path of the log directory
+    log_dir = os.path.join('bin', 'simData', tmpdir.basename)
+    shutil.rmtree(log_dir, ignore_errors=True)
+    os.makedirs(log_dir)
+    with open(os.path.join(log_dir, 'config.json'), 'w') as f:
+        json.dump(config, f)
+    if taskKeysDone is not None:
+        with open(os.path.join(log_dir, 'manifest.json'), 'w') as f:
+            json.dump(taskKeysDone, f)
+
+    wd = os.getcwd()
+    os.chdir("bin/")
+    rc = subprocess.call(
+        "python runSim.py --resume simData/{0}".format(tmpdir.basename),
+        shell=True,
+    )
+    os.chdir(wd)
+    assert rc==0
+    return log_dir
+
+def get_adaptive_config(numCPUs, minRuns, maxRuns, randomSeed):
+    with open(u.CONFIG_FILE_PATH, 'r') as f:
+        config = json.load(f)
+    config['execution']['numCPUs']      = numCPUs
+    config['execution']['adaptiveRuns'] = {
+        'minRuns':    minRuns,
+        'maxRuns':    maxRuns,
+        'confidence': 0.95,
+        'tolerances': {'upstream_reliability': 0.01, 'lifetime_AA_years': 0.1},
+    }
+    config['settings']['regular']['exec_randomSeed']          = randomSeed
+    config['settings']['regular']['exec_numSlotframesPerRun'] = 100
+    config['post']                                            = []
+    return config
+
+def read_manifest(log_dir):
+    with open(os.path.join(log_dir, 'manifest.json'), 'r') as f:
+        return json.load(f)
+
+def read_run_ids(log_dir):
+    # the run_ids of the merged log file
+    (log_file_path, ) = glob.glob(os.path.join(log_dir, '*.dat'))
+    with open(log_file_path, 'rb') as f:
+        return [log['_run_id'] for log in SimLog.read_logs(f, types=['config'])]
+
 #============================ tests ===========================================
 
-def test_runSim():
+@pytest.mark.parametrize('log_format, log_compression', [
+    ('json',   None),
+    ('binary', None),
+    ('json',   'gzip'),
+])
+def test_runSim(tmpdir, log_format, log_compression):
+    # default configuration, with the log format under test
+    with open(u.CONFIG_FILE_PATH, 'r') as f:
+        config = json.load(f)
+    config['settings']['regular']['log_format']      = log_format
+    config['settings']['regular']['log_compression'] = log_compression
+    config_file = tmpdir.join('config.json')
+    config_file.write(json.dumps(config))
+
     wd = os.getcwd()
     os.chdir("bin/")
     rc = subprocess.call(
-        "python runSim.py",
+        "python runSim.py --config {0}".format(config_file),
+        shell=True,
+    )
+    # the KPIs of the runs are computed by several processes
+    rc_kpis = subprocess.call(
+        "python compute_kpis.py --cpus 2",
         shell=True,
     )
     os.chdir(wd)
     assert rc==0
+    assert rc_kpis==0
+
+def test_runSim_resume():
+    # an interrupted sweep: run 0 is done, run 1 has been partially written
+    with open(u.CONFIG_FILE_PATH, 'r') as f:
+        config = json.load(f)
+    config['execution']['numCPUs'] = 1
+    config['execution']['numRuns'] = 2
+    config['settings']['regular']['exec_numSlotframesPerRun'] = 10
+    config['post'] = []
+    combination = dict(
+        [(k, v[0]) for (k, v) in config['settings']['combination'].items()]
+    )
+    subfolder   = '_'.join(['{0}_{1}'.format(k, v) for (k, v) in combination.items()])
+
+    log_dir = os.path.join('bin', 'simData', 'test_runSim_resume')
+    shutil.rmtree(log_dir, ignore_errors=True)
+    os.makedirs(os.path.join(log_dir, subfolder))
+    with open(os.path.join(log_dir, 'config.json'), 'w') as f:
+        json.dump(config, f)
+    with open(os.path.join(log_dir, 'manifest.json'), 'w') as f:
+        json.dump([{'combination': combination, 'run_id': 0}], f)
+    with open(os.path.join(log_dir, subfolder, 'output_run0.dat'), 'w') as f:
+        f.write(json.dumps({'_type': 'config', '_run_id': 0}) + '\n')
+    with open(os.path.join(log_dir, subfolder, 'output_run1.dat'), 'w') as f:
+        f.write('{"_type": "partial')
+
+    wd = os.getcwd()
+    os.chdir("bin/")
+    rc = subprocess.call(
+        "python runSim.py --resume simData/test_runSim_resume",
+        shell=True,
+    )
+    os.chdir(wd)
+    assert rc==0
+
+    # run 1 has been run again, run 0 has not
+    with open(os.path.join(log_dir, subfolder + '.dat'), 'rb') as f:
+        logs = list(SimLog.read_logs(f, types=['config']))
+    assert [log['_run_id'] for log in logs] == [0, 1]
+    assert 'exec_numMotes' not in logs[0]
+    assert 'exec_numMotes' in logs[1]
+    with open(os.path.join(log_dir, 'manifest.json'), 'r') as f:
+        assert sorted([key['run_id'] for key in json.load(f)]) == [0, 1]
+    shutil.rmtree(log_dir)
+
+def test_runSim_result_cache(tmpdir):
+    result_cache = tmpdir.join('result_cache')
+    with open(u.CONFIG_FILE_PATH, 'r') as f:
+        config = json.load(f)
+    config['execution']['numCPUs']                            = 1
+    config['execution']['resultCache']                        = str(result_cache)
+    config['settings']['regular']['exec_randomSeed']          = 1
+    config['settings']['regular']['exec_numSlotframesPerRun'] = 10
+    config['post']                                            = []
+    config_file = tmpdir.join('config.json')
+    config_file.write(json.dumps(config))
+
+    def run_sim():
+        wd = os.getcwd()
+        os.chdir("bin/")
+        rc = subprocess.call(
+            "python runSim.py --config {0}".format(config_file),
+            shell=True,
+        )
+        os.chdir(wd)
+        assert rc==0
+
+        # the merged log file of the latest log directory
+        log_dir = max(
+            glob.glob(os.path.join('bin', 'simData', '*')),
+            key=os.path.getmtime
+        )
+        (log_file_path, ) = glob.glob(os.path.join(log_dir, '*.dat'))
+        with open(log_file_path, 'rb') as f:
+            return [log for log in SimLog.read_logs(f) if log['_type'] != 'config']
+
+    # the result of the run is stored in the cache
+    logs = run_sim()
+    (result_path, ) = result_cache.listdir()
+    assert result_path.join('output.dat').check()
+
+    # the run is not run again, its output is taken from the cache
+    result_path.join('output.dat').write(
+        json.dumps({'_type': 'cached', '_asn': 0, '_run_id': 0}) + '\n',
+        mode='a'
+    )
+    assert run_sim() == logs + [{'_type': 'cached', '_asn': 0, '_run_id': 0}]
+
+    # the files of the cache are copies, not links to the output files
+    assert result_path.join('output.dat').stat().nlink == 1
+
+def test_runSim_adaptive_runs(tmpdir):
+    # runs with the same random seed have the same KPIs, their confidence
+    # intervals have no width
+    config  = get_adaptive_config(numCPUs=1, minRuns=2, maxRuns=4, randomSeed=1)
+    log_dir = run_sim_in_log_dir(tmpdir, config)
+
+    # the combination is not run more than minRuns times
+    taskKeys = read_manifest(log_dir)
+    assert sorted([taskKey['run_id'] for taskKey in taskKeys]) == [0, 1]
+    assert taskKeys[0]['kpis'] == taskKeys[1]['kpis']
+    assert sorted(taskKeys[0]['kpis'].keys()) == ['lifetime_AA_years', 'upstream_reliability']
+    assert read_run_ids(log_dir) == [0, 1]
+    shutil.rmtree(log_dir)
+
+@pytest.mark.parametrize('numCPUs', [
+    1,
+    pytest.param(
+        2,
+        marks=pytest.mark.skipif(
+            multiprocessing.cpu_count() < 2,
+            reason='needs 2 CPUs'
+        )
+    ),
+])
+def test_runSim_adaptive_runs_max(tmpdir, numCPUs):
+    # runs with random seeds have different lifetimes, whose confidence
+    # interval is wider than its tolerance
+    config  = get_adaptive_config(numCPUs=numCPUs, minRuns=2, maxRuns=4, randomSeed='random')
+    log_dir = run_sim_in_log_dir(tmpdir, config)
+
+    # the combination is run more than minRuns times, up to maxRuns times
+    taskKeys = read_manifest(log_dir)
+    assert sorted([taskKey['run_id'] for taskKey in taskKeys]) == [0, 1, 2, 3]
+    assert len(set([taskKey['kpis']['lifetime_AA_years'] for taskKey in taskKeys])) > 1
+    assert read_run_ids(log_dir) == [0, 1, 2, 3]
+    shutil.rmtree(log_dir)
+
+def test_runSim_adaptive_runs_resume(tmpdir):
+    # a sweep resumed with adaptiveRuns, after a run recorded without KPIs
+    config   = get_adaptive_config(numCPUs=1, minRuns=2, maxRuns=2, randomSeed=1)
+    (combination, ) = [
+        dict([(k, v[0]) for (k, v) in config['settings']['combination'].items()])
+    ]
+    log_dir  = run_sim_in_log_dir(
+        tmpdir,
+        config,
+        taskKeysDone=[{'combination': combination, 'run_id': 0}]
+    )
+
+    # the run is done again
+    taskKeys = [taskKey for taskKey in read_manifest(log_dir) if 'kpis' in taskKey]
+    assert sorted([taskKey['run_id'] for taskKey in taskKeys]) == [0, 1]
+    assert read_run_ids(log_dir) == [0, 1]
+    shutil.rmtree(log_dir)
@@ -0,0 +1,264 @@
+"""
+Tests for SimEngine.SimLog
+"""
+import json
+import StringIO
+
+import pytest
+
+import test_utils as u
+from SimEngine import SimLog
+
+#============================ helpers =========================================
+
+LOG_TEST = {'type': 'test', 'keys': ['_mote_id', 'value']}
+
+def read_output_file(sim_engine):
+    with open(sim_engine.settings.getOutputFile(), 'rb') as f:
+        return list(SimLog.read_logs(f))
+
+#============================ tests ===========================================
+
+@pytest.fixture(params=[SimLog.LOG_FORMAT_JSON, SimLog.LOG_FORMAT_BINARY])
+def log_format(request):
+    return request.param
+
+def test_flush(sim_engine, log_format):
+    sim_engine = sim_engine(diff_config={'log_format': log_format})
+    sim_log    = SimLog.SimLog()
+
+    # log more lines than a batch of the writer thread
+    num_lines = SimLog.LOG_BATCH_SIZE + 10
+    for i in range(num_lines):
+        sim_log.log(LOG_TEST, {'_mote_id': 0, 'value': i})
+
+    # all the lines are in the file once flushed, in order
+    sim_log.flush()
+    logs = [log for log in read_output_file(sim_engine) if log['_type'] == 'test']
+    assert [log['value'] for log in logs] == range(num_lines)
+
+    # the content is serialized when logged
+    content = {'_mote_id': 0, 'value': 'before'}
+    sim_log.log(LOG_TEST, content)
+    content['value'] = 'after'
+    sim_log.flush()
+    assert read_output_file(sim_engine)[-1]['value'] == 'before'
+
+def test_destroy(sim_engine, log_format):
+    sim_engine = sim_engine(diff_config={'log_format': log_format})
+    sim_log    = SimLog.SimLog()
+
+    sim_log.log(LOG_TEST, {'_mote_id': 0, 'value': 0})
+
+    # destroy() writes the pending lines, and stops the writer thread
+    writer_thread = sim_log.writer_thread
+    sim_log.destroy()
+    assert not writer_thread.is_alive()
+    assert read_output_file(sim_engine)[-1]['_type'] == 'test'
+
+def test_compression(sim_engine, log_format):
+    sim_engine = sim_engine(
+        diff_config = {
+            'log_format':      log_format,
+            'log_compression': SimLog.LOG_COMPRESSION_GZIP,
+        }
+    )
+    sim_log    = SimLog.SimLog()
+    file_path  = sim_engine.settings.getOutputFile()
+
+    sim_log.log(LOG_TEST, {'_mote_id': 0, 'value': 0})
+    sim_log.destroy()
+
+    # a second run appends a gzip member to the same file
+    sim_log = SimLog.SimLog()
+    sim_log.set_simengine(sim_engine)
+    sim_log.set_log_filters('all')
+    sim_log.log(LOG_TEST, {'_mote_id': 0, 'value': 1})
+    sim_log.destroy()
+
+    with open(file_path, 'rb') as f:
+        assert f.read(len(SimLog.GZIP_MAGIC)) == SimLog.GZIP_MAGIC
+    with open(file_path, 'rb') as f:
+        logs = list(SimLog.read_logs(f, types=['config', 'test']))
+    assert [log['_type'] for log in logs] == ['config', 'test', 'config', 'test']
+    assert [log['value'] for log in logs if log['_type'] == 'test'] == [0, 1]
+
+def test_columnar(sim_engine):
+    sim_engine = sim_engine(diff_config={'log_columnar': True})
+    sim_log    = SimLog.SimLog()
+
+    packet = {
+        'type': 'DATA',
+        'net':  {'srcIp': 'fd00::1:1', 'dstIp': 'fd00::1:0', 'packet_length': 90},
+        'app':  {'appcounter': 3},
+    }
+    sim_log.log(SimLog.LOG_APP_TX, {'_mote_id': 1, 'packet': packet})
+    sim_log.log(SimLog.LOG_BATT_CHARGE, {'_mote_id': 1, 'charge': 0.5})
+    sim_log.log(SimLog.LOG_BATT_CHARGE, {'_mote_id': 2, 'charge': 1.5})
+    sim_log.flush()
+
+    def read_columnar_file(log_type):
+        return SimLog.read_columnar_file(
+            SimLog.get_columnar_file_path(
+                sim_engine.settings.getOutputFile(),
+                log_type
+            )
+        )
+
+    # the fields of the logs are in their columns, missing fields are -1 or ''
+    rows = read_columnar_file(SimLog.LOG_APP_TX['type'])
+    assert len(rows) == 1
+    assert rows['_mote_id'][0]              == 1
+    assert rows['packet.net.srcIp'][0]      == 'fd00::1:1'
+    assert rows['packet.app.appcounter'][0] == 3
+    assert rows['packet.net.hop_limit'][0]  == -1
+    assert rows['packet.mac.srcMac'][0]     == ''
+
+    rows = read_columnar_file(SimLog.LOG_BATT_CHARGE['type'])
+    assert list(rows['_mote_id']) == [1, 2]
+    assert list(rows['charge'])   == [0.5, 1.5]
+
+    # the columnar files of the other types are empty
+    assert len(read_columnar_file(SimLog.LOG_TSCH_TXDONE['type'])) == 0
+
+def test_binary_format():
+    logs = [
+        {'_type': 'config', '_run_id': 0, 'exec_numMotes': 2},
+        {
+            '_type':    'app.tx',
+            '_asn':     300,
+            '_mote_id': 1,
+            'packet':   {
+                'mac':  {'srcMac': 'ab:cd', 'dstMac': None, 'retriesLeft': -1},
+                'app':  {'rank': 256.5, 'path': [1, 2], 'ack': True},
+                'seed': 7263092949079992026,
+            },
+        },
+        {'_type': 'app.tx', '_asn': 301, '_mote_id': 1, 'packet': u'\xe9'},
+        {'_type': 'batt.charge', '_asn': 302, '_mote_id': 0, 'charge': 0.1},
+    ]
+
+    # two runs written one after the other, as in a log file
+    encoder = SimLog.BinaryLogEncoder()
+    data    = ''.join([encoder.encode(log) for log in logs * 2])
+    assert data.startswith(SimLog.BINARY_LOG_MAGIC)
+
+    # logs read back are the same as JSON would give
+    expected = [json.loads(json.dumps(log)) for log in logs * 2]
+    assert list(SimLog.read_logs(StringIO.StringIO(data))) == expected
+
+    # logs can be filtered by type
+    assert (
+        list(SimLog.read_logs(StringIO.StringIO(data), types=['batt.charge'])) ==
+        [log for log in expected if log['_type'] == 'batt.charge']
+    )
+
+@pytest.mark.parametrize('log_strict', [False, True])
+def test_log_strict(sim_engine, log_strict):
+    sim_engine = sim_engine(diff_config={'log_strict': log_strict})
+    sim_log    = SimLog.SimLog()
+
+    # keys are validated in strict mode only
+    if log_strict:
+        with pytest.raises(Exception):
+            sim_log.log(LOG_TEST, {'_mote_id': 0})
+    else:
+        sim_log.log(LOG_TEST, {'_mote_id': 0})
+        sim_log.flush()
+        assert read_output_file(sim_engine)[-1]['_type'] == 'test'
+
+def test_log_filters(sim_engine):
+    sim_engine = sim_engine()
+    sim_log    = SimLog.SimLog()
+
+    # logs of types which are filtered out are not written
+    sim_log.set_log_filters([LOG_TEST['type']])
+    sim_log.log(SimLog.LOG_BATT_CHARGE, {'_mote_id': 0, 'charge': 0.1})
+    sim_log.log(LOG_TEST, {'_mote_id': 0, 'value': 0})
+    sim_log.flush()
+    assert read_output_file(sim_engine)[-1]['_type'] == 'test'
+
+    # filters can be changed during the simulation
+    sim_log.set_log_filters([SimLog.LOG_BATT_CHARGE['type']])
+    sim_log.log(SimLog.LOG_BATT_CHARGE, {'_mote_id': 0, 'charge': 0.1})
+    sim_log.log(LOG_TEST, {'_mote_id': 0, 'value': 1})
+    sim_log.flush()
+    assert read_output_file(sim_engine)[-1]['_type'] == 'batt.charge'
+
+def test_log_policies(sim_engine):
+    sim_engine = sim_engine()
+    sim_log    = SimLog.SimLog()
+
+    log_policies = {
+        'default':                          'off',
+        LOG_TEST['type']:                   {'sample': 3},
+        SimLog.LOG_BATT_CHARGE['type']:     {'window_s': 1},
+        SimLog.LOG_PACKET_DROPPED['type']:  'all',
+    }
+    sim_log.set_log_filters(log_policies)
+    window_length = int(1 / sim_engine.settings.tsch_slotDuration)
+
+    for i in range(7):
+        sim_log.log(LOG_TEST, {'_mote_id': 0, 'value': i})
+        sim_log.log(SimLog.LOG_TSCH_RXDONE, {'_mote_id': 0, 'packet': {}})
+    sim_log.log(SimLog.LOG_BATT_CHARGE, {'_mote_id': 1, 'charge': 0.1})
+    sim_log.log(SimLog.LOG_BATT_CHARGE, {'_mote_id': 1, 'charge': 0.2})
+    sim_log.log(SimLog.LOG_BATT_CHARGE, {'_mote_id': 2, 'charge': 0.2})
+    u.run_until_asn(sim_engine, window_length)
+    sim_log.log(SimLog.LOG_BATT_CHARGE, {'_mote_id': 1, 'charge': 0.3})
+    sim_log.log(SimLog.LOG_PACKET_DROPPED, {'_mote_id': 1, 'packet': {}, 'reason': 'test'})
+
+    # the pending window is written when the run ends
+    sim_log.destroy()
+    logs = read_output_file(sim_engine)
+
+    # 1 log in 3 is written, the ones which are off are not
+    assert [log['value'] for log in logs if log['_type'] == LOG_TEST['type']] == [0, 3, 6]
+    assert not [log for log in logs if log['_type'] == SimLog.LOG_TSCH_RXDONE['type']]
+    assert len([log for log in logs if log['_type'] == SimLog.LOG_PACKET_DROPPED['type']]) == 1
+
+    # logs are counted per mote, per window
+    counters = [
+        (log['log_type'], log['window_start_asn'], log['counts'])
+        for log in logs if log['_type'] == SimLog.LOG_SIMLOG_COUNTERS['type']
+    ]
+    assert counters == [
+        (SimLog.LOG_BATT_CHARGE['type'], 0,             [[1, 2], [2, 1]]),
+        (SimLog.LOG_BATT_CHARGE['type'], window_length, [[1, 1]]),
+    ]
+
+    # the policies of a run are recorded in its config line
+    sim_log = SimLog.SimLog()
+    sim_log.set_log_filters(log_policies)
+    sim_log.destroy()
+    config_line = read_output_file(sim_engine)[-1]
+    assert config_line['_type'] == 'config'
+    assert config_line['_log_policies'] == log_policies
+    assert SimLog.get_log_sampling(config_line, LOG_TEST['type']) == 3
+    assert SimLog.get_log_sampling(config_line, SimLog.LOG_PACKET_DROPPED['type']) == 1
+
+@pytest.mark.parametrize('policy', [
+    {'sample': 0},
+    {'sample': 2.5},
+    {'sample': True},
+    {'window_s': 0},
+    {'window_s': '1'},
+    {'window_s': True},
+    {'sample': 2, 'window_s': 1},
+    'some',
+])
+def test_log_policy_not_supported(policy):
+    with pytest.raises(NotImplementedError):
+        SimLog.get_log_policy({LOG_TEST['type']: policy}, LOG_TEST['type'])
+
+def test_is_enabled(sim_engine):
+    sim_engine = sim_engine()
+    sim_log    = SimLog.SimLog()
+
+    assert sim_log.is_enabled(LOG_TEST)
+    assert sim_log.is_enabled(SimLog.LOG_TSCH_RXDONE)
+
+    sim_log.set_log_filters([SimLog.LOG_TSCH_RXDONE['type']])
+    assert not sim_log.is_enabled(LOG_TEST)
+    assert sim_log.is_enabled(SimLog.LOG_TSCH_RXDONE)
+    assert not sim_log.is_enabled(SimLog.LOG_TSCH_TXDONE)
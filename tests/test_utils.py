@@ -1,6 +1,5 @@
 """Provides helper functions for tests
 """
-import json
 import os
 import time
 import types
@@ -100,11 +99,11 @@ def read_log_file(filter=[], after_asn=0):
     """
     sim_settings = SimEngine.SimSettings.SimSettings()
     logs = []
-    with open(sim_settings.getOutputFile(), 'r') as f:
+    with open(sim_settings.getOutputFile(), 'rb') as f:
+        loglines = SimEngine.SimLog.read_logs(f)
         # discard the first line, that contains configuration
-        f.readline()
-        for line in f:
-            log = json.loads(line)
+        next(loglines)
+        for log in loglines:
             if (log["_asn"] >= after_asn) and ((len(filter) == 0) or (log['_type'] in filter)):
                 logs.append(log)
 